@@ -17,5 +17,17 @@ CREATE TABLE users (
     paidAmount DECIMAL(10, 2) NULL,
     joinDate DATE NULL DEFAULT (CURDATE()),
     startDate DATE NULL DEFAULT (CURDATE()),
-    endDate DATE NULL
+    endDate DATE NULL,
+    primaryEmailNorm VARCHAR(100) GENERATED ALWAYS AS (LOWER(TRIM(primaryEmail))) STORED,
+    serverNorm VARCHAR(25) GENERATED ALWAYS AS (LOWER(TRIM(server))) STORED,
+    INDEX idx_users_server_email (serverNorm, primaryEmailNorm),
+    INDEX idx_users_status_server (status, server),
+    INDEX idx_users_status_enddate (status, endDate)
+);
+
+-- Applied schema migrations (harassarr upgrades existing databases automatically)
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INT NOT NULL PRIMARY KEY,
+    description VARCHAR(255) NULL,
+    appliedAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
 );
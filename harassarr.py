@@ -10,7 +10,6 @@ import time
 from datetime import datetime, timedelta
 
 import discord
-import mysql.connector
 import schedule
 
 from modules import (
@@ -20,11 +19,31 @@ from modules import (
     validateFunctions,
     emailFunctions,
     discordFunctions,
+    db_pool,
+    db_backend,
+    plex_roster,
+    plex_fetch,
+    plex_registry,
+    plex_removals,
+    plex_shares,
+    discord_session,
+    discord_guild,
+    discord_dispatch,
+    discord_roles,
+    discord_state,
 )
+from modules import snapshot as run_snapshot
+from modules.log_summary import log_run_summary
+from modules.roster_snapshot import RosterSnapshot
+from modules.user_index import UserIndex, email_recipients, discord_recipients
 
 
 CONFIG_FILE = os.getenv("HARASSARR_CONFIG", "/config/config.yml")
 LOG_FILE = os.getenv("HARASSARR_LOG", "/config/harassarr.log")
+ROSTER_SNAPSHOT = os.getenv("HARASSARR_ROSTER_SNAPSHOT", "/config/plex_roster.json")
+FULL_AUDIT_DAYS = 7  # re-check every Plex user against the DB at least this often
+DISCORD_STATE = os.getenv("HARASSARR_DISCORD_STATE", "/config/discord_state.db")
+REMINDER_WINDOW_DAYS = 8  # remind users with fewer than this many days left
 
 # ----- logging -----
 if not os.path.exists(LOG_FILE):
@@ -91,118 +110,193 @@ def _extract_prices_from_cfg(full_cfg: dict, server_name: str, fourk_flag: str):
 
 # ========= Discord role audit (HTTP-only; no gateway) =========
 
-async def _ids_with_role_async(token: str, guild_id: int, role_name: str, ids_to_check: set[str]) -> set[str]:
+async def _members_with_role_on(client: discord.Client, guild_id: int, role: discord_guild.RoleRef,
+                                ids_to_check: set[str]) -> dict[str, discord.Member]:
+    """
+    REST only (the run's guild metadata, then fetch_member) on an already logged-in client.
+    Returns the fetched Member of every ID holding the role, so removals can reuse it.
+    """
+    have = {}
+    meta = await discord_guild.guild_meta(client, guild_id)
+    target = meta.role_id(role)
+    if target is None:
+        logging.warning("Discord: role '%s' not found in guild %s", role, guild_id)
+        return have
+
+    for sid in ids_to_check:
+        try:
+            m = await meta.guild.fetch_member(int(sid))
+        except Exception:
+            m = None
+        if m and any(rr.id == target for rr in m.roles):
+            have[sid] = m
+    return have
+
+async def _members_with_role_async(token: str, guild_id: int, role: discord_guild.RoleRef,
+                                   ids_to_check: set[str]) -> dict[str, discord.Member]:
     """
     HTTP-only: login, use REST (fetch_guild, fetch_roles, fetch_member), close; no gateway.
     """
     intents = discord.Intents.none()
     client = discord.Client(intents=intents)
-    have = set()
     try:
         await client.login(token)
-
-        guild = await client.fetch_guild(guild_id)
-        if not guild:
-            logging.error("Discord: bot not in guild %s", guild_id)
-            return have
-
-        roles = await guild.fetch_roles()
-        target = next((r for r in roles if r.name.lower() == role_name.lower()), None)
-        if not target:
-            logging.warning("Discord: role '%s' not found in guild %s", role_name, guild_id)
-            return have
-
-        for sid in ids_to_check:
-            try:
-                m = await guild.fetch_member(int(sid))
-            except Exception:
-                m = None
-            if m and any(rr.id == target.id for rr in m.roles):
-                have.add(sid)
-        return have
+        return await _members_with_role_on(client, guild_id, role, ids_to_check)
     finally:
         try:
             await client.close()
         except Exception:
             pass
 
-def _ids_with_role(config_path: str, role_name: str, ids: list[str]) -> set[str]:
+def _members_with_role(config_path: str, role: discord_guild.RoleRef, ids: list[str]) -> dict:
+    """
+    Which of `ids` hold `role`, as {id: Member}. The Member is None when it can't be reused
+    for removals (it came from a client that is already closed).
+    """
     cfg = configFunctions.getConfig(config_path)
     dcfg = cfg.get("discord", {})
     token = dcfg.get("token")
     guild_id = dcfg.get("guildId")
     if not token or not guild_id:
         logging.error("Discord token/guildId missing; cannot verify roles.")
-        return set()
+        return {}
     try:
         gid = int(guild_id)
     except Exception:
         logging.error("Discord guildId must be an integer; got %r", guild_id)
-        return set()
+        return {}
     ids_set = {str(i) for i in ids if i}
     if not ids_set:
-        return set()
+        return {}
+    # One paged member list answers every PLEX- block's audit
+    role_map = discord_guild.role_map_for(token, gid)
+    if role_map is not None:
+        return {sid: role_map.member(sid) for sid in role_map.ids_with_role(role, ids_set)}
+    # Reuse the run's logged-in Discord session when there is one
+    session = discord_session.active_session(token)
+    if session is not None:
+        return session.submit(lambda client: _members_with_role_on(client, gid, role, ids_set))
     try:
-        return asyncio.run(_ids_with_role_async(token, gid, role_name, ids_set))
+        found = asyncio.run(_members_with_role_async(token, gid, role, ids_set))
     except RuntimeError:
         loop = asyncio.new_event_loop()
         try:
             asyncio.set_event_loop(loop)
-            return loop.run_until_complete(_ids_with_role_async(token, gid, role_name, ids_set))
+            found = loop.run_until_complete(_members_with_role_async(token, gid, role, ids_set))
         finally:
             loop.close()
+    return dict.fromkeys(found)
 
 # ========= Checks =========
 
+def _flush_status_updates(config_path: str, pending: list, warn_unchanged: bool = True) -> None:
+    """Apply the status transitions collected during a check in one DB transaction."""
+    if not pending:
+        return
+    result = dbFunctions.updateUserStatuses(config_path, pending)
+    if result is None:
+        logging.error("Failed to apply %d pending status update(s).", len(pending))
+        return
+    for (server, email, status) in pending:
+        if warn_unchanged and not result.get((server, email)):
+            logging.warning("Status update to '%s' for %s on %s changed no rows (already set or no DB match).",
+                            status, email, server)
+
+def _execute_removals(config_path: str, cfg: dict, removals: list, dryrun: bool,
+                      statusUpdates: list | None = None) -> list:
+    """
+    Revoke all collected Plex shares through the rate-limited executor, then run the
+    DB/notification follow-up for every share that is actually gone. Failed removals are
+    left untouched so the next run retries them.
+    """
+    if not removals:
+        return []
+    results = plex_removals.remove_all(removals, dryrun=dryrun, **plex_removals.settings_from(cfg.get("plex")))
+    logging.info("Plex removal results:\n%s", plex_removals.format_results(results))
+    run_log = run_snapshot.active_log()
+    for res in results:
+        r = res.removal
+        if run_log is not None:
+            run_log.add(email=r.email, server=r.serverName, removed_from_plex=res.outcome == "removed")
+        if not res.ok:
+            logging.error("Skipping DB/notification follow-up for '%s' on '%s': share still present.",
+                          r.email, r.serverName)
+            continue
+        try:
+            plexFunctions.removePlexUser(config_path, r.serverName, r.email, dryrun=dryrun, userIndex=r.userIndex,
+                                         statusUpdates=statusUpdates, shareRemoved=True)
+        except Exception as e:
+            logging.error("Error finishing removal of '%s' from Plex '%s': %s", r.email, r.serverName, e)
+    return results
+
 def checkInactiveUsersOnDiscord(config_path, dryrun):
     try:
         cfg = configFunctions.getConfig(config_path)
         dbConf = cfg["database"]
         plexConfs = [cfg[k] for k in cfg if str(k).startswith("PLEX-")]
+        revocations = []
+        members = {}  # member id -> Member fetched during the audit
 
         for pc in plexConfs:
             server = pc.get("serverName")
-            role_name = pc.get("role")
-            if not server or not role_name:
-                logging.warning("Discord audit: missing serverName/role in PLEX block; skipping.")
+            role = discord_guild.role_ref(pc)
+            if not server or not role:
+                logging.warning("Discord audit: missing serverName/role (or roleId) in PLEX block; skipping.")
                 continue
 
-            inactive = dbFunctions.getUsersByStatus(
-                user=dbConf["user"], password=dbConf["password"], host=dbConf["host"],
-                database=dbConf["database"], status="Inactive", serverName=server
-            )
-            active = dbFunctions.getUsersByStatus(
-                user=dbConf["user"], password=dbConf["password"], host=dbConf["host"],
-                database=dbConf["database"], status="Active", serverName=server
-            )
-
-            active_ids = { _norm(u.get("primaryDiscordId")) for u in active if u.get("primaryDiscordId") } | \
-                         { _norm(u.get("secondaryDiscordId")) for u in active if u.get("secondaryDiscordId") }
-
+            # Stream only the two ID columns; keep just the (small) sets we need
+            id_cols = ("primaryDiscordId", "secondaryDiscordId")
+            active_ids = set()
             candidates = []
-            for u in inactive:
-                for key in ("primaryDiscordId","secondaryDiscordId"):
-                    did = _norm(u.get(key))
-                    if did and did not in active_ids:
-                        candidates.append(did)
+            try:
+                for row in dbFunctions.iterUsers(
+                    user=dbConf.get("user"), password=dbConf.get("password"), host=dbConf.get("host"),
+                    database=dbConf.get("database"), columns=id_cols, status="Active", serverName=server
+                ):
+                    active_ids.update(_norm(did) for did in row if did)
+
+                for row in dbFunctions.iterUsers(
+                    user=dbConf.get("user"), password=dbConf.get("password"), host=dbConf.get("host"),
+                    database=dbConf.get("database"), columns=id_cols, status="Inactive", serverName=server
+                ):
+                    for did in map(_norm, row):
+                        if did and did not in active_ids:
+                            candidates.append(did)
+            except dbFunctions.DB_ERRORS:
+                # Without the full Active set an active subscriber could lose their role
+                logging.error("Discord audit '%s': could not read users from the database; skipping revocations.", server)
+                continue
 
             if not candidates:
                 logging.info("Discord audit '%s': no inactive users with Discord IDs to check.", server)
                 continue
 
-            still_has = _ids_with_role(config_path, role_name, candidates)
+            still_has = _members_with_role(config_path, role, candidates)
             logging.info("Discord audit '%s': candidates=%d, still_has_role=%d", server, len(candidates), len(still_has))
 
-            for did in still_has:
-                try:
-                    discordFunctions.removeRole(config_path, did, role_name, dryrun=dryrun)
-                except Exception as e:
-                    logging.error("Failed to remove Discord role '%s' from %s: %s", role_name, did, e)
+            revocations.extend(discord_roles.RoleRevocation(did, role, server) for did in sorted(still_has))
+            members.update((did, m) for did, m in still_has.items() if m is not None)
+
+        # Every server's removals in one session; roles resolved once, audited members reused
+        results = discordFunctions.removeRoles(config_path, revocations, dryrun=dryrun, members=members)
+        if results:
+            logging.info("Discord role removal results:\n%s", discord_roles.format_results(results))
+        run_log = run_snapshot.active_log()
+        if run_log is not None:
+            for res in results:
+                run_log.add(user_id=res.revocation.member_id, server=res.revocation.server,
+                            removed_from_discord=res.outcome == "removed")
 
     except Exception as e:
         logging.error("Error in checkInactiveUsersOnDiscord: %s", e)
 
-def _actionable_plex_users(pc: dict, purpose: str) -> list[dict]:
+def _actionable_plex_users(pc: dict, purpose: str):
+    """Lazy stream of the server's actionable PlexUser records."""
+    # Use the run's parallel fetch when there is one; never audit a server we couldn't read
+    fetched = plex_fetch.result_for(pc["serverName"])
+    if fetched is not None and not fetched.ok:
+        logging.error("Skipping %s for '%s': Plex fetch failed (%s).", purpose, pc["serverName"], fetched.error)
+        return iter(())
     return plexFunctions.actionable_from_plex(
         baseUrl=pc["baseUrl"],
         token=pc["token"],
@@ -210,40 +304,73 @@ def _actionable_plex_users(pc: dict, purpose: str) -> list[dict]:
         standardLibraries=pc.get("standardLibraries", []),
         optionalLibraries=pc.get("optionalLibraries", []),
         purpose=purpose,
+        users=fetched.users if fetched is not None else None,
+        snapshot=run_snapshot.active_log(),
     )
 
-def checkPlexUsersNotInDatabase(config_path, dryrun):
+def checkPlexUsersNotInDatabase(config_path, dryrun, fullAudit=False):
+    """
+    Remove Plex users with no DB row on that server.
+    Only users added or changed since the last run's roster snapshot are looked up, unless a
+    full audit is forced (--full-audit) or due (plex.fullAuditDays, default 7).
+    """
     try:
         cfg = configFunctions.getConfig(config_path)
         dbConf = cfg["database"]
         plexConfs = [cfg[k] for k in cfg if str(k).startswith("PLEX-")]
+        everyDays = int((cfg.get("plex") or {}).get("fullAuditDays", FULL_AUDIT_DAYS))
+        snapshot = RosterSnapshot.load(ROSTER_SNAPSHOT)
+
+        # Everyone flagged below is, by construction, absent from the DB
+        not_in_db = UserIndex([])
+        removals = []
+        audited = []  # (server, roster diff, emails flagged missing, was a full audit)
 
         for pc in plexConfs:
             server_cfg_name = pc["serverName"]
-            plex_users = _actionable_plex_users(pc, purpose="DB presence audit")
-
-            for pu in plex_users:
-                email = pu.get("Email")
-                server_from_plex = pu.get("Server")
-                if not email or not server_from_plex:
-                    continue
-
-                in_db = dbFunctions.userExists(
-                    user=dbConf["user"], password=dbConf["password"],
-                    server=dbConf["host"], database=dbConf["database"],
-                    primaryEmail=_safe_lower(email), serverName=_safe_lower(server_from_plex)
+            fetched = plex_fetch.result_for(server_cfg_name)
+            if fetched is not None and not fetched.ok:
+                logging.error("Skipping DB presence audit for '%s': Plex fetch failed (%s).",
+                              server_cfg_name, fetched.error)
+                continue
+            # One pass over the stream: the diff keeps new/changed users and a compact entry for the rest
+            diff = snapshot.diff(server_cfg_name, _actionable_plex_users(pc, purpose="DB presence audit"))
+
+            full = fullAudit or snapshot.full_audit_due(server_cfg_name, everyDays)
+            emails = diff.emails() if full else {pu.email for pu in diff.audit_targets() if pu.actionable}
+            logging.info("DB presence audit for '%s': %s, checking %d of %d user(s) (%s).",
+                         server_cfg_name, "full" if full else "incremental",
+                         len(emails), len(diff.roster), diff.describe())
+
+            missing = set()
+            if emails:
+                missing = dbFunctions.findMissingUsers(
+                    user=dbConf.get("user"), password=dbConf.get("password"),
+                    server=dbConf.get("host"), database=dbConf.get("database"),
+                    primaryEmails=emails, serverName=server_cfg_name
                 )
-                if not in_db:
-                    logging.info(
-                        "[DRY-RUN] Would remove Plex user '%s' from '%s' (not in DB)" if dryrun
-                        else "Removing Plex user '%s' from '%s' (not in DB)",
-                        email, server_cfg_name
-                    )
-                    try:
-                        shared = pc.get("standardLibraries", []) + pc.get("optionalLibraries", [])
-                        plexFunctions.removePlexUser(config_path, server_cfg_name, _safe_lower(email), shared, dryrun=dryrun)
-                    except Exception as e:
-                        logging.error("Error removing '%s' from Plex '%s': %s", email, server_cfg_name, e)
+            if missing is None:
+                logging.error("Skipping DB presence audit for '%s': database lookup failed.", server_cfg_name)
+                continue
+
+            for email in sorted(missing):
+                logging.info(
+                    "[DRY-RUN] Would remove Plex user '%s' from '%s' (not in DB)" if dryrun
+                    else "Removing Plex user '%s' from '%s' (not in DB)",
+                    email, server_cfg_name
+                )
+                removals.append(plex_removals.Removal(server_cfg_name, email, pc["baseUrl"], pc["token"], not_in_db))
+            audited.append((server_cfg_name, diff, missing, full))
+
+        _execute_removals(config_path, cfg, removals, dryrun)
+
+        # Remember who passed; flagged users stay out so a failed removal is retried next run
+        if dryrun:
+            logging.info("[DRY-RUN] Roster snapshot not updated.")
+            return
+        for server_cfg_name, diff, missing, full in audited:
+            snapshot.record_diff(server_cfg_name, diff, missing, fullAudit=full)
+        snapshot.save()
 
     except Exception as e:
         logging.error("Error in checkPlexUsersNotInDatabase: %s", e)
@@ -253,29 +380,43 @@ def checkInactiveUsersOnPlex(config_path, dryrun):
         cfg = configFunctions.getConfig(config_path)
         dbConf = cfg["database"]
         plexConfs = [cfg[k] for k in cfg if str(k).startswith("PLEX-")]
+        pending_status = []
+        removals = []
+        columns = dbFunctions.USER_SNAPSHOT_FIELDS
+        email_pos = columns.index("primaryEmail")
 
         for pc in plexConfs:
             server = pc["serverName"]
             plex_users = _actionable_plex_users(pc, purpose="inactive audit")
+            plex_emails = {u.email for u in plex_users if u.actionable}
 
-            inactive = dbFunctions.getUsersByStatus(
-                user=dbConf["user"], password=dbConf["password"], host=dbConf["host"],
-                database=dbConf["database"], status="Inactive", serverName=server
-            )
-            plex_emails = { _safe_lower(u.get("Email")) for u in plex_users if u.get("Email") }
-
-            for u in inactive:
-                pEmail = u.get("primaryEmail")
-                if not pEmail:
-                    logging.error("Inactive DB user missing primaryEmail: %s", u)
-                    continue
-                if _safe_lower(pEmail) in plex_emails:
-                    logging.warning("Inactive user '%s' on server '%s' still has Plex access.", pEmail, server)
-                    try:
-                        shared = pc.get("standardLibraries", []) + pc.get("optionalLibraries", [])
-                        plexFunctions.removePlexUser(CONFIG_FILE, server, _safe_lower(pEmail), shared, dryrun=dryrun)
-                    except Exception as e:
-                        logging.error("Error removing user '%s' from Plex '%s': %s", pEmail, server, e)
+            # Stream the server's inactive rows and keep only those still shared on Plex
+            still_shared = []
+            try:
+                for row in dbFunctions.iterUsers(
+                    user=dbConf.get("user"), password=dbConf.get("password"), host=dbConf.get("host"),
+                    database=dbConf.get("database"), columns=columns, status="Inactive", serverName=server
+                ):
+                    pEmail = row[email_pos]
+                    if not pEmail:
+                        logging.error("Inactive DB user missing primaryEmail: %s", dict(zip(columns, row)))
+                        continue
+                    if _safe_lower(pEmail) in plex_emails:
+                        still_shared.append(dict(zip(columns, row)))
+            except dbFunctions.DB_ERRORS:
+                logging.error("Inactive audit '%s': could not read users from the database; skipping.", server)
+                continue
+
+            index = UserIndex(still_shared)
+            for u in still_shared:
+                pEmail = u["primaryEmail"]
+                logging.warning("Inactive user '%s' on server '%s' still has Plex access.", pEmail, server)
+                removals.append(plex_removals.Removal(server, _safe_lower(pEmail), pc["baseUrl"], pc["token"], index))
+
+        _execute_removals(CONFIG_FILE, cfg, removals, dryrun, statusUpdates=pending_status)
+
+        # These rows are already Inactive in the DB, so unchanged rows are expected here
+        _flush_status_updates(config_path, pending_status, warn_unchanged=False)
 
     except Exception as e:
         logging.error("Error checking inactive users on Plex server: %s", e)
@@ -285,19 +426,17 @@ def checkUsersEndDate(config_path, dryrun):
         cfg = configFunctions.getConfig(config_path)
         db = cfg["database"]
 
-        con = mysql.connector.connect(
-            host=db["host"], user=db["user"], password=db["password"], database=db["database"]
+        # Only rows inside the reminder window come back; they double as the removal index
+        expiring = dbFunctions.getExpiringUsers(
+            user=db.get("user"), password=db.get("password"), host=db.get("host"),
+            database=db.get("database"), horizonDays=REMINDER_WINDOW_DAYS
         )
-        cur = con.cursor(dictionary=True)
-        cur.execute("SELECT * FROM users WHERE status = 'Active'")
-        users = cur.fetchall()
-        today = datetime.now().date()
-
-        for u in users:
-            endDate = u.get("endDate")
-            if endDate is None:
-                continue
+        index = UserIndex(expiring)
+        pending_status = []
+        removals = []
+        logging.info("End-date check: %d active user(s) inside the %d-day window.", len(expiring), REMINDER_WINDOW_DAYS)
 
+        for u in expiring:
             primaryEmail = u.get("primaryEmail")
             primaryDiscord = u.get("primaryDiscord")
             serverName = u.get("server")
@@ -308,9 +447,7 @@ def checkUsersEndDate(config_path, dryrun):
             except Exception:
                 streamCount = 2
 
-            daysLeft = (endDate - today).days
-            if daysLeft >= 8:
-                continue
+            daysLeft = int(u["daysLeft"])
 
             logging.info(
                 "User with primaryEmail: %s, primaryDiscord: %s has %d days left.",
@@ -326,38 +463,16 @@ def checkUsersEndDate(config_path, dryrun):
                 continue
 
             if daysLeft < 0:
-                shared = plex_cfg.get("standardLibraries", []) + plex_cfg.get("optionalLibraries", [])
-                try:
-                    if dryrun:
-                        logging.info("[DRY-RUN] Would remove expired Plex user %s on server %s", primaryEmail, serverName)
-                    else:
-                        plexFunctions.removePlexUser(config_path, serverName, primaryEmail, shared, dryrun=False)
-                except Exception as e:
-                    logging.error("Error removing expired user %s on server %s: %s", primaryEmail, serverName, e)
+                if dryrun:
+                    logging.info("[DRY-RUN] Would remove expired Plex user %s on server %s", primaryEmail, serverName)
+                else:
+                    removals.append(plex_removals.Removal(serverName, primaryEmail, plex_cfg.get("baseUrl"),
+                                                          plex_cfg.get("token"), index))
                 continue
 
             # targets
-            toEmail = []
-            notifyEmail = dbFunctions.getDBField(CONFIG_FILE, serverName, primaryEmail, "notifyEmail")
-            if notifyEmail == "Primary":
-                toEmail = [dbFunctions.getDBField(CONFIG_FILE, serverName, primaryEmail, "primaryEmail")]
-            elif notifyEmail == "Secondary":
-                toEmail = [dbFunctions.getDBField(CONFIG_FILE, serverName, primaryEmail, "secondaryEmail")]
-            elif notifyEmail == "Both":
-                pE = dbFunctions.getDBField(CONFIG_FILE, serverName, primaryEmail, "primaryEmail")
-                sE = dbFunctions.getDBField(CONFIG_FILE, serverName, primaryEmail, "secondaryEmail")
-                toEmail = [e for e in (pE, sE) if e]
-
-            toDiscord = []
-            notifyDiscord = dbFunctions.getDBField(CONFIG_FILE, serverName, primaryEmail, "notifyDiscord")
-            if notifyDiscord == "Primary":
-                toDiscord = [dbFunctions.getDBField(CONFIG_FILE, serverName, primaryEmail, "primaryDiscordId")]
-            elif notifyDiscord == "Secondary":
-                toDiscord = [dbFunctions.getDBField(CONFIG_FILE, serverName, primaryEmail, "secondaryDiscordId")]
-            elif notifyDiscord == "Both":
-                pD = dbFunctions.getDBField(CONFIG_FILE, serverName, primaryEmail, "primaryDiscordId")
-                sD = dbFunctions.getDBField(CONFIG_FILE, serverName, primaryEmail, "secondaryDiscordId")
-                toDiscord = [d for d in (pD, sD) if d]
+            toEmail = email_recipients(u)
+            toDiscord = discord_recipients(u)
 
             # send
             try:
@@ -376,10 +491,10 @@ def checkUsersEndDate(config_path, dryrun):
             except Exception as e:
                 logging.error("Discord notify failed for %s: %s", primaryEmail, e)
 
-        cur.close()
-        con.close()
+        _execute_removals(config_path, cfg, removals, dryrun=False, statusUpdates=pending_status)
+        _flush_status_updates(config_path, pending_status)
 
-    except mysql.connector.Error as e:
+    except db_backend.DB_ERRORS as e:
         logging.error("Error checking users' endDate: %s", e)
 
 # ========= Orchestration =========
@@ -390,62 +505,116 @@ def dailyRun(args, dryrun):
     cfg = configFunctions.getConfig(CONFIG_FILE)
     logging.info("Configuration file loaded successfully")
 
-    host = cfg["database"]["host"]
-    port = cfg["database"]["port"]
-    database = cfg["database"]["database"]
-    user = cfg["database"]["user"]
-    password = cfg["database"]["password"]
+    dbConf = cfg["database"]
+    host = dbConf.get("host")
+    port = dbConf.get("port")
+    database = dbConf.get("database")
+    user = dbConf.get("user")
+    password = dbConf.get("password")
     table = "users"
 
-    if not validateFunctions.validateServer(host, port):
-        logging.error("Database server %s is NOT listening on port %s.", host, port)
-        sys.exit(1)
-    if not validateFunctions.validateDBConnection(user, password, host, database):
-        logging.error("Unable to authenticate user %s to database server %s.", user, host)
-        sys.exit(1)
-    if not validateFunctions.validateDBDatabase(user, password, host, database):
-        logging.error("Database %s does not exist on %s.", database, host)
-        sys.exit(1)
-    if not validateFunctions.validateDBTable(user, password, host, database, table):
-        logging.error("Table %s does not exist in database %s.", table, database)
+    # One connection validates reachability, auth, database and schema, then joins the run's pool
+    sqlite = db_backend.engine_of(dbConf) == "sqlite"
+    if sqlite:
+        preflight = validateFunctions.preflightSQLite(db_backend.from_config(dbConf), table)
+    else:
+        preflight = validateFunctions.preflightDatabase(host, port, user, password, database, table)
+    if not preflight.ok:
+        messages = {} if sqlite else {
+            "reachability": "Database server %s is NOT listening on port %s." % (host, port),
+            "auth": "Unable to authenticate user %s to database server %s." % (user, host),
+            "database": "Database %s does not exist on %s." % (database, host),
+            "table": "Table %s does not exist in database %s." % (table, database),
+        }
+        message = messages.get(preflight.failedStep)
+        if message is None:
+            logging.error("Database preflight failed at %s: %s", preflight.failedStep, preflight.error)
+        else:
+            logging.error(message)
+            if preflight.error:
+                logging.error("Error: %s", preflight.error)
         sys.exit(1)
 
-    logging.info("Database connection validated successfully. Proceeding with checks.")
-
-    plexConfs = [cfg[k] for k in cfg if str(k).startswith("PLEX-")]
-    if not plexConfs:
-        logging.error("No valid Plex configurations found in the config file. Exiting.")
+    # One DB pool for the whole run; every dbFunctions helper borrows from it
+    pool = db_pool.open_pool(dbConf)
+    if dbFunctions.migrateSchema(user, password, host, database, connection=preflight.connection) is None:
+        logging.error("Unable to bring the database schema up to date. Exiting.")
+        preflight.connection.close()
+        db_pool.close_pool()
         sys.exit(1)
+    if not pool.adopt(preflight.connection):
+        preflight.connection.close()
 
-    for pc in plexConfs:
-        baseUrl = pc.get("baseUrl")
-        token = pc.get("token")
-        serverName = pc.get("serverName")
-        if not baseUrl or not token:
-            logging.error("Invalid Plex configuration for server %s. Missing baseUrl or token.", serverName)
-            continue
-        if not validateFunctions.validatePlex(baseUrl, token):
-            logging.error("Unable to connect to Plex instance %s. Check baseUrl and token.", serverName)
-            continue
-        logging.info("Successfully connected to Plex instance: %s", serverName)
+    logging.info("Database connection validated successfully. Proceeding with checks.")
 
-    # Run checks (log-and-continue on errors)
     try:
-        checkPlexUsersNotInDatabase(CONFIG_FILE, dryrun=dryrun)
-    except Exception as e:
-        logging.error("checkPlexUsersNotInDatabase error: %s", e)
-    try:
-        checkInactiveUsersOnPlex(CONFIG_FILE, dryrun=dryrun)
-    except Exception as e:
-        logging.error("checkInactiveUsersOnPlex error: %s", e)
-    try:
-        checkUsersEndDate(CONFIG_FILE, dryrun=dryrun)
-    except Exception as e:
-        logging.error("checkUsersEndDate error: %s", e)
-    try:
-        checkInactiveUsersOnDiscord(CONFIG_FILE, dryrun=dryrun)
-    except Exception as e:
-        logging.error("checkInactiveUsersOnDiscord error: %s", e)
+        plexConfs = [cfg[k] for k in cfg if str(k).startswith("PLEX-")]
+        if not plexConfs:
+            logging.error("No valid Plex configurations found in the config file. Exiting.")
+            sys.exit(1)
+
+        # Validate every Plex server and pull its libraries and roster in parallel;
+        # the checks below share one plex.tv roster per account
+        plexSettings = cfg.get("plex") or {}
+        maxWorkers = plexSettings.get("maxWorkers", plex_fetch.DEFAULT_MAX_WORKERS)
+        timeout = plexSettings.get("timeout", plex_fetch.DEFAULT_TIMEOUT)
+        # One authenticated client per server and one keep-alive session for every Plex call this run
+        plex_registry.open_registry(plexConfs, timeout=timeout, poolSize=maxWorkers)
+        plex_roster.open_run()
+        plex_shares.open_run()
+        # One Discord login for every DM and role call in the run (connects on first use)
+        discordConf = cfg.get("discord") or {}
+        discord_session.open_session(discordConf.get("token"))
+        discord_guild.open_run()
+        # Known DM channels persist across runs so repeat DMs skip fetch_user + create_dm
+        # and users who refuse DMs cost no API calls until their re-probe is due
+        discord_state.open_state(DISCORD_STATE,
+                                 discordConf.get("dmChannelTtlDays", discord_state.DM_CHANNEL_TTL_DAYS),
+                                 discordConf.get("dmBlockedReprobeDays", discord_state.DM_BLOCKED_REPROBE_DAYS))
+        # DMs queue up during the checks and go out as one concurrent wave
+        discord_dispatch.open_outbox(discordConf.get("dmConcurrency"), discordConf.get("dmRetries"))
+        run_log = run_snapshot.open_run()
+        fetched = plex_fetch.open_run(plexConfs, maxWorkers=maxWorkers, timeout=timeout, snapshot=run_log,
+                                      serverBudget=plexSettings.get("serverBudget"))
+        for r in fetched.values():
+            if r.ok:
+                logging.info("Successfully connected to Plex instance: %s", r.serverName)
+            else:
+                logging.error("Unable to connect to Plex instance %s. Check baseUrl and token.", r.serverName)
+
+        # Run checks (log-and-continue on errors)
+        try:
+            checkPlexUsersNotInDatabase(CONFIG_FILE, dryrun=dryrun, fullAudit=getattr(args, "full_audit", False))
+        except Exception as e:
+            logging.error("checkPlexUsersNotInDatabase error: %s", e)
+        try:
+            checkInactiveUsersOnPlex(CONFIG_FILE, dryrun=dryrun)
+        except Exception as e:
+            logging.error("checkInactiveUsersOnPlex error: %s", e)
+        try:
+            checkUsersEndDate(CONFIG_FILE, dryrun=dryrun)
+        except Exception as e:
+            logging.error("checkUsersEndDate error: %s", e)
+        try:
+            discordFunctions.flushDMs()
+        except Exception as e:
+            logging.error("Discord DM dispatch error: %s", e)
+        try:
+            checkInactiveUsersOnDiscord(CONFIG_FILE, dryrun=dryrun)
+        except Exception as e:
+            logging.error("checkInactiveUsersOnDiscord error: %s", e)
+        log_run_summary(run_log)
+    finally:
+        discord_dispatch.close_outbox()
+        discord_guild.close_run()
+        discord_session.close_session()
+        discord_state.close_state()
+        run_snapshot.close_run()
+        plex_fetch.close_run()
+        plex_shares.close_run()
+        plex_roster.close_run()
+        plex_registry.close_registry()
+        db_pool.close_pool()
 
     logging.info("Daily Run completed successfully.")
 
@@ -456,11 +625,28 @@ def main():
     parser.add_argument("--dry-run", action="store_true", dest="dryrun2", help="Run in dry-run mode")
     parser.add_argument("-time", metavar="time", type=str, default=os.getenv("TIME", ""), help="HH:MM daily run time")
     parser.add_argument("--run-now", action="store_true", help="Run immediately once")
+    parser.add_argument("--full-audit", action="store_true",
+                        help="Check every Plex user against the DB instead of only roster changes")
 
     args = parser.parse_args()
     dryrun = bool(args.dryrun or args.dryrun2)
     logging.info("CLI parsed: dryrun=%s, run_now=%s, time=%s", dryrun, bool(args.run_now), args.time or "(none)")
 
+    if args.add:
+        service = args.add.strip().lower()
+        if service == "plex":
+            plexFunctions.createPlexConfig(CONFIG_FILE)
+        else:
+            logging.error("Unknown service '%s' for -add (supported: plex).", args.add)
+            sys.exit(1)
+        db = configFunctions.getConfig(CONFIG_FILE)["database"]
+        db_pool.open_pool(db)
+        try:
+            dbFunctions.migrateSchema(db.get("user"), db.get("password"), db.get("host"), db.get("database"))
+        finally:
+            db_pool.close_pool()
+        sys.exit(0)
+
     # schedule logic
     if args.run_now:
         dailyRun(args, dryrun=dryrun)
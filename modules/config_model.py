@@ -1,5 +1,5 @@
 from __future__ import annotations
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 # Backcompat shim for Pydantic v1/v2
 try:
@@ -13,20 +13,48 @@ except Exception:  # pydantic v1
 
 class DiscordSettings(BaseModel):
     token: str = Field(..., description="Discord bot token")
+    dmConcurrency: int = 5         # DMs in flight at once
+    dmRetries: int = 3             # retries per DM on 429/5xx
+    dmChannelTtlDays: float = 30   # how long a cached DM channel ID is trusted
+    dmBlockedReprobeDays: float = 7  # how long DM-blocked users are skipped before trying again
+    roleConcurrency: int = 5       # role removals in flight at once
 
 
 class DatabaseSettings(BaseModel):
-    host: str
-    port: int
-    database: str
-    user: str
-    password: str
+    engine: str = "mysql"          # "mysql" or "sqlite"
+    host: Optional[str] = None
+    port: Optional[int] = None
+    database: Optional[str] = None
+    user: Optional[str] = None
+    password: Optional[str] = None
+    path: Optional[str] = None     # sqlite only; defaults to /config/harassarr.db
+    poolSize: int = 5
+
+    def check_engine(self) -> None:
+        engine = (self.engine or "mysql").strip().lower()
+        if engine == "sqlite":
+            return
+        if engine != "mysql":
+            raise ValueError(f"database.engine must be 'mysql' or 'sqlite', got {self.engine!r}")
+        missing = [k for k in ("host", "port", "database", "user", "password") if getattr(self, k) in (None, "")]
+        if missing:
+            raise ValueError(f"database section is missing: {', '.join(missing)}")
 
 
 class LogSettings(BaseModel):
     retention: int = 90
 
 
+class PlexSettings(BaseModel):
+    maxWorkers: int = 4     # Plex servers fetched in parallel
+    timeout: float = 30     # seconds per Plex/plex.tv request
+    serverBudget: Optional[float] = None  # seconds for one server's whole fetch (default 5 x timeout)
+    removalRate: float = 2  # share removals per second (token bucket)
+    removalBurst: int = 5
+    removalRetries: int = 4
+    fullAuditDays: int = 7  # full DB presence audit at least this often; incremental in between
+
+
 class Settings(BaseModel):
     # In v2 use model_config; in v1 use inner Config
     if _V2:
@@ -38,6 +66,7 @@ class Settings(BaseModel):
     database: DatabaseSettings
     discord: DiscordSettings
     log: LogSettings = LogSettings()
+    plex: PlexSettings = PlexSettings()
     # NOTE: All other keys (including PLEX-* and "1080p"/"4k") are allowed and passed through.
 
 
@@ -45,4 +74,6 @@ def validate_config(raw: Dict[str, Any]) -> Settings:
     """
     Validate core sections of config.yml and allow all extras unchanged.
     """
-    return Settings(**raw)
+    settings = Settings(**raw)
+    settings.database.check_engine()
+    return settings
@@ -1,14 +1,71 @@
 #dbFunctions.py
+import os
 import sys
 import csv
+import contextlib
 import mysql.connector
 import logging
+import time
 from datetime import datetime
 import modules.configFunctions as configFunctions
+import modules.db_pool as db_pool
+import modules.db_backend as db_backend
+from modules.db_backend import DB_ERRORS
+import modules.db_migrations as db_migrations
 
 
 logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Same default as harassarr.py; used when a helper runs without the run's pool
+CONFIG_FILE = os.getenv("HARASSARR_CONFIG", "/config/config.yml")
+
+
+@contextlib.contextmanager
+def _borrow(backend):
+    # Borrow from the run-scoped pool when it serves this backend; otherwise open a one-off connection.
+    pool = db_pool.active_pool()
+    if pool is not None and db_pool.active_backend() is backend:
+        with pool.connection() as cnx:
+            yield cnx
+        return
+
+    cnx = backend.connect()
+    try:
+        yield cnx
+    finally:
+        cnx.close()
+
+
+def _legacyBackend(host, user, password, database):
+    # Call sites that pass connection details: reuse the run's backend when it is the same database
+    active = db_pool.active_backend()
+    if active is not None and active.matches(host, user, database):
+        return active
+    # Outside a run (-add, CSV import, one-off helpers) the engine still comes from config.yml
+    if active is None:
+        try:
+            configured = _configBackend(CONFIG_FILE)
+        except Exception as e:
+            logging.warning(f"Unable to read the database engine from {CONFIG_FILE} ({e}); assuming MySQL.")
+        else:
+            if configured.matches(host, user, database):
+                return configured
+    return db_backend.MySQLBackend(host=host, user=user, password=password, database=database)
+
+
+def _configBackend(configFile=None):
+    # Call sites that pass config.yml: only read it when no backend is open for the run
+    return db_pool.active_backend() or \
+        db_backend.from_config(configFunctions.getConfig(configFile or CONFIG_FILE)['database'])
+
+
+def _connection(host, user, password, database):
+    return _borrow(_legacyBackend(host, user, password, database))
+
+
+def _configConnection(configFile):
+    return _borrow(_configBackend(configFile))
+
 
 def createDBUser(rootUser, rootPassword, newUser, newPassword, database, server):
     try:
@@ -98,6 +155,11 @@ def createDBStructure(rootUser, rootPassword, database, server):
 
         cnx.commit()
 
+        # Bring indexes/generated columns up to date
+        backend = db_backend.MySQLBackend(host=server, user=rootUser, password=rootPassword, database=database)
+        version = db_migrations.apply_pending(cnx, backend)
+        logging.info(f"Database schema at version {version}.")
+
     except mysql.connector.Error as err:
         logging.error("Database and table creation failed.")
         logging.error(f"Error: {err}")
@@ -112,94 +174,205 @@ def createDBStructure(rootUser, rootPassword, database, server):
     return True
 
 
-def injectUsersFromCSV(user, password, server, database, csvFilePath):
-    # Database connection parameters
-    dbConfig = {
-        'host': server,
-        'user': user,
-        'password': password,
-        'database': database
-    }
-
+def migrateSchema(user, password, server, database, connection=None):
+    # Apply any pending schema migrations; returns the resulting version or None on failure.
+    # Pass `connection` to migrate over an already-open session (e.g. the preflight one).
+    backend = _legacyBackend(server, user, password, database)
     try:
-        # Open database connection
-        connection = mysql.connector.connect(**dbConfig)
-        cursor = connection.cursor()
-
-        # Read data from CSV file with utf-8 encoding
-        with open(csvFilePath, 'r', encoding='utf-8') as csvFile:
-            csvReader = csv.DictReader(csvFile)
-            for row in csvReader:
-                # Convert date strings to datetime objects if they are not empty
-                startDateStr = row.get('startDate', '')
-                endDateStr = row.get('endDate', '')
-                joinedDateStr = row.get('joinDate', '')
-
-                startDate = datetime.strptime(startDateStr, '%m/%d/%Y').date() if startDateStr else None
-                endDate = datetime.strptime(endDateStr, '%m/%d/%Y').date() if endDateStr else None
-                joinDate = datetime.strptime(joinedDateStr, '%m/%d/%Y').date() if joinedDateStr else None
-
-                # SQL query to insert data into the 'users' table
-                insert_query = """
-                    INSERT INTO users (primaryDiscord, secondaryDiscord, primaryEmail, secondaryEmail,
-                                primaryDiscordId, secondaryDiscordId,
-                                notifyDiscord, notifyEmail, status, server, 4k, paidAmount,
-                                paymentMethod, paymentPerson, startDate, endDate, joinDate)
-                    VALUES ( %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
-                """
-
-
-                # Data to be inserted
-                data = (
-                    row.get('primaryDiscord', ''), row.get('secondaryDiscord', ''),
-                    row.get('primaryEmail', ''), row.get('secondaryEmail', ''),
-                    row.get('primaryDiscordId', ''), row.get('secondaryDiscordId', ''),
-                    row.get('notifyDiscord', ''), row.get('notifyEmail', ''),
-                    row.get('status', ''), row.get('server', ''), row.get('4k', ''),
-                    row.get('paidAmount'), row.get('paymentMethod', ''),
-                    row.get('paymentPerson', ''), startDate, endDate, joinDate
-                )
+        if connection is not None:
+            version = db_migrations.apply_pending(connection, backend)
+        else:
+            with _borrow(backend) as connection:
+                version = db_migrations.apply_pending(connection, backend)
+        logging.info(f"Database schema at version {version}.")
+        return version
+    except (*DB_ERRORS, RuntimeError) as e:
+        logging.error(f"Schema migration failed: {e}")
+        return None
 
-                # Execute the SQL query
-                cursor.execute(insert_query, data)
-                logging.info(f"User {row.get('primaryEmail', '')} imported successfully.")
 
-        # Commit changes and close connection
+# Column order shared by the CSV importer's INSERT and UPDATE statements
+CSV_IMPORT_COLUMNS = (
+    'primaryDiscord', 'secondaryDiscord', 'primaryEmail', 'secondaryEmail',
+    'primaryDiscordId', 'secondaryDiscordId', 'notifyDiscord', 'notifyEmail',
+    'status', 'server', '4k', 'paidAmount', 'paymentMethod', 'paymentPerson',
+    'startDate', 'endDate', 'joinDate',
+)
+CSV_IMPORT_BATCH_SIZE = 500
+
+
+def _csvDate(value):
+    value = (value or '').strip()
+    return datetime.strptime(value, '%m/%d/%Y').date() if value else None
+
+
+def _csvRecord(row):
+    # Turn one CSV dict into an INSERT tuple; raises ValueError for rows that cannot be imported
+    if not (row.get('primaryEmail') or '').strip():
+        raise ValueError("primaryEmail is required")
+    if not (row.get('server') or '').strip():
+        raise ValueError("server is required")
+
+    record = {c: row.get(c, '') for c in CSV_IMPORT_COLUMNS}
+    record['paidAmount'] = row.get('paidAmount') or None
+    for c in ('startDate', 'endDate', 'joinDate'):
+        record[c] = _csvDate(row.get(c))
+    return tuple(record[c] for c in CSV_IMPORT_COLUMNS)
+
+
+def _csvKey(record):
+    i_email, i_server = CSV_IMPORT_COLUMNS.index('primaryEmail'), CSV_IMPORT_COLUMNS.index('server')
+    return (record[i_server].strip().lower(), record[i_email].strip().lower())
+
+
+def _iterCSVBatches(csvFilePath, batchSize, reject):
+    # Lazily parse the CSV, yielding lists of (row, record); unparseable rows go to reject()
+    with open(csvFilePath, 'r', encoding='utf-8', newline='') as csvFile:
+        batch = []
+        for row in csv.DictReader(csvFile):
+            try:
+                batch.append((row, _csvRecord(row)))
+            except ValueError as e:
+                reject(row, str(e))
+                continue
+            if len(batch) >= batchSize:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+class _RejectWriter:
+    # Writes rejected rows (plus an 'error' column) to a side file, created on first use
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._file = None
+        self._writer = None
+
+    def __call__(self, row, error):
+        if self._writer is None:
+            self._file = open(self.path, 'w', encoding='utf-8', newline='')
+            self._writer = csv.DictWriter(self._file, fieldnames=list(row.keys()) + ['error'], extrasaction='ignore')
+            self._writer.writeheader()
+        self._writer.writerow({**row, 'error': error})
+        self.count += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+def _insertBatch(cursor, records):
+    columns = ", ".join(f"`{c}`" for c in CSV_IMPORT_COLUMNS)
+    placeholders = ", ".join(["%s"] * len(CSV_IMPORT_COLUMNS))
+    cursor.executemany(f"INSERT INTO users ({columns}) VALUES ({placeholders})", records)
+
+
+def _updateBatch(cursor, records):
+    assignments = ", ".join(f"`{c}` = %s" for c in CSV_IMPORT_COLUMNS)
+    cursor.executemany(
+        f"UPDATE users SET {assignments} WHERE serverNorm = %s AND primaryEmailNorm = %s",
+        [record + _csvKey(record) for record in records],
+    )
+
+
+def _existingKeys(cursor, keys):
+    if not keys:
+        return set()
+    pairs = ", ".join(["(%s, %s)"] * len(keys))
+    params = [v for k in keys for v in k]
+    cursor.execute(f"SELECT serverNorm, primaryEmailNorm FROM users WHERE (serverNorm, primaryEmailNorm) IN ({pairs})", params)
+    return {(r[0], r[1]) for r in cursor.fetchall()}
+
+
+def _writeBatch(connection, batch, upsert):
+    # Write one batch in its own transaction; returns (inserted, updated)
+    cursor = connection.cursor()
+    try:
+        records = [record for _, record in batch]
+        if upsert:
+            # Last row wins when the same (server, primaryEmail) appears twice in a batch
+            byKey = {}
+            for record in records:
+                byKey[_csvKey(record)] = record
+            existing = _existingKeys(cursor, list(byKey))
+            updates = [r for k, r in byKey.items() if k in existing]
+            inserts = [r for k, r in byKey.items() if k not in existing]
+            if updates:
+                _updateBatch(cursor, updates)
+        else:
+            updates, inserts = [], records
+        if inserts:
+            _insertBatch(cursor, inserts)
         connection.commit()
-        connection.close()
-
-        print("Data inserted successfully.")
-    except Exception as e:
-        print(f"Error: {e}")
+        return len(inserts), len(updates)
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
 
 
-def countDBUsers(user, password, server, database):
-    # Database connection parameters
-    dbConfig = {
-        'host': server,
-        'user': user,
-        'password': password,
-        'database': database
-    }
+def injectUsersFromCSV(user, password, server, database, csvFilePath,
+                       batchSize=CSV_IMPORT_BATCH_SIZE, upsert=False, rejectsPath=None):
+    """
+    Stream a subscriber CSV into `users`.
+    - Rows are parsed lazily and written with executemany in batches of `batchSize`, one commit per batch
+    - upsert=True updates rows matching (server, primaryEmail) instead of inserting duplicates
+    - Rows that fail to parse or insert go to `rejectsPath` (default: <csv>.rejected.csv) instead of aborting
+    Returns a summary dict, or None if the import could not run at all.
+    """
+    rejects = _RejectWriter(rejectsPath or f"{csvFilePath}.rejected.csv")
+    inserted = updated = 0
+    started = time.monotonic()
 
     try:
-        # Open database connection
-        connection = mysql.connector.connect(**dbConfig)
-        cursor = connection.cursor()
-
-        # SQL query to count rows in the 'users' table
-        countQuery = "SELECT COUNT(*) FROM users"
-
-        # Execute the SQL query
-        cursor.execute(countQuery)
+        with _connection(server, user, password, database) as connection:
+            for batchNo, batch in enumerate(_iterCSVBatches(csvFilePath, max(1, int(batchSize)), rejects), start=1):
+                try:
+                    ins, upd = _writeBatch(connection, batch, upsert)
+                except DB_ERRORS as e:
+                    # Isolate the bad row(s): retry this batch one row at a time
+                    logging.warning(f"Batch {batchNo} failed ({e}); retrying row by row.")
+                    ins = upd = 0
+                    for row, record in batch:
+                        try:
+                            i, u = _writeBatch(connection, [(row, record)], upsert)
+                            ins, upd = ins + i, upd + u
+                        except DB_ERRORS as rowErr:
+                            rejects(row, str(rowErr))
+
+                inserted, updated = inserted + ins, updated + upd
+                elapsed = max(time.monotonic() - started, 1e-6)
+                logging.info(f"CSV import batch {batchNo}: {inserted + updated} row(s) written "
+                             f"({(inserted + updated) / elapsed:.0f} rows/s).")
+
+    except (OSError, *DB_ERRORS) as e:
+        logging.error(f"CSV import failed: {e}")
+        return None
+    finally:
+        rejects.close()
 
-        # Fetch the result
-        count = cursor.fetchone()[0]
+    elapsed = time.monotonic() - started
+    summary = {'inserted': inserted, 'updated': updated, 'rejected': rejects.count, 'seconds': round(elapsed, 2)}
+    logging.info(f"CSV import finished: {inserted} inserted, {updated} updated, {rejects.count} rejected "
+                 f"in {elapsed:.1f}s ({(inserted + updated) / max(elapsed, 1e-6):.0f} rows/s).")
+    if rejects.count:
+        logging.warning(f"Rejected rows written to {rejects.path}")
+    return summary
 
-        # Close connection
-        connection.close()
 
-        return count
+def countDBUsers(user, password, server, database):
+    try:
+        with _connection(server, user, password, database) as connection:
+            cursor = connection.cursor()
+            try:
+                # SQL query to count rows in the 'users' table
+                cursor.execute("SELECT COUNT(*) FROM users")
+                return cursor.fetchone()[0]
+            finally:
+                cursor.close()
     except Exception as e:
         print(f"Error: {e}")
         return None
@@ -207,203 +380,277 @@ def countDBUsers(user, password, server, database):
 
 def getDBUsers(user, password, server, database):
     try:
-        cnx = mysql.connector.connect(user=user, password=password, host=server, database=database)
-        cursor = cnx.cursor()
-
-        # Example query to retrieve usernames from a 'users' table
-        query = "SELECT primaryEmail FROM users;"
-        cursor.execute(query)
-
-        # Fetch all usernames
-        dbUsers = [row[0] for row in cursor.fetchall()]
-
-        # Close the cursor and connection
-        cursor.close()
-        cnx.close()
-
-        return dbUsers
-
-    except mysql.connector.Error as err:
+        with _connection(server, user, password, database) as cnx:
+            cursor = cnx.cursor()
+            try:
+                # Example query to retrieve usernames from a 'users' table
+                cursor.execute("SELECT primaryEmail FROM users;")
+                return [row[0] for row in cursor.fetchall()]
+            finally:
+                cursor.close()
+
+    except DB_ERRORS as err:
         raise ValueError(f"Error retrieving users from the database: {err}")
 
 
 def userExists(user, password, server, database, primaryEmail, serverName):
     try:
-        # Connect to the database
         if primaryEmail is None or serverName is None:  # Check if either value is None
             logging.error(f"Invalid primaryEmail or serverName: primaryEmail={primaryEmail}, serverName={serverName}")
             return False
 
-        connection = mysql.connector.connect(
-            host=server,
-            user=user,
-            password=password,
-            database=database
-        )
-
-        # Create a cursor object
-        cursor = connection.cursor()
-
-        # Query to check if the user exists in the database for the specific server
-        query = "SELECT * FROM users WHERE LOWER(primaryEmail) = %s AND LOWER(server) = %s"
-        cursor.execute(query, (primaryEmail.lower(), serverName.lower()))
-
-        # Fetch the result
-        result = cursor.fetchone()
-
-        # Close the cursor and connection
-        cursor.close()
-        connection.close()
+        with _connection(server, user, password, database) as connection:
+            cursor = connection.cursor()
+            try:
+                # Query to check if the user exists in the database for the specific server
+                query = "SELECT 1 FROM users WHERE serverNorm = %s AND primaryEmailNorm = %s LIMIT 1"
+                cursor.execute(query, (serverName.strip().lower(), primaryEmail.strip().lower()))
+                result = cursor.fetchone()
+            finally:
+                cursor.close()
 
         # Return True if the user exists, False otherwise
         return result is not None
 
-    except mysql.connector.Error as e:
+    except DB_ERRORS as e:
         logging.error(f"Error checking if user exists in the database: {e}")
         return False
 
 
-def getUsersByStatus(user, password, host, database, status, serverName):
+def findMissingUsers(user, password, server, database, primaryEmails, serverName):
+    # Bulk anti-join: which of primaryEmails have no users row on serverName.
+    # One range read on idx_users_server_email instead of one userExists query per email.
+    # Returns None on DB error so callers never mistake an outage for "nobody is in the DB".
+    wanted = {(e or "").strip().lower() for e in primaryEmails if e}
+    if not wanted:
+        return set()
+
     try:
-        # Connect to the database
-        connection = mysql.connector.connect(
-            host=host,
-            user=user,
-            password=password,
-            database=database
-        )
-
-        # Create a cursor object
-        cursor = connection.cursor(dictionary=True)  # Use dictionary cursor to fetch results as dictionaries
-
-        # Query to select users by status and server name
-        if serverName == "*":
-            # If serverName is "*", retrieve all users regardless of the server name
-            query = "SELECT * FROM users WHERE status = %s"
-            cursor.execute(query, (status,))
-        else:
-            # If a specific serverName is provided, include it in the query
-            query = "SELECT * FROM users WHERE status = %s AND server = %s"
-            cursor.execute(query, (status, serverName))
+        with _connection(server, user, password, database) as connection:
+            cursor = connection.cursor()
+            try:
+                query = "SELECT DISTINCT primaryEmailNorm FROM users WHERE serverNorm = %s"
+                cursor.execute(query, ((serverName or "").strip().lower(),))
+                present = {row[0] for row in cursor.fetchall() if row[0]}
+            finally:
+                cursor.close()
+
+        return wanted - present
+
+    except DB_ERRORS as e:
+        logging.error(f"Error checking users against the database: {e}")
+        return None
 
-        # Fetch all users
-        users = cursor.fetchall()
 
-        # Close the cursor and connection
-        cursor.close()
-        connection.close()
+def iterUsers(user, password, host, database, columns=None, status=None, serverName="*", batchSize=500):
+    """
+    Stream `users` rows as plain tuples (in `columns` order) through an unbuffered cursor,
+    so memory stays flat however many historical rows the table holds.
+    Optional filters: status, serverName ("*" = all servers).
+    The pooled connection is held until the generator is exhausted or closed; keep the loop body
+    light (collect what you need, act afterwards) so the server does not time out the stream.
+    Database errors are logged and re-raised, so a failed read never looks like an empty table.
+    """
+    columns = columns or USER_SNAPSHOT_FIELDS
+    where, params = [], []
+    if status is not None:
+        where.append("status = %s")
+        params.append(status)
+    if serverName != "*":
+        where.append("serverNorm = %s")
+        params.append((serverName or "").strip().lower())
+    query = f"SELECT {', '.join(f'`{c}`' for c in columns)} FROM users"
+    if where:
+        query += " WHERE " + " AND ".join(where)
 
-        return users
+    try:
+        with _connection(host, user, password, database) as connection:
+            cursor = connection.cursor(buffered=False)
+            try:
+                cursor.execute(query, params)
+                while True:
+                    rows = cursor.fetchmany(batchSize)
+                    if not rows:
+                        break
+                    yield from rows
+            finally:
+                # An early exit leaves unread rows on the wire; drain them before the connection is reused
+                try:
+                    connection.consume_results()
+                except Exception:
+                    pass
+                cursor.close()
+
+    except DB_ERRORS as e:
+        logging.error(f"Error streaming users: {e}")
+        raise
+
+
+def getUsersByStatus(user, password, host, database, status, serverName, columns=None):
+    """Users with `status` on `serverName` ("*" = all servers) as dicts of `columns`, via iterUsers."""
+    columns = columns or USER_SNAPSHOT_FIELDS
+    try:
+        return [dict(zip(columns, row)) for row in iterUsers(
+            user, password, host, database, columns=columns, status=status, serverName=serverName
+        )]
+    except DB_ERRORS:
+        return []  # already logged by iterUsers
     except Exception as e:
-        print(f"Error: {e}")
-        return []
-
-
-    except mysql.connector.Error as e:
         logging.error(f"Error getting users by status: {e}")
         return []
 
 
-def updateUserStatus(configFile, serverName, userEmail, newStatus):
-    config = configFunctions.getConfig(configFile)
-    dbConfig = config.get('database', None)
+VALID_STATUSES = ('Active', 'Inactive')
 
-    try:
-        # Connect to the database
-        connection = mysql.connector.connect(
-            host=dbConfig['host'],
-            user=dbConfig['user'],
-            password=dbConfig['password'],
-            database=dbConfig['database']
-        )
-
-        # Create a cursor object
-        cursor = connection.cursor()
-
-        # Validate the new_status input
-        if newStatus not in ('Active', 'Inactive'):
+
+def updateUserStatuses(configFile, changes):
+    """
+    Apply many (serverName, userEmail, newStatus) transitions in a single transaction.
+    Rows are grouped per (server, status) so each group is one SELECT ... FOR UPDATE plus one UPDATE.
+    Returns {(serverName, userEmail): rows changed} for every requested pair (0 = already in that
+    status or no matching row), or None if nothing was written.
+    """
+    changes = list(changes)
+    for _, _, newStatus in changes:
+        if newStatus not in VALID_STATUSES:
             raise ValueError("Invalid status. Please provide 'Active' or 'Inactive'.")
+    if not changes:
+        return {}
 
-        # Update the user status
-        update_query = "UPDATE users SET status = %s WHERE primaryEmail = %s AND server = %s"
-        cursor.execute(update_query, (newStatus, userEmail, serverName))
+    # (serverNorm, status) -> {emailNorm: [original (server, email) keys]}
+    groups = {}
+    for serverName, userEmail, newStatus in changes:
+        serverKey, emailKey = (serverName or '').strip().lower(), (userEmail or '').strip().lower()
+        groups.setdefault((serverKey, newStatus), {}).setdefault(emailKey, []).append((serverName, userEmail))
 
-        # Commit the changes
-        connection.commit()
+    affected = {(serverName, userEmail): 0 for serverName, userEmail, _ in changes}
+    backend = _configBackend(configFile)
+    try:
+        with _borrow(backend) as connection:
+            cursor = connection.cursor()
+            try:
+                for (serverKey, newStatus), byEmail in groups.items():
+                    emails = list(byEmail)
+                    inList = ", ".join(["%s"] * len(emails))
+                    cursor.execute(
+                        f"SELECT primaryEmailNorm, COUNT(*) FROM users WHERE serverNorm = %s "
+                        f"AND primaryEmailNorm IN ({inList}) AND {backend.null_safe_not_equal('status')} "
+                        f"GROUP BY primaryEmailNorm{backend.for_update}",
+                        [serverKey, *emails, newStatus],
+                    )
+                    for emailKey, count in cursor.fetchall():
+                        for original in byEmail.get(emailKey, []):
+                            affected[original] = int(count)
+
+                    cursor.execute(
+                        f"UPDATE users SET status = %s WHERE serverNorm = %s AND primaryEmailNorm IN ({inList})",
+                        [newStatus, serverKey, *emails],
+                    )
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+            finally:
+                cursor.close()
+
+    except DB_ERRORS as e:
+        logging.error(f"Error applying {len(changes)} status update(s): {e}")
+        return None
 
-        # Close the cursor and connection
-        cursor.close()
-        connection.close()
+    logging.info(f"Applied {len(changes)} status update(s) in one transaction ({sum(affected.values())} row(s) changed).")
+    return affected
 
-        logging.info(f"User '{userEmail}' status updated to '{newStatus}' for server '{serverName}'.")
 
-    except mysql.connector.Error as e:
-        logging.error(f"Error updating user status: {e}")
+def updateUserStatus(configFile, serverName, userEmail, newStatus):
+    result = updateUserStatuses(configFile, [(serverName, userEmail, newStatus)])
+    if result is not None:
+        logging.info(f"User '{userEmail}' status updated to '{newStatus}' for server '{serverName}'.")
 
 
 def getDBField(configFile, serverName, userEmail, field):
     try:
-        # Load database configuration
-        dbConfig = configFunctions.getConfig(configFile)['database']
-
-        # Connect to the database
-        connection = mysql.connector.connect(
-            host=dbConfig['host'],
-            user=dbConfig['user'],
-            password=dbConfig['password'],
-            database=dbConfig['database']
-        )
-
-        # Create a cursor object
-        cursor = connection.cursor(dictionary=True)
-
-        # Query to select the specified field for the given user
-        query = f"SELECT {field} FROM users WHERE server = %s AND primaryEmail = %s"
-        cursor.execute(query, (serverName, userEmail))
-
-        # Fetch the field value
-        result = cursor.fetchone()
-
-        # Close the cursor and connection
-        cursor.close()
-        connection.close()
+        with _configConnection(configFile) as connection:
+            cursor = connection.cursor(dictionary=True)
+            try:
+                # Query to select the specified field for the given user
+                query = f"SELECT {field} FROM users WHERE server = %s AND primaryEmail = %s"
+                cursor.execute(query, (serverName, userEmail))
+                result = cursor.fetchone()
+            finally:
+                cursor.close()
 
         return result[field] if result else None
 
-    except mysql.connector.Error as e:
+    except DB_ERRORS as e:
         logging.error(f"Error getting {field} value: {e}")
         return None
 
 
 def getAllFieldsForUser(configFile, serverName, userEmail):
     try:
-        # Load database configuration
-        dbConfig = configFunctions.getConfig(configFile)['database']
+        with _configConnection(configFile) as connection:
+            cursor = connection.cursor(dictionary=True)  # Use dictionary cursor to fetch results as dictionaries
+            try:
+                # Query to select all fields for the given user
+                query = "SELECT * FROM users WHERE server = %s AND primaryEmail = %s"
+                cursor.execute(query, (serverName, userEmail))
+                result = cursor.fetchone()
+            finally:
+                cursor.close()
 
-        # Connect to the database
-        connection = mysql.connector.connect(
-            host=dbConfig['host'],
-            user=dbConfig['user'],
-            password=dbConfig['password'],
-            database=dbConfig['database']
-        )
+        return result if result else None
 
-        # Create a cursor object
-        cursor = connection.cursor(dictionary=True)  # Use dictionary cursor to fetch results as dictionaries
+    except DB_ERRORS as e:
+        logging.error(f"Error getting all fields for the user: {e}")
+        return None
 
-        # Query to select all fields for the given user
-        query = "SELECT * FROM users WHERE server = %s AND primaryEmail = %s"
-        cursor.execute(query, (serverName, userEmail))
 
-        # Fetch the result
-        result = cursor.fetchone()
+# Columns the checks need to notify/price a user; loaded in one query by getUserSnapshot
+USER_SNAPSHOT_FIELDS = (
+    'primaryEmail', 'secondaryEmail', 'primaryDiscord', 'primaryDiscordId', 'secondaryDiscordId',
+    'notifyEmail', 'notifyDiscord', 'status', 'server', '4k', 'endDate',
+)
 
-        # Close the cursor and connection
-        cursor.close()
-        connection.close()
 
-        return result if result else None
+def getUserSnapshot(user, password, host, database, serverName="*", fields=USER_SNAPSHOT_FIELDS):
+    # One query for every user on serverName ("*" = whole table) instead of one getDBField call per column
+    columns = ", ".join(f"`{f}`" for f in fields)
+    try:
+        with _connection(host, user, password, database) as connection:
+            cursor = connection.cursor(dictionary=True)
+            try:
+                if serverName == "*":
+                    cursor.execute(f"SELECT {columns} FROM users")
+                else:
+                    cursor.execute(f"SELECT {columns} FROM users WHERE serverNorm = %s", (serverName.strip().lower(),))
+                return cursor.fetchall()
+            finally:
+                cursor.close()
+
+    except DB_ERRORS as e:
+        logging.error(f"Error loading user snapshot: {e}")
+        return []
 
-    except mysql.connector.Error as e:
-        logging.error(f"Error getting all fields for the user: {e}")
-        return None
+
+def getExpiringUsers(user, password, host, database, horizonDays, fields=USER_SNAPSHOT_FIELDS):
+    # Active users whose endDate falls before today + horizonDays (already-expired included),
+    # with days left computed by the server; served by idx_users_status_enddate.
+    columns = ", ".join(f"`{f}`" for f in fields)
+    backend = _legacyBackend(host, user, password, database)
+    try:
+        with _borrow(backend) as connection:
+            cursor = connection.cursor(dictionary=True)
+            try:
+                query = (
+                    f"SELECT {columns}, {backend.days_left_expr('endDate')} AS daysLeft FROM users "
+                    f"WHERE status = 'Active' AND {backend.before_horizon('endDate')} "
+                    "ORDER BY endDate"
+                )
+                cursor.execute(query, (int(horizonDays),))
+                return cursor.fetchall()
+            finally:
+                cursor.close()
+
+    except DB_ERRORS as e:
+        logging.error(f"Error getting expiring users: {e}")
+        return []
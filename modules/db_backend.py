@@ -0,0 +1,319 @@
+# modules/db_backend.py
+from __future__ import annotations
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Optional, Sequence
+
+import mysql.connector
+
+# Catch-all for "the database said no", whichever engine is configured
+DB_ERRORS = (mysql.connector.Error, sqlite3.Error)
+
+DEFAULT_SQLITE_PATH = "/config/harassarr.db"
+
+
+class StorageBackend(ABC):
+    """
+    Engine-specific pieces behind the dbFunctions API.
+    Connections returned by connect() expose the mysql-connector surface dbFunctions uses:
+    cursor(dictionary=..., buffered=...), commit(), rollback(), close(), ping(), consume_results().
+    SQL is written once with %s placeholders; the dialect helpers below cover the rest.
+    """
+    name = "base"
+
+    @abstractmethod
+    def connect(self) -> Any:
+        ...
+
+    @abstractmethod
+    def matches(self, host: Any, user: Any, database: Any) -> bool:
+        """Whether legacy (host, user, database) call arguments refer to this backend's database."""
+
+    def describe(self) -> str:
+        return self.name
+
+    # ----- dialect -----
+    insert_ignore = "INSERT IGNORE"
+    for_update = " FOR UPDATE"
+
+    @abstractmethod
+    def null_safe_not_equal(self, column: str) -> str:
+        ...
+
+    @abstractmethod
+    def days_left_expr(self, column: str) -> str:
+        ...
+
+    @abstractmethod
+    def before_horizon(self, column: str) -> str:
+        """Predicate `column < today + %s days` (one placeholder)."""
+
+    @abstractmethod
+    def generated_column_ddl(self, sql_type: str, expr: str) -> str:
+        ...
+
+    # ----- schema introspection / migrations -----
+    @abstractmethod
+    def table_columns(self, cursor: Any, table: str) -> set:
+        ...
+
+    @abstractmethod
+    def index_exists(self, cursor: Any, table: str, index: str) -> bool:
+        ...
+
+    def bootstrap(self, cursor: Any) -> None:
+        """Create the base schema if this engine is responsible for it (no-op for MySQL)."""
+
+    def acquire_migration_lock(self, cursor: Any) -> None:
+        pass
+
+    def release_migration_lock(self, cursor: Any) -> None:
+        pass
+
+
+# ----------------- MySQL -----------------
+class MySQLBackend(StorageBackend):
+    name = "mysql"
+    LOCK_NAME = "harassarr_schema_migrate"
+
+    def __init__(self, host: Any = None, user: Any = None, password: Any = None, database: Any = None,
+                 port: Optional[int] = None):
+        self.params: Dict[str, Any] = {"host": host, "user": user, "password": password, "database": database}
+        if port:
+            self.params["port"] = int(port)
+
+    def connect(self) -> Any:
+        return mysql.connector.connect(**self.params)
+
+    def matches(self, host: Any, user: Any, database: Any) -> bool:
+        p = self.params
+        return (str(host or "").lower(), str(user or ""), str(database or "")) == \
+               (str(p["host"] or "").lower(), str(p["user"] or ""), str(p["database"] or ""))
+
+    def describe(self) -> str:
+        return f"mysql {self.params['host']}/{self.params['database']}"
+
+    def null_safe_not_equal(self, column: str) -> str:
+        return f"NOT ({column} <=> %s)"
+
+    def days_left_expr(self, column: str) -> str:
+        return f"DATEDIFF({column}, CURDATE())"
+
+    def before_horizon(self, column: str) -> str:
+        return f"{column} < CURDATE() + INTERVAL %s DAY"
+
+    def generated_column_ddl(self, sql_type: str, expr: str) -> str:
+        return f"{sql_type} GENERATED ALWAYS AS ({expr}) STORED"
+
+    def table_columns(self, cursor: Any, table: str) -> set:
+        cursor.execute(
+            "SELECT COLUMN_NAME FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+            (table,),
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+    def index_exists(self, cursor: Any, table: str, index: str) -> bool:
+        cursor.execute(
+            "SELECT 1 FROM information_schema.STATISTICS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s LIMIT 1",
+            (table, index),
+        )
+        return cursor.fetchone() is not None
+
+    def acquire_migration_lock(self, cursor: Any) -> None:
+        # Keeps two harassarr instances from migrating the same database at once
+        cursor.execute("SELECT GET_LOCK(%s, 30)", (self.LOCK_NAME,))
+        row = cursor.fetchone()
+        if not row or row[0] != 1:
+            raise RuntimeError("Timed out waiting for the schema migration lock")
+
+    def release_migration_lock(self, cursor: Any) -> None:
+        cursor.execute("SELECT RELEASE_LOCK(%s)", (self.LOCK_NAME,))
+        cursor.fetchone()
+
+
+# ----------------- SQLite -----------------
+# DATE columns round-trip as datetime.date, like mysql-connector returns them
+sqlite3.register_adapter(date, lambda d: d.isoformat())
+sqlite3.register_adapter(datetime, lambda d: d.isoformat(" "))
+sqlite3.register_converter("DATE", lambda b: date.fromisoformat(b.decode()))
+
+SQLITE_USERS_DDL = """
+    CREATE TABLE IF NOT EXISTS `users` (
+        `id` INTEGER PRIMARY KEY AUTOINCREMENT,
+        `primaryEmail` VARCHAR(100) DEFAULT '',
+        `secondaryEmail` VARCHAR(100) DEFAULT 'n/a',
+        `primaryDiscord` VARCHAR(100) DEFAULT '',
+        `primaryDiscordId` VARCHAR(25) DEFAULT '',
+        `secondaryDiscord` VARCHAR(100) DEFAULT 'n/a',
+        `secondaryDiscordId` VARCHAR(25) DEFAULT '',
+        `notifyDiscord` VARCHAR(10) DEFAULT 'primary',
+        `notifyEmail` VARCHAR(10) DEFAULT 'primary',
+        `status` VARCHAR(10) DEFAULT '',
+        `server` VARCHAR(25) DEFAULT '',
+        `4k` TEXT CHECK (`4k` IN ('Yes', 'No')),
+        `paymentMethod` VARCHAR(25) DEFAULT '',
+        `paymentPerson` VARCHAR(25) DEFAULT '',
+        `paidAmount` DECIMAL(10, 2) DEFAULT NULL,
+        `joinDate` DATE DEFAULT CURRENT_DATE,
+        `startDate` DATE DEFAULT CURRENT_DATE,
+        `endDate` DATE DEFAULT NULL
+    )
+"""
+
+
+def _qmark(query: str) -> str:
+    return query.replace("%s", "?")
+
+
+class _SQLiteCursor:
+    def __init__(self, cursor: sqlite3.Cursor, dictionary: bool):
+        self._cur = cursor
+        self._dictionary = dictionary
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return dict(zip((d[0] for d in self._cur.description), row))
+
+    def execute(self, query: str, params: Sequence = ()) -> None:
+        self._cur.execute(_qmark(query), tuple(params or ()))
+
+    def executemany(self, query: str, seq_params: Iterable[Sequence]) -> None:
+        self._cur.executemany(_qmark(query), seq_params)
+
+    def fetchone(self):
+        return self._row(self._cur.fetchone())
+
+    def fetchmany(self, size: int):
+        return [self._row(r) for r in self._cur.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._row(r) for r in self._cur.fetchall()]
+
+    @property
+    def rowcount(self) -> int:
+        return self._cur.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cur.lastrowid
+
+    def close(self) -> None:
+        self._cur.close()
+
+
+class _SQLiteConnection:
+    """sqlite3 connection dressed up with the bits of the mysql-connector API dbFunctions relies on."""
+    def __init__(self, raw: sqlite3.Connection):
+        self._raw = raw
+
+    def cursor(self, dictionary: bool = False, buffered: Any = None, **_):
+        return _SQLiteCursor(self._raw.cursor(), dictionary)
+
+    def commit(self) -> None:
+        self._raw.commit()
+
+    def rollback(self) -> None:
+        self._raw.rollback()
+
+    def close(self) -> None:
+        self._raw.close()
+
+    def ping(self, reconnect: bool = False, attempts: int = 1, delay: int = 0) -> None:
+        self._raw.execute("SELECT 1").fetchone()
+
+    def is_connected(self) -> bool:
+        try:
+            self.ping()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def consume_results(self) -> None:
+        pass  # sqlite cursors hold no unread wire results
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Embedded, in-process storage for single-box installs.
+    - WAL journal so readers never block the daily writer
+    - sqlite3's per-connection statement cache keeps every parameterized query prepared
+    """
+    name = "sqlite"
+    insert_ignore = "INSERT OR IGNORE"
+    for_update = ""  # the write transaction already serializes writers
+    STATEMENT_CACHE = 256
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def connect(self) -> Any:
+        folder = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(folder, exist_ok=True)
+        raw = sqlite3.connect(
+            self.path,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            cached_statements=self.STATEMENT_CACHE,
+            check_same_thread=False,  # the run's pool hands a connection to one borrower at a time
+            timeout=30,
+        )
+        raw.execute("PRAGMA journal_mode=WAL")
+        raw.execute("PRAGMA synchronous=NORMAL")
+        return _SQLiteConnection(raw)
+
+    def matches(self, host: Any, user: Any, database: Any) -> bool:
+        return True  # one file; legacy host/user/database arguments do not apply
+
+    def describe(self) -> str:
+        return f"sqlite {self.path}"
+
+    def null_safe_not_equal(self, column: str) -> str:
+        return f"{column} IS NOT %s"
+
+    def days_left_expr(self, column: str) -> str:
+        return f"CAST(julianday({column}) - julianday(date('now', 'localtime')) AS INTEGER)"
+
+    def before_horizon(self, column: str) -> str:
+        return f"{column} < date('now', 'localtime', '+' || %s || ' days')"
+
+    def generated_column_ddl(self, sql_type: str, expr: str) -> str:
+        # ALTER TABLE can only add VIRTUAL generated columns in SQLite; they are still indexable
+        return f"{sql_type} GENERATED ALWAYS AS ({expr}) VIRTUAL"
+
+    def table_columns(self, cursor: Any, table: str) -> set:
+        cursor.execute(f"PRAGMA table_xinfo(`{table}`)")
+        return {row[1] for row in cursor.fetchall()}
+
+    def index_exists(self, cursor: Any, table: str, index: str) -> bool:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND tbl_name = %s AND name = %s",
+                       (table, index))
+        return cursor.fetchone() is not None
+
+    def bootstrap(self, cursor: Any) -> None:
+        cursor.execute(SQLITE_USERS_DDL)
+
+
+# ----------------- selection -----------------
+def engine_of(dbConfig: Dict[str, Any]) -> str:
+    return str((dbConfig or {}).get("engine") or "mysql").strip().lower()
+
+
+def from_config(dbConfig: Dict[str, Any]) -> StorageBackend:
+    """
+    Build the backend selected by `database.engine` in config.yml:
+      engine: mysql   (default) -> host/port/user/password/database
+      engine: sqlite            -> path (default /config/harassarr.db)
+    """
+    engine = engine_of(dbConfig)
+    if engine == "sqlite":
+        return SQLiteBackend(dbConfig.get("path") or DEFAULT_SQLITE_PATH)
+    if engine == "mysql":
+        return MySQLBackend(
+            host=dbConfig["host"], user=dbConfig["user"], password=dbConfig["password"],
+            database=dbConfig["database"], port=dbConfig.get("port"),
+        )
+    raise ValueError(f"Unsupported database engine '{engine}' (expected 'mysql' or 'sqlite')")
+
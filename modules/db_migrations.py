@@ -0,0 +1,96 @@
+# modules/db_migrations.py
+from __future__ import annotations
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, List
+
+from modules import db_backend
+
+VERSION_TABLE = "schema_version"
+
+
+# ----------------- idempotent DDL helpers -----------------
+def _add_generated_column(cursor: Any, backend: db_backend.StorageBackend,
+                          table: str, column: str, sql_type: str, expr: str) -> None:
+    if column in backend.table_columns(cursor, table):
+        return
+    cursor.execute(f"ALTER TABLE `{table}` ADD COLUMN `{column}` {backend.generated_column_ddl(sql_type, expr)}")
+    logging.info("Schema: added column %s.%s", table, column)
+
+
+def _add_index(cursor: Any, backend: db_backend.StorageBackend, table: str, index: str, columns: str) -> None:
+    if backend.index_exists(cursor, table, index):
+        return
+    cursor.execute(f"CREATE INDEX `{index}` ON `{table}` ({columns})")
+    logging.info("Schema: added index %s on %s(%s)", index, table, columns)
+
+
+# ----------------- migrations -----------------
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    apply: Callable[[Any, db_backend.StorageBackend], None]  # (cursor, backend); every step must be safe to re-run
+
+
+def _v1_lookup_indexes(cursor: Any, backend: db_backend.StorageBackend) -> None:
+    # Normalized copies of the lookup keys so LOWER()/TRIM() matches can use an index
+    _add_generated_column(cursor, backend, "users", "primaryEmailNorm", "VARCHAR(100)", "LOWER(TRIM(`primaryEmail`))")
+    _add_generated_column(cursor, backend, "users", "serverNorm", "VARCHAR(25)", "LOWER(TRIM(`server`))")
+    _add_index(cursor, backend, "users", "idx_users_server_email", "`serverNorm`, `primaryEmailNorm`")
+    _add_index(cursor, backend, "users", "idx_users_status_server", "`status`, `server`")
+    _add_index(cursor, backend, "users", "idx_users_status_enddate", "`status`, `endDate`")
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "normalized email/server columns and lookup indexes", _v1_lookup_indexes),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+# ----------------- runner -----------------
+def current_version(cursor: Any) -> int:
+    cursor.execute(f"SELECT COALESCE(MAX(version), 0) FROM `{VERSION_TABLE}`")
+    row = cursor.fetchone()
+    return int(row[0] or 0) if row else 0
+
+
+def apply_pending(cnx: Any, backend: db_backend.StorageBackend) -> int:
+    """
+    Bring the connected database up to LATEST_VERSION and return the resulting version.
+    Versions are recorded in `schema_version`; steps are idempotent, so a run that died
+    half-way simply re-applies the unfinished migration. The backend's migration lock
+    keeps two harassarr instances from migrating at the same time.
+    """
+    cursor = cnx.cursor()
+    try:
+        backend.acquire_migration_lock(cursor)
+        try:
+            backend.bootstrap(cursor)
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS `{VERSION_TABLE}` ("
+                "`version` INT NOT NULL PRIMARY KEY, "
+                "`description` VARCHAR(255) NULL, "
+                "`appliedAt` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+            )
+            version = current_version(cursor)
+
+            for m in MIGRATIONS:
+                if m.version <= version:
+                    continue
+                logging.info("Schema: applying migration %d (%s)", m.version, m.description)
+                m.apply(cursor, backend)
+                cursor.execute(
+                    f"{backend.insert_ignore} INTO `{VERSION_TABLE}` (version, description) VALUES (%s, %s)",
+                    (m.version, m.description),
+                )
+                cnx.commit()
+                version = m.version
+
+            cnx.commit()
+            return version
+        finally:
+            backend.release_migration_lock(cursor)
+    finally:
+        cursor.close()
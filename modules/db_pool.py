@@ -0,0 +1,147 @@
+# modules/db_pool.py
+from __future__ import annotations
+import contextlib
+import logging
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from modules import db_backend
+
+DEFAULT_POOL_SIZE = 5
+DEFAULT_BORROW_TIMEOUT = 30.0
+
+
+class ConnectionPool:
+    """
+    Small run-scoped connection pool.
+    - Connections are created lazily, up to `size`
+    - Each borrow is health-checked (ping + reconnect) before it is handed out
+    - close() drains and closes every idle connection
+    """
+    def __init__(self, factory: Callable[[], Any], size: int = DEFAULT_POOL_SIZE,
+                 borrow_timeout: float = DEFAULT_BORROW_TIMEOUT):
+        self._factory = factory
+        self._size = max(1, int(size))
+        self._borrow_timeout = borrow_timeout
+        self._idle: "queue.LifoQueue[Any]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def _healthy(self, cnx: Any) -> bool:
+        try:
+            cnx.ping(reconnect=True, attempts=2, delay=0)
+            return True
+        except Exception as e:  # noqa: BLE001
+            logging.warning("DB pool: dropping unhealthy connection: %s", e)
+            with contextlib.suppress(Exception):
+                cnx.close()
+            return False
+
+    def _take(self) -> Any:
+        while True:
+            try:
+                cnx = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    if self._created < self._size:
+                        self._created += 1
+                        break
+                try:
+                    cnx = self._idle.get(timeout=self._borrow_timeout)
+                except queue.Empty:
+                    raise RuntimeError(f"DB pool exhausted (size={self._size})") from None
+            if self._healthy(cnx):
+                return cnx
+            with self._lock:
+                self._created -= 1
+
+        try:
+            return self._factory()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def _give_back(self, cnx: Any) -> None:
+        if self._closed:
+            with contextlib.suppress(Exception):
+                cnx.close()
+            return
+        with contextlib.suppress(Exception):
+            cnx.rollback()  # never leak an open transaction to the next borrower
+        self._idle.put(cnx)
+
+    def adopt(self, cnx: Any) -> bool:
+        """Hand an already-open connection to the pool (e.g. from preflight)."""
+        with self._lock:
+            if self._closed or self._created >= self._size:
+                return False
+            self._created += 1
+        self._idle.put(cnx)
+        return True
+
+    @contextlib.contextmanager
+    def connection(self) -> Iterator[Any]:
+        if self._closed:
+            raise RuntimeError("DB pool is closed")
+        cnx = self._take()
+        try:
+            yield cnx
+        finally:
+            self._give_back(cnx)
+
+    def close(self) -> None:
+        self._closed = True
+        closed = 0
+        while True:
+            try:
+                cnx = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            with contextlib.suppress(Exception):
+                cnx.close()
+            closed += 1
+        logging.info("DB pool closed (%d connection(s) released).", closed)
+
+
+# ----------------- run-scoped pool -----------------
+_pool: Optional[ConnectionPool] = None
+_backend: Optional[db_backend.StorageBackend] = None
+
+
+def open_pool(dbConfig: Dict[str, Any]) -> ConnectionPool:
+    """
+    Open the run-scoped pool for the backend selected in the `database` section of config.yml.
+    Optional key: poolSize (default 5).
+    """
+    global _pool, _backend
+    close_pool()
+
+    backend = db_backend.from_config(dbConfig)
+    size = int(dbConfig.get("poolSize") or DEFAULT_POOL_SIZE)
+    _pool = ConnectionPool(backend.connect, size=size)
+    _backend = backend
+    logging.info("DB pool opened (size=%d) for %s.", size, backend.describe())
+    return _pool
+
+
+def close_pool() -> None:
+    global _pool, _backend
+    if _pool is not None:
+        _pool.close()
+    _pool = None
+    _backend = None
+
+
+def active_pool() -> Optional[ConnectionPool]:
+    return _pool
+
+
+def active_backend() -> Optional[db_backend.StorageBackend]:
+    return _backend
@@ -2,39 +2,16 @@
 from __future__ import annotations
 
 import asyncio
-import json
 import logging
-from pathlib import Path
 from typing import Iterable, Awaitable, Callable
 
 import discord
 
-from modules import configFunctions
-
-RUN_CACHE = Path("./run_cache.json")
-
-
-# ----------------- small run cache for DM-blocked flags -----------------
-def _load_cache() -> dict:
-    try:
-        if RUN_CACHE.exists():
-            return json.loads(RUN_CACHE.read_text(encoding="utf-8"))
-    except Exception:
-        pass
-    return {}
-
-def _save_cache(d: dict) -> None:
-    try:
-        RUN_CACHE.write_text(json.dumps(d, indent=2), encoding="utf-8")
-    except Exception:
-        pass
-
-def _mark_dm_blocked(user_id: str) -> None:
-    d = _load_cache()
-    dm = d.get("dm_blocked", {})
-    dm[str(user_id)] = True
-    d["dm_blocked"] = dm
-    _save_cache(d)
+from modules import configFunctions, discord_dispatch, discord_guild, discord_roles, discord_session
+from modules import snapshot as run_snapshot
+from modules.discord_dispatch import DMOutcome, DMRequest
+from modules.discord_guild import RoleRef
+from modules.discord_roles import RevokeResult, RoleRevocation
 
 
 # ----------------- config helpers -----------------
@@ -48,6 +25,7 @@ def _discord_cfg(configFile: str) -> dict:
         "reminderBody": d.get("reminderBody"),
         "removalSubject": d.get("removalSubject"),
         "removalBody": d.get("removalBody"),
+        "roleConcurrency": d.get("roleConcurrency") or discord_roles.DEFAULT_CONCURRENCY,
     }
 
 
@@ -72,9 +50,18 @@ class _Runner(discord.Client):
 
 def _run_client(token: str, intents: discord.Intents, runner: Callable[[discord.Client], Awaitable[None]]) -> None:
     """
-    Start a short-lived discord.py client, run `runner(client)` after ready,
-    then return. We set reconnect=False to avoid close-races.
+    Run `runner(client)` on the run's Discord session when one is open (one login for
+    every DM and role call). Otherwise start a short-lived discord.py client, run it
+    after ready, then return. We set reconnect=False to avoid close-races.
     """
+    session = discord_session.active_session(token)
+    if session is not None:
+        try:
+            session.submit(runner)
+        except Exception as e:
+            logging.error("Discord runner error: %s", e)
+        return
+
     async def main():
         client = _Runner(intents=intents, runner=runner)
         await client.start(token, reconnect=False)
@@ -105,6 +92,37 @@ def _ctx(primaryEmail: str, daysLeft: int, fourk: str, streamCount: int,
     }
 
 
+# ----------------- DM delivery -----------------
+def _log_outcomes(outcomes: Iterable[DMOutcome]) -> None:
+    for o in outcomes:
+        uid, what = o.request.discord_id, ("removal DM" if o.request.kind == "removal" else "DM")
+        if o.skipped:
+            logging.info("Discord: skipping DM to user_id=%s (DMs disabled; not due for a re-probe).", uid)
+        elif o.blocked:
+            logging.warning("Discord: DMs disabled for user_id=%s (50007).", uid)
+        elif not o.sent:
+            logging.error("Discord error sending %s to %s: %s", what, uid, o.error)
+
+
+def _deliver(token: str, requests: list[DMRequest]) -> None:
+    """Queue onto the run's outbox (sent by flushDMs), or send right away outside a run."""
+    if not requests or discord_dispatch.queue(token, requests):
+        return
+    opts = discord_dispatch.settings()
+    try:
+        outcomes = discord_dispatch.send_now(token, requests, opts["concurrency"], opts["retries"])
+    except Exception as e:
+        logging.error("Discord runner error: %s", e)
+        return
+    discord_dispatch.record(outcomes, run_snapshot.active_log())
+    _log_outcomes(outcomes)
+
+
+def flushDMs() -> None:
+    """Send every DM the checks queued this run as one concurrent wave."""
+    _log_outcomes(discord_dispatch.flush(snapshot=run_snapshot.active_log()))
+
+
 # ----------------- public API -----------------
 def sendDiscordSubscriptionReminder(
     configFile: str,
@@ -137,27 +155,7 @@ def sendDiscordSubscriptionReminder(
         logging.info("[DRY-RUN] Would DM Discord IDs %s for %s (daysLeft=%s)", toDiscordIds, primaryEmail, daysLeft)
         return
 
-    intents = discord.Intents.none()  # minimal intents for DMs
-
-    async def runner(client: discord.Client):
-        for uid in toDiscordIds:
-            if not uid:
-                continue
-            try:
-                user = await client.fetch_user(int(uid))
-                dm = await user.create_dm()
-                await dm.send(content)
-            except discord.Forbidden as e:
-                # code 50007: "Cannot send messages to this user"
-                if getattr(e, "code", None) == 50007 or "Cannot send messages to this user" in str(e):
-                    logging.warning("Discord: DMs disabled for user_id=%s (50007).", uid)
-                    _mark_dm_blocked(str(uid))
-                else:
-                    logging.error("Discord Forbidden sending DM to %s: %s", uid, e)
-            except Exception as e:
-                logging.error("Discord error sending DM to %s: %s", uid, e)
-
-    _run_client(token, intents, runner)
+    _deliver(token, [DMRequest(str(uid), content, primaryEmail, daysLeft) for uid in toDiscordIds if uid])
 
 
 def sendSubscriptionRemoved(
@@ -191,82 +189,58 @@ def sendSubscriptionRemoved(
         logging.info("[DRY-RUN] Would DM (removal) Discord IDs %s for %s", toDiscordIds, primaryEmail)
         return
 
-    intents = discord.Intents.none()
+    _deliver(token, [DMRequest(str(uid), content, primaryEmail, daysLeft, kind="removal")
+                     for uid in toDiscordIds if uid])
 
-    async def runner(client: discord.Client):
-        for uid in toDiscordIds:
-            if not uid:
-                continue
-            try:
-                user = await client.fetch_user(int(uid))
-                dm = await user.create_dm()
-                await dm.send(content)
-            except discord.Forbidden as e:
-                if getattr(e, "code", None) == 50007 or "Cannot send messages to this user" in str(e):
-                    logging.warning("Discord: DMs disabled for user_id=%s (50007).", uid)
-                    _mark_dm_blocked(str(uid))
-                else:
-                    logging.error("Discord Forbidden sending removal DM to %s: %s", uid, e)
-            except Exception as e:
-                logging.error("Discord error sending removal DM to %s: %s", uid, e)
-
-    _run_client(token, intents, runner)
 
+def removeRoles(configFile: str, revocations: Iterable[RoleRevocation], dryrun: bool = False,
+                members: dict[str, discord.Member] | None = None) -> list[RevokeResult]:
+    """
+    Revoke every (member, role) pair in one Discord session with bounded concurrency.
+    Reuses the Member objects the audit already fetched (`members`, or the run's guild map).
+    """
+    revocations = [r for r in revocations if r.member_id]
+    if not revocations:
+        return []
 
-def removeRole(configFile: str, discordId: str, role_name: str, dryrun: bool = False) -> None:
     cfg = _discord_cfg(configFile)
     token = cfg.get("token")
     guild_id = cfg.get("guild_id")
     if not token or not guild_id:
         logging.error("Discord token/guildId missing; cannot remove roles.")
-        return
+        return []
 
     if dryrun:
-        logging.info("[DRY-RUN] Would remove role '%s' from member %s", role_name, discordId)
-        return
-
-    intents = discord.Intents.none()
-    intents.guilds = True
-    intents.members = True  # requires "Server Members Intent" enabled
-
-    async def runner(client: discord.Client):
-        try:
-            guild = client.get_guild(int(guild_id)) or await client.fetch_guild(int(guild_id))
-            if not guild:
-                logging.error("Discord: bot not in guild %s", guild_id)
-                return
+        for r in revocations:
+            logging.info("[DRY-RUN] Would remove role '%s' from member %s", r.role, r.member_id)
+        return []
 
-            try:
-                roles = await guild.fetch_roles()
-            except AttributeError:
-                roles = getattr(guild, "roles", [])
-            target = next((r for r in roles if r.name.lower() == role_name.lower()), None)
-            if not target:
-                logging.warning("Discord: role '%s' not found in guild %s", role_name, guild_id)
-                return
-
-            try:
-                member = await guild.fetch_member(int(discordId))
-            except Exception:
-                member = guild.get_member(int(discordId))
-            if not member:
-                logging.warning("Discord: member %s not found in guild %s", discordId, guild_id)
-                return
+    try:
+        results = discord_roles.revoke_now(token, int(guild_id), revocations,
+                                           role_map=discord_guild.cached_role_map(int(guild_id)),
+                                           members=members, concurrency=cfg["roleConcurrency"])
+    except Exception as e:
+        logging.error("Discord error removing roles: %s", e)
+        return [RevokeResult(r, "failed", error=str(e)) for r in revocations]
 
-            await member.remove_roles(target, reason="Harassarr: inactive user cleanup")
-            logging.info("Removed role '%s' from member %s", role_name, discordId)
+    for res in results:
+        r = res.revocation
+        if res.outcome == "removed":
+            logging.info("Removed role '%s' from member %s", r.role, r.member_id)
+        elif res.outcome == "not_member":
+            logging.warning("Discord: member %s not found in guild %s", r.member_id, guild_id)
+        elif res.outcome == "failed":
+            logging.error("Discord error removing role '%s' from %s: %s", r.role, r.member_id, res.error)
+    return results
 
-        except discord.Forbidden as e:
-            logging.error("Discord Forbidden removing role '%s' from %s: %s", role_name, discordId, e)
-        except Exception as e:
-            logging.error("Discord error removing role '%s' from %s: %s", role_name, discordId, e)
 
-    _run_client(token, intents, runner)
+def removeRole(configFile: str, discordId: str, role: RoleRef, dryrun: bool = False) -> None:
+    removeRoles(configFile, [RoleRevocation(str(discordId), role)], dryrun=dryrun)
 
 
-def members_having_role(configFile: str, role_name: str, ids: Iterable[str]) -> set[str]:
+def members_having_role(configFile: str, role: RoleRef, ids: Iterable[str]) -> set[str]:
     """
-    Return subset of `ids` that currently have role_name in the configured guild.
+    Return subset of `ids` that currently have `role` (a role ID or name) in the configured guild.
     """
     cfg = _discord_cfg(configFile)
     token = cfg.get("token")
@@ -279,6 +253,11 @@ def members_having_role(configFile: str, role_name: str, ids: Iterable[str]) ->
     if not ids:
         return set()
 
+    # Answer from the run's guild member map when the member list can be paged
+    role_map = discord_guild.role_map_for(token, int(guild_id))
+    if role_map is not None:
+        return role_map.ids_with_role(role, ids)
+
     intents = discord.Intents.none()
     intents.guilds = True
     intents.members = True
@@ -287,27 +266,19 @@ def members_having_role(configFile: str, role_name: str, ids: Iterable[str]) ->
 
     async def runner(client: discord.Client):
         try:
-            guild = client.get_guild(int(guild_id)) or await client.fetch_guild(int(guild_id))
-            if not guild:
-                logging.error("Discord: bot not in guild %s", guild_id)
-                return
-
-            try:
-                roles = await guild.fetch_roles()
-            except AttributeError:
-                roles = getattr(guild, "roles", [])
-            target = next((r for r in roles if r.name.lower() == role_name.lower()), None)
-            if not target:
-                logging.warning("Discord: role '%s' not found in guild %s", role_name, guild_id)
+            meta = await discord_guild.guild_meta(client, int(guild_id))
+            target = meta.role_id(role)
+            if target is None:
+                logging.warning("Discord: role '%s' not found in guild %s", role, guild_id)
                 return
 
             for sid in ids:
                 member = None
                 try:
-                    member = await guild.fetch_member(int(sid))
+                    member = await meta.guild.fetch_member(int(sid))
                 except Exception:
-                    member = guild.get_member(int(sid))
-                if member and any(r.id == target.id for r in getattr(member, "roles", [])):
+                    member = meta.guild.get_member(int(sid))
+                if member and any(r.id == target for r in getattr(member, "roles", [])):
                     have.add(sid)
         except Exception as e:
             logging.error("Discord role-audit error: %s", e)
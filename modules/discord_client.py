@@ -7,25 +7,25 @@ from typing import Optional
 
 import discord
 
+from modules import discord_state
+
 
 class DiscordDMClient:
     """
     One client per run. Cleanly connects and closes.
-    Sends DMs; if the user has DMs disabled (50007), we just log and move on.
+    - REST only: logs in over HTTP and never opens the gateway, so there is no on_ready wait
+    - Sends DMs; if the user has DMs disabled (50007), we just log and move on
     """
     _instance: Optional["DiscordDMClient"] = None
 
     def __init__(self, token: str, logger: logging.Logger):
-        intents = discord.Intents.none()  # we only need DMs
+        intents = discord.Intents.none()  # no gateway; REST calls only
+        # discord.py refuses Guild.fetch_members without this flag, even over REST
+        # (the bot also needs the Server Members Intent enabled in the developer portal)
+        intents.members = True
         self._client = discord.Client(intents=intents)
         self._token = token
         self._logger = logger
-        self._ready = asyncio.Event()
-
-        @self._client.event
-        async def on_ready():
-            self._logger.info("Discord connected as %s", self._client.user)
-            self._ready.set()
 
     @classmethod
     def instance(cls, token: str, logger: logging.Logger) -> "DiscordDMClient":
@@ -33,9 +33,13 @@ class DiscordDMClient:
             cls._instance = cls(token, logger)
         return cls._instance
 
+    @property
+    def client(self) -> discord.Client:
+        return self._client
+
     async def __aenter__(self) -> "DiscordDMClient":
-        asyncio.create_task(self._client.start(self._token))
-        await asyncio.wait_for(self._ready.wait(), timeout=30)
+        await asyncio.wait_for(self._client.login(self._token), timeout=30)
+        self._logger.info("Discord logged in as %s", self._client.user)
         return self
 
     async def __aexit__(self, exc_type, exc, tb):
@@ -45,9 +49,11 @@ class DiscordDMClient:
 
     async def send_dm(self, discord_user_id: int, content: str) -> bool:
         try:
-            user = await self._client.fetch_user(int(discord_user_id))
-            await user.send(content)
+            await discord_state.send_dm(self._client, discord_user_id, content)
             return True
+        except discord_state.DMBlocked:
+            self._logger.info("DM skipped for %s: DMs disabled, re-probe not due yet", discord_user_id)
+            return False
         except discord.errors.Forbidden as e:
             # (50007) Cannot send messages to this user
             self._logger.warning("DM blocked for %s: %s", discord_user_id, e)
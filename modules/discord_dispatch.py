@@ -0,0 +1,165 @@
+# modules/discord_dispatch.py
+from __future__ import annotations
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+import discord
+
+from modules import discord_session, discord_state
+from modules.snapshot import SnapshotLog
+from modules.util_retry import with_retries
+
+DEFAULT_CONCURRENCY = 5
+DEFAULT_RETRIES = 3
+
+
+@dataclass
+class DMRequest:
+    discord_id: str
+    content: str
+    email: Optional[str] = None       # whose subscription the DM is about (for the run log)
+    days_left: Optional[int] = None
+    kind: str = "reminder"            # reminder | removal
+
+
+@dataclass
+class DMOutcome:
+    request: DMRequest
+    sent: bool = False
+    blocked: bool = False             # 50007: the user doesn't accept DMs from the bot
+    skipped: bool = False             # already known DM-blocked; no API call made
+    attempts: int = 0
+    error: Optional[str] = None
+
+
+async def dispatch(client: discord.Client, requests: Iterable[DMRequest],
+                   concurrency: int = DEFAULT_CONCURRENCY, retries: int = DEFAULT_RETRIES) -> List[DMOutcome]:
+    """
+    Send every DM concurrently, at most `concurrency` in flight.
+    All requests share the client's HTTP layer, so discord.py's per-route and global
+    rate-limit buckets pace them; a 429 or 5xx that still escapes is retried by with_retries
+    (honoring retry_after). Outcomes come back in request order.
+    """
+    requests = list(requests)
+    if not requests:
+        return []
+    sem = asyncio.Semaphore(max(1, int(concurrency)))
+
+    async def one(req: DMRequest) -> DMOutcome:
+        outcome = DMOutcome(request=req)
+
+        async def send() -> None:
+            outcome.attempts += 1
+            await discord_state.send_dm(client, req.discord_id, req.content)
+
+        async with sem:
+            try:
+                await with_retries(send, retries=retries)
+                outcome.sent = True
+            except discord_state.DMBlocked:
+                outcome.blocked = outcome.skipped = True
+                outcome.attempts = 0
+            except discord.Forbidden as e:
+                outcome.blocked = discord_state.is_dm_blocked_error(e)
+                outcome.error = str(e)
+            except Exception as e:  # noqa: BLE001
+                outcome.error = str(e) or e.__class__.__name__
+        return outcome
+
+    start = time.monotonic()
+    outcomes = await asyncio.gather(*(one(r) for r in requests))
+    logging.info("Discord: dispatched %d DM(s) in %.1fs (%d sent, %d blocked, %d skipped as blocked, %d failed).",
+                 len(outcomes), time.monotonic() - start, sum(o.sent for o in outcomes),
+                 sum(o.blocked and not o.skipped for o in outcomes), sum(o.skipped for o in outcomes),
+                 sum(1 for o in outcomes if not o.sent and not o.blocked))
+    return list(outcomes)
+
+
+def record(outcomes: Iterable[DMOutcome], snapshot: Optional[SnapshotLog]) -> None:
+    """One event per recipient in the run's SnapshotLog; known DM-blocked users count as skipped."""
+    if snapshot is None:
+        return
+    for o in outcomes:
+        snapshot.add(user_id=o.request.discord_id, email=o.request.email, days_left=o.request.days_left,
+                     dm_attempted=not o.skipped, dm_sent=o.sent,
+                     skipped_reason="dm_blocked" if o.skipped else None)
+
+
+def send_now(token: str, requests: List[DMRequest], concurrency: int = DEFAULT_CONCURRENCY,
+             retries: int = DEFAULT_RETRIES) -> List[DMOutcome]:
+    """Dispatch through the run's Discord session, or a one-off login outside a run."""
+    session = discord_session.active_session(token)
+    if session is not None:
+        return session.submit(lambda client: dispatch(client, requests, concurrency, retries))
+
+    async def main() -> List[DMOutcome]:
+        client = discord.Client(intents=discord.Intents.none())
+        try:
+            await client.login(token)
+            return await dispatch(client, requests, concurrency, retries)
+        finally:
+            try:
+                await client.close()
+            except Exception:
+                pass
+
+    return asyncio.run(main())
+
+
+# ----------------- run-scoped outbox -----------------
+# The checks queue DMs as they go; flush() sends the whole wave at once
+_outbox: Optional[Dict[str, List[DMRequest]]] = None  # token -> queued DMs
+_settings = {"concurrency": DEFAULT_CONCURRENCY, "retries": DEFAULT_RETRIES}
+_lock = threading.Lock()
+
+
+def open_outbox(concurrency: Optional[int] = None, retries: Optional[int] = None) -> None:
+    global _outbox
+    with _lock:
+        _outbox = {}
+        _settings["concurrency"] = concurrency or DEFAULT_CONCURRENCY
+        _settings["retries"] = DEFAULT_RETRIES if retries is None else retries
+
+
+def close_outbox() -> None:
+    global _outbox
+    with _lock:
+        pending = sum(len(v) for v in (_outbox or {}).values())
+        _outbox = None
+    if pending:
+        logging.warning("Discord: %d queued DM(s) were never sent.", pending)
+
+
+def settings() -> Dict[str, int]:
+    return dict(_settings)
+
+
+def queue(token: str, requests: Iterable[DMRequest]) -> bool:
+    """Add DMs to the run's outbox; False when no outbox is open (send them now instead)."""
+    with _lock:
+        if _outbox is None:
+            return False
+        _outbox.setdefault(token, []).extend(requests)
+        return True
+
+
+def flush(snapshot: Optional[SnapshotLog] = None) -> List[DMOutcome]:
+    """Send everything queued so far, one concurrent wave per bot token."""
+    with _lock:
+        batches = dict(_outbox or {})
+        if _outbox is not None:
+            _outbox.clear()
+    outcomes: List[DMOutcome] = []
+    for token, requests in batches.items():
+        try:
+            sent = send_now(token, requests, _settings["concurrency"], _settings["retries"])
+        except Exception as e:  # noqa: BLE001
+            logging.error("Discord: DM dispatch failed: %s", e)
+            sent = [DMOutcome(request=r, error=str(e)) for r in requests]
+        outcomes.extend(sent)
+    record(outcomes, snapshot)
+    return outcomes
@@ -6,6 +6,8 @@ from typing import Optional
 
 import discord
 
+from modules import discord_state
+
 
 class DiscordDM:
     """
@@ -36,9 +38,11 @@ class DiscordDM:
 
     async def send_dm(self, discord_user_id: int, content: str) -> bool:
         try:
-            user = await self._client.fetch_user(int(discord_user_id))
-            await user.send(content)
+            await discord_state.send_dm(self._client, discord_user_id, content)
             return True
+        except discord_state.DMBlocked:
+            self._logger.info("DM skipped for %s: DMs disabled, re-probe not due yet", discord_user_id)
+            return False
         except discord.errors.Forbidden as e:
             # 50007: Cannot send messages to this user (DMs disabled)
             self._logger.warning("DM blocked for %s: %s", discord_user_id, e)
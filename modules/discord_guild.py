@@ -0,0 +1,181 @@
+# modules/discord_guild.py
+from __future__ import annotations
+import asyncio
+import logging
+import threading
+from typing import Dict, FrozenSet, Iterable, Optional, Union
+
+import discord
+
+from modules import discord_session
+
+
+RoleRef = Union[int, str]  # a role ID from `roleId`, or a role name from `role`
+
+
+def normalize_role(name: str) -> str:
+    """Role names compare case-insensitively with runs of whitespace collapsed."""
+    return " ".join((name or "").split()).casefold()
+
+
+def role_ref(plexConf: dict) -> Optional[RoleRef]:
+    """A PLEX block's role: its `roleId` when configured (no name lookup at all), else its `role` name."""
+    rid = plexConf.get("roleId")
+    if rid not in (None, ""):
+        try:
+            return int(rid)
+        except (TypeError, ValueError):
+            logging.warning("Discord: roleId %r in PLEX block '%s' is not an integer; using role name.",
+                            rid, plexConf.get("serverName"))
+    return plexConf.get("role") or None
+
+
+class GuildMeta:
+    """The guild and its roles, fetched once per run; maps normalized role names to role IDs."""
+    def __init__(self, client: discord.Client, guild: discord.Guild, roles: Iterable[discord.Role]):
+        self.client = client           # the guild object is only usable through this client
+        self.guild = guild
+        self._roles = {normalize_role(r.name): r.id for r in roles}
+
+    def role_id(self, role: Optional[RoleRef]) -> Optional[int]:
+        if isinstance(role, int):
+            return role
+        return self._roles.get(normalize_role(role))
+
+
+class GuildRoleMap:
+    """
+    Every guild member's role IDs, fetched once by paging the member list (1000 per request).
+    Role audits for all PLEX- blocks are answered from memory instead of one fetch_member each,
+    and the fetched Member objects are kept so role removals don't fetch them again.
+    """
+    def __init__(self, meta: GuildMeta, members: Dict[str, FrozenSet[int]],
+                 objects: Optional[Dict[str, discord.Member]] = None):
+        self.meta = meta
+        self.guild_id = meta.guild.id
+        self._members = members        # member id (str) -> role ids
+        self._objects = objects or {}  # member id (str) -> Member from the paged fetch
+
+    def role_id(self, role: Optional[RoleRef]) -> Optional[int]:
+        return self.meta.role_id(role)
+
+    def ids_with_role(self, role: RoleRef, ids: Iterable[str]) -> set[str]:
+        target = self.role_id(role)
+        if target is None:
+            logging.warning("Discord: role '%s' not found in guild %s", role, self.guild_id)
+            return set()
+        return {sid for sid in ids if target in self._members.get(str(sid), ())}
+
+    def member(self, member_id: str) -> Optional[discord.Member]:
+        return self._objects.get(str(member_id))
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+
+async def fetch_meta(client: discord.Client, guild_id: int) -> GuildMeta:
+    guild = await client.fetch_guild(guild_id)
+    return GuildMeta(client, guild, await guild.fetch_roles())
+
+
+async def guild_meta(client: discord.Client, guild_id: int) -> GuildMeta:
+    """
+    The guild and its roles for this run, fetched on first use (fetch_guild + fetch_roles)
+    and shared by every role audit and removal on the same client. Fetched fresh outside a run.
+    """
+    with _meta_lock:
+        meta = _metas.get(guild_id) if _metas is not None else None
+    if meta is not None and meta.client is client:
+        return meta
+    meta = await fetch_meta(client, guild_id)
+    with _meta_lock:
+        if _metas is not None:
+            _metas[guild_id] = meta
+    return meta
+
+
+async def fetch_role_map(client: discord.Client, guild_id: int, keep_members: bool = True) -> GuildRoleMap:
+    """
+    REST only: paged fetch_members on the run's guild metadata (needs the Server Members Intent enabled).
+    keep_members=False drops the Member objects (they're useless once their client is closed).
+    """
+    meta = await guild_meta(client, guild_id)
+    members: Dict[str, FrozenSet[int]] = {}
+    objects: Dict[str, discord.Member] = {}
+    async for m in meta.guild.fetch_members(limit=None):
+        members[str(m.id)] = frozenset(r.id for r in m.roles)
+        if keep_members:
+            objects[str(m.id)] = m
+    return GuildRoleMap(meta, members, objects)
+
+
+async def _fetch_role_map_once(token: str, guild_id: int) -> GuildRoleMap:
+    intents = discord.Intents.none()
+    intents.members = True  # required by Guild.fetch_members
+    client = discord.Client(intents=intents)
+    try:
+        await client.login(token)
+        return await fetch_role_map(client, guild_id, keep_members=False)
+    finally:
+        try:
+            await client.close()
+        except Exception:
+            pass
+
+
+# ----------------- run-scoped cache -----------------
+_maps: Optional[Dict[int, Optional[GuildRoleMap]]] = None  # None value: paging failed this run
+_metas: Optional[Dict[int, GuildMeta]] = None
+_lock = threading.Lock()
+_meta_lock = threading.Lock()  # separate: role_map_for holds _lock while the session loop builds a map
+
+
+def open_run() -> None:
+    global _maps, _metas
+    with _lock, _meta_lock:
+        _maps = {}
+        _metas = {}
+
+
+def close_run() -> None:
+    global _maps, _metas
+    with _lock, _meta_lock:
+        _maps = None
+        _metas = None
+
+
+def cached_role_map(guild_id: int) -> Optional[GuildRoleMap]:
+    """The map an earlier call built this run, without fetching one."""
+    with _lock:
+        return _maps.get(guild_id) if _maps is not None else None
+
+
+def role_map_for(token: str, guild_id: int) -> Optional[GuildRoleMap]:
+    """
+    The guild's member -> roles map for this run, built on first use through the run's
+    Discord session (or a one-off login outside a run). None when the member list can't be
+    paged because Discord answers 403 (e.g. the Server Members Intent is off in the portal);
+    callers then fall back to per-member lookups. Any other failure is raised.
+    """
+    with _lock:
+        if _maps is not None and guild_id in _maps:
+            return _maps[guild_id]
+        try:
+            session = discord_session.active_session(token)
+            if session is not None:
+                role_map = session.submit(lambda client: fetch_role_map(client, guild_id))
+            else:
+                role_map = asyncio.run(_fetch_role_map_once(token, guild_id))
+        except discord.Forbidden as e:
+            # 403: the Server Members Intent is off in the developer portal (or the bot lacks access)
+            logging.warning("Discord: could not page guild %s members (%s); using per-member lookups.", guild_id, e)
+            if _maps is not None:
+                _maps[guild_id] = None
+            return None
+        except Exception as e:
+            logging.error("Discord: paging guild %s members failed: %s", guild_id, e)
+            raise
+        logging.info("Discord: loaded roles for %d member(s) of guild %s.", len(role_map), guild_id)
+        if _maps is not None:
+            _maps[guild_id] = role_map
+        return role_map
@@ -5,6 +5,7 @@ from typing import Optional, Dict, Any
 
 import discord
 
+from modules import discord_state
 from modules.snapshot import SnapshotLog
 
 logger = logging.getLogger(__name__)
@@ -25,10 +26,14 @@ async def safe_dm(
     dm_attempted = True
     dm_sent = False
     try:
-        user_obj = await discord_client.fetch_user(user_id)
-        await user_obj.send(content)
+        await discord_state.send_dm(discord_client, user_id, content)
         dm_sent = True
         return True
+    except discord_state.DMBlocked:
+        # Known DM-blocked and not due for a re-probe: no API call was made
+        dm_attempted = False
+        logger.info("Discord DM skipped for user_id=%s: DMs disabled", user_id)
+        return False
     except discord.Forbidden as e:
         # Includes error code 50007: "Cannot send messages to this user"
         logger.warning("Discord DM blocked for user_id=%s: %s", user_id, str(e))
@@ -45,4 +50,5 @@ async def safe_dm(
             days_left=ctx.get("days_left"),
             dm_attempted=dm_attempted,
             dm_sent=dm_sent,
+            skipped_reason=None if dm_attempted else "dm_blocked",
         )
@@ -0,0 +1,127 @@
+# modules/discord_roles.py
+from __future__ import annotations
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+import discord
+
+from modules import discord_guild, discord_session
+from modules.discord_guild import GuildRoleMap, RoleRef
+from modules.util_retry import with_retries
+
+DEFAULT_CONCURRENCY = 5
+DEFAULT_RETRIES = 3
+REASON = "Harassarr: inactive user cleanup"
+
+
+@dataclass
+class RoleRevocation:
+    member_id: str
+    role: RoleRef                  # role ID (PLEX block `roleId`) or role name (`role`)
+    server: Optional[str] = None   # PLEX- block the role belongs to (for logs and the run log)
+
+
+@dataclass
+class RevokeResult:
+    revocation: RoleRevocation
+    outcome: str                   # removed | not_member | role_missing | failed
+    attempts: int = 0
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.outcome in ("removed", "not_member")
+
+
+async def revoke_all(client: discord.Client, guild_id: int, revocations: Iterable[RoleRevocation],
+                     role_map: Optional[GuildRoleMap] = None, concurrency: int = DEFAULT_CONCURRENCY,
+                     retries: int = DEFAULT_RETRIES,
+                     members: Optional[Dict[str, discord.Member]] = None) -> List[RevokeResult]:
+    """
+    Remove every (member, role) pair in one session, at most `concurrency` at a time.
+    Roles resolve through the run's guild metadata. Members the audit already fetched on this
+    client (`members`, or the GuildRoleMap) are reused; only unseen ones cost a fetch_member.
+    Results come back in input order.
+    """
+    revocations = list(revocations)
+    if not revocations:
+        return []
+
+    members = dict(members or {})
+    meta = await discord_guild.guild_meta(client, guild_id)
+    role_ids: Dict[RoleRef, Optional[int]] = {r.role: meta.role_id(r.role) for r in revocations}
+    for role, rid in role_ids.items():
+        if rid is None:
+            logging.warning("Discord: role '%s' not found in guild %s", role, guild_id)
+
+    sem = asyncio.Semaphore(max(1, int(concurrency)))
+
+    async def one(rev: RoleRevocation) -> RevokeResult:
+        result = RevokeResult(revocation=rev, outcome="failed")
+        role_id = role_ids.get(rev.role)
+        if role_id is None:
+            result.outcome = "role_missing"
+            return result
+
+        async def remove() -> None:
+            result.attempts += 1
+            member = members.get(rev.member_id)
+            if member is None and role_map is not None:
+                member = role_map.member(rev.member_id)
+            if member is None:
+                member = members[rev.member_id] = await meta.guild.fetch_member(int(rev.member_id))
+            await member.remove_roles(discord.Object(id=role_id), reason=REASON)
+
+        async with sem:
+            try:
+                await with_retries(remove, retries=retries)
+                result.outcome = "removed"
+            except discord.NotFound:
+                result.outcome = "not_member"
+            except Exception as e:  # noqa: BLE001
+                result.error = str(e) or e.__class__.__name__
+        return result
+
+    start = time.monotonic()
+    results = list(await asyncio.gather(*(one(r) for r in revocations)))
+    logging.info("Discord: revoked %d of %d role(s) in %.1fs.",
+                 sum(r.outcome == "removed" for r in results), len(results), time.monotonic() - start)
+    return results
+
+
+def revoke_now(token: str, guild_id: int, revocations: List[RoleRevocation],
+               role_map: Optional[GuildRoleMap] = None, concurrency: int = DEFAULT_CONCURRENCY,
+               retries: int = DEFAULT_RETRIES,
+               members: Optional[Dict[str, discord.Member]] = None) -> List[RevokeResult]:
+    """Run revoke_all on the run's Discord session, or a one-off login outside a run."""
+    session = discord_session.active_session(token)
+    if session is not None:
+        return session.submit(lambda client: revoke_all(client, guild_id, revocations, role_map,
+                                                        concurrency, retries, members))
+
+    async def main() -> List[RevokeResult]:
+        client = discord.Client(intents=discord.Intents.none())
+        try:
+            await client.login(token)
+            # Member objects fetched by another client can't be reused here
+            return await revoke_all(client, guild_id, revocations, None, concurrency, retries)
+        finally:
+            try:
+                await client.close()
+            except Exception:
+                pass
+
+    return asyncio.run(main())
+
+
+def format_results(results: List[RevokeResult]) -> str:
+    """Plain-text per-member table for the run log."""
+    rows = [("SERVER", "MEMBER", "ROLE", "OUTCOME", "ATTEMPTS", "ERROR")]
+    for res in results:
+        rows.append((res.revocation.server or "", res.revocation.member_id, str(res.revocation.role),
+                     res.outcome, str(res.attempts), (res.error or "")[:80]))
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return "\n".join("  ".join(col.ljust(w) for col, w in zip(row, widths)).rstrip() for row in rows)
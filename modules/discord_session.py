@@ -0,0 +1,105 @@
+# modules/discord_session.py
+from __future__ import annotations
+import asyncio
+import logging
+import threading
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import discord
+
+from modules.discord_client import DiscordDMClient
+
+T = TypeVar("T")
+
+CONNECT_TIMEOUT = 30.0
+
+
+class DiscordSession:
+    """
+    Run-scoped Discord connection.
+    - A background thread owns one event loop and one logged-in DiscordDMClient
+    - submit() queues a coroutine onto that loop and blocks for its result, so the
+      synchronous checks share one login instead of a client + gateway handshake per call
+    - Connects on first use; close() logs out and stops the loop once
+    """
+    def __init__(self, token: str):
+        self._token = token
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._dm: Optional[DiscordDMClient] = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @property
+    def token(self) -> str:
+        return self._token
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Discord session is closed")
+            if self._dm is not None:
+                return
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="discord-session", daemon=True)
+            thread.start()
+            dm = DiscordDMClient(self._token, logging.getLogger(__name__))
+            try:
+                asyncio.run_coroutine_threadsafe(dm.__aenter__(), loop).result(CONNECT_TIMEOUT)
+            except BaseException:
+                loop.call_soon_threadsafe(loop.stop)
+                thread.join(timeout=5)
+                loop.close()
+                raise
+            self._loop, self._thread, self._dm = loop, thread, dm
+
+    def submit(self, runner: Callable[[discord.Client], Awaitable[T]], timeout: Optional[float] = None) -> T:
+        """Run `runner(client)` on the session's loop and return its result."""
+        self._ensure_started()
+        future = asyncio.run_coroutine_threadsafe(runner(self._dm.client), self._loop)
+        return future.result(timeout)
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            loop, thread, dm = self._loop, self._thread, self._dm
+            self._loop = self._thread = self._dm = None
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(dm.__aexit__(None, None, None), loop).result(CONNECT_TIMEOUT)
+        except Exception as e:  # noqa: BLE001
+            logging.warning("Discord session close error: %s", e)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+        loop.close()
+        logging.info("Discord session closed.")
+
+
+# ----------------- run-scoped session -----------------
+_session: Optional[DiscordSession] = None
+
+
+def open_session(token: Optional[str]) -> Optional[DiscordSession]:
+    """Register the run's session; nothing connects until the first Discord call."""
+    global _session
+    close_session()
+    if not token:
+        return None
+    _session = DiscordSession(token)
+    return _session
+
+
+def close_session() -> None:
+    global _session
+    if _session is not None:
+        _session.close()
+    _session = None
+
+
+def active_session(token: Optional[str] = None) -> Optional[DiscordSession]:
+    """The run's session (if `token` is given, only when it matches)."""
+    if _session is None or (token is not None and token != _session.token):
+        return None
+    return _session
+
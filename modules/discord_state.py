@@ -0,0 +1,174 @@
+# modules/discord_state.py
+from __future__ import annotations
+import logging
+import sqlite3
+import threading
+import time
+from typing import Optional, Union
+
+import discord
+
+DM_CHANNEL_TTL_DAYS = 30  # re-resolve a subscriber's DM channel at least this often
+DM_BLOCKED_REPROBE_DAYS = 7  # try a DM-blocked user again after this long
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dm_channels (
+    user_id    TEXT PRIMARY KEY,
+    channel_id TEXT NOT NULL,
+    cached_at  REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dm_blocked (
+    user_id    TEXT PRIMARY KEY,
+    blocked_at REAL NOT NULL
+);
+"""
+
+
+class DMBlocked(Exception):
+    """The user refused DMs (50007) recently enough that we don't try again yet."""
+
+
+class DiscordState:
+    """
+    Small SQLite store for Discord facts that outlive a run.
+    - dm_channels: user ID -> DM channel ID, so repeat DMs skip fetch_user + create_dm
+    - Entries expire after `channelTtlDays` and are dropped on 404 (or a non-50007 403) from the channel
+    - dm_blocked: users who answered 50007, skipped until `reprobeDays` have passed
+    """
+    def __init__(self, path: str, channelTtlDays: float = DM_CHANNEL_TTL_DAYS,
+                 reprobeDays: float = DM_BLOCKED_REPROBE_DAYS):
+        self.path = path
+        self._ttl = float(channelTtlDays) * 86400
+        self._reprobe = float(reprobeDays) * 86400
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def dm_channel(self, user_id: Union[int, str]) -> Optional[int]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT channel_id, cached_at FROM dm_channels WHERE user_id = ?", (str(user_id),)
+            ).fetchone()
+        if row is None or time.time() - row[1] > self._ttl:
+            return None
+        return int(row[0])
+
+    def remember_channel(self, user_id: Union[int, str], channel_id: int) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO dm_channels (user_id, channel_id, cached_at) VALUES (?, ?, ?)",
+                (str(user_id), str(channel_id), time.time()),
+            )
+
+    def forget_channel(self, user_id: Union[int, str]) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM dm_channels WHERE user_id = ?", (str(user_id),))
+
+    def blocked_since(self, user_id: Union[int, str]) -> Optional[float]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT blocked_at FROM dm_blocked WHERE user_id = ?", (str(user_id),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def reprobe_due(self, blocked_at: float) -> bool:
+        return time.time() - blocked_at >= self._reprobe
+
+    def is_blocked(self, user_id: Union[int, str]) -> bool:
+        """Blocked and not yet due for a re-probe."""
+        since = self.blocked_since(user_id)
+        return since is not None and not self.reprobe_due(since)
+
+    def mark_blocked(self, user_id: Union[int, str]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO dm_blocked (user_id, blocked_at) VALUES (?, ?)",
+                (str(user_id), time.time()),
+            )
+
+    def clear_blocked(self, user_id: Union[int, str]) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM dm_blocked WHERE user_id = ?", (str(user_id),))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def is_dm_blocked_error(e: discord.Forbidden) -> bool:
+    # code 50007: "Cannot send messages to this user"
+    return getattr(e, "code", None) == 50007 or "Cannot send messages to this user" in str(e)
+
+
+async def send_dm(client: discord.Client, user_id: Union[int, str], content: str,
+                  state: Optional[DiscordState] = None) -> None:
+    """
+    DM a user, going straight to their cached DM channel when we have one (one REST call).
+    On a miss, or when the cached channel answers 404 or a 403 other than 50007, resolve it
+    with fetch_user + create_dm and remember it. Users recorded as DM-blocked raise DMBlocked without any
+    API call until their re-probe is due; a fresh 50007 records them. Other errors propagate.
+    """
+    state = state if state is not None else active_state()
+    uid = int(user_id)
+    since = state.blocked_since(uid) if state is not None else None
+    if since is not None and not state.reprobe_due(since):
+        raise DMBlocked(uid)
+
+    try:
+        await _send(client, uid, content, state)
+    except discord.Forbidden as e:
+        if state is not None and is_dm_blocked_error(e):
+            state.mark_blocked(uid)
+        raise
+    if since is not None:
+        state.clear_blocked(uid)  # re-probe went through: they accept DMs again
+
+
+async def _send(client: discord.Client, uid: int, content: str, state: Optional[DiscordState]) -> None:
+    channel_id = state.dm_channel(uid) if state is not None else None
+    if channel_id is not None:
+        try:
+            await client.get_partial_messageable(channel_id, type=discord.ChannelType.private).send(content)
+            return
+        except discord.Forbidden as e:
+            if is_dm_blocked_error(e):
+                raise  # the channel is fine; the user refuses DMs
+            state.forget_channel(uid)  # lost access: resolve it afresh
+        except discord.NotFound:
+            state.forget_channel(uid)  # stale channel: resolve it afresh
+
+    user = await client.fetch_user(uid)
+    dm = await user.create_dm()
+    if state is not None:
+        state.remember_channel(uid, dm.id)
+    await dm.send(content)
+
+
+# ----------------- run-scoped store -----------------
+_state: Optional[DiscordState] = None
+
+
+def open_state(path: str, channelTtlDays: float = DM_CHANNEL_TTL_DAYS,
+               reprobeDays: float = DM_BLOCKED_REPROBE_DAYS) -> Optional[DiscordState]:
+    """Open the store for this run; a store that can't be opened just disables the cache."""
+    global _state
+    close_state()
+    try:
+        _state = DiscordState(path, channelTtlDays, reprobeDays)
+    except sqlite3.Error as e:
+        logging.warning("Discord state store %s unavailable (%s); DM channels and blocked users won't be remembered.", path, e)
+        _state = None
+    return _state
+
+
+def close_state() -> None:
+    global _state
+    if _state is not None:
+        _state.close()
+    _state = None
+
+
+def active_state() -> Optional[DiscordState]:
+    """This run's store, or None outside a run."""
+    return _state
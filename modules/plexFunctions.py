@@ -1,9 +1,12 @@
 # modules/plexFunctions.py
 import logging, sys
+from typing import Iterable, Iterator
 from plexapi.myplex import MyPlexAccount
-from plexapi.server import PlexServer
 
-from modules import configFunctions, emailFunctions, discordFunctions, dbFunctions
+from modules import configFunctions, emailFunctions, discordFunctions, dbFunctions, plex_filters, plex_roster, plex_registry, plex_shares
+from modules.plex_user import PlexUser
+from modules.snapshot import SnapshotLog
+from modules.user_index import UserIndex, email_recipients, discord_recipients
 
 logging.basicConfig(stream=sys.stdout, level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
@@ -93,51 +96,29 @@ def createPlexConfig(configFile):
     logging.info("Authenticated and stored token for Plex instance: %s", serverName)
 
 
-def listPlexUsers(baseUrl, token, serverName, standardLibraries, optionalLibraries, **kwargs):
-    plex = PlexServer(baseUrl, token)
-    users = plex.myPlexAccount().users()
-    userList = []
-    std_count = len(standardLibraries)
-    opt_count = len(optionalLibraries)
-
-    for user in users:
-        # Skip users lacking an email (local/managed accounts)
-        if not getattr(user, "email", None):
-            logging.warning("Skipping Plex user '%s' on '%s' (no email; likely local/managed).",
-                            user.title, serverName)
-            continue
-
-        for serverInfo in user.servers:
-            if serverName == serverInfo.name:
-                if opt_count == 0:
-                    fourK = 'No'
-                elif serverInfo.numLibraries == std_count + opt_count:
-                    fourK = 'Yes'
-                elif serverInfo.numLibraries == std_count:
-                    fourK = 'No'
-                elif serverInfo.numLibraries >= std_count + opt_count:
-                    fourK = 'Yes'
-                    logging.warning("%s (%s) has extra libraries shared; investigate.",
-                                    user.email, user.title)
-                else:
-                    fourK = 'No'
-                    logging.warning("%s (%s) has not enough libraries shared; investigate.",
-                                    user.email, user.title)
+def iterPlexUsers(baseUrl, token, serverName, standardLibraries, optionalLibraries,
+                  snapshot: SnapshotLog | None = None, **kwargs) -> Iterator[PlexUser]:
+    """
+    Stream the server's shares as PlexUser records (see plex_filters for the stages).
+    The roster is resolved here, so connection errors surface on the call, not mid-iteration.
+    """
+    # The account's friends list is downloaded once per run and shared by every server it owns
+    roster = plex_roster.roster_for(baseUrl, token, timeout=kwargs.get("timeout"))
+    # Exact per-user library sets for 4K classification; fall back to library counts without them
+    try:
+        inventory = plex_shares.inventory_for(baseUrl, token, serverName, timeout=kwargs.get("timeout"))
+    except Exception as e:
+        logging.warning("Shared-library inventory unavailable for '%s' (%s); classifying 4K by library count.",
+                        serverName, e)
+        inventory = None
+    return plex_filters.plex_user_pipeline(roster, serverName, standardLibraries, optionalLibraries, snapshot,
+                                           inventory)
 
-                userList.append({
-                    "User ID": user.id,
-                    "Username": user.title,
-                    "Email": user.email,
-                    "Server": serverName,
-                    "Number of Libraries": serverInfo.numLibraries,
-                    "All Libraries Shared": serverInfo.allLibraries,
-                    "4K Libraries": fourK
-                })
 
-    return userList
+def listPlexUsers(baseUrl, token, serverName, standardLibraries, optionalLibraries, **kwargs) -> list[PlexUser]:
+    return list(iterPlexUsers(baseUrl, token, serverName, standardLibraries, optionalLibraries, **kwargs))
 
 
-# === NEW: filter actionable Plex users (skip local/no-email) ===
 def actionable_from_plex(
     baseUrl: str,
     token: str,
@@ -145,61 +126,70 @@ def actionable_from_plex(
     standardLibraries: list,
     optionalLibraries: list,
     purpose: str | None = None,
-) -> list[dict]:
+    users: Iterable[PlexUser] | None = None,
+    snapshot: SnapshotLog | None = None,
+) -> Iterator[PlexUser]:
     """
-    Returns Plex users for 'serverName' that are actionable for DB/role audits:
-    - Skips local/managed users (no Email)
-    - Ensures 'Server' matches serverName
-    Logs a summary like: "Assembled N users after filters on 'X' (for Y)."
+    Streams Plex users for 'serverName' that are actionable for DB/role audits:
+    - Skips local/managed users (no email)
+    - Ensures the user's server matches serverName
+    - `users` is an already-fetched roster (e.g. from plex_fetch); streamed from plex.tv when omitted
+    Logs a summary like: "Assembled N users after filters on 'X' (for Y)." once the consumer is done.
     """
-    try:
-        users = listPlexUsers(
-            baseUrl=baseUrl,
-            token=token,
-            serverName=serverName,
-            standardLibraries=standardLibraries,
-            optionalLibraries=optionalLibraries,
-        )
-    except Exception as e:
-        logging.error("Error listing Plex users for '%s': %s", serverName, e)
-        return []
-
-    filtered = []
-    for u in users or []:
-        email = (u.get("Email") or "").strip()
-        srv = u.get("Server")
-        if not email:
-            logging.warning("Skipping Plex user '%s' on '%s' (no email; likely local/managed).",
-                            u.get("Username"), serverName)
-            continue
-        if srv != serverName:
-            continue
-        filtered.append(u)
+    if users is None:
+        try:
+            users = iterPlexUsers(
+                baseUrl=baseUrl,
+                token=token,
+                serverName=serverName,
+                standardLibraries=standardLibraries,
+                optionalLibraries=optionalLibraries,
+                snapshot=snapshot,
+            )
+        except Exception as e:
+            logging.error("Error listing Plex users for '%s': %s", serverName, e)
+            return iter(())
+    return _counted(plex_filters.actionable_from_plex(users, serverName, snapshot), serverName, purpose)
+
 
-    logging.info("Assembled %d users after filters on '%s' (for %s).",
-                 len(filtered), serverName, (purpose or "audit"))
-    return filtered
+def _counted(users: Iterator[PlexUser], serverName: str, purpose: str | None) -> Iterator[PlexUser]:
+    count = 0
+    for u in users:
+        if u.server != serverName:
+            continue
+        count += 1
+        yield u
+    logging.info("Assembled %d users after filters on '%s' (for %s).", count, serverName, (purpose or "audit"))
 
 
-def removePlexUser(configFile: str, serverName: str, userEmail: str, sharedLibraries: list[str] | None = None, dryrun: bool = False) -> None:
+def removePlexUser(configFile: str, serverName: str, userEmail: str, sharedLibraries: list[str] | None = None, dryrun: bool = False,
+                   userIndex: UserIndex | None = None, statusUpdates: list | None = None,
+                   shareRemoved: bool = False) -> None:
     """
     Remove a user's access from a Plex server.
     - Always attempts to remove the Plex share/friend for `userEmail` on `serverName`.
     - Only updates the database or sends notifications if a matching DB row exists.
     - `sharedLibraries` is accepted for backward-compat/signature parity; actual removal uses account.removeFriend().
+    - `userIndex` is the caller's run snapshot; when omitted the server's rows are loaded in one query.
+    - `statusUpdates`, when given, collects the (server, email, 'Inactive') transition instead of writing it;
+      flush it with dbFunctions.updateUserStatuses.
+    - `shareRemoved=True` means plex_removals already revoked the share; only the DB/notification follow-up runs.
     """
-    try:
-        cfg = configFunctions.getConfig(configFile)
-    except Exception as e:
-        logging.error("Unable to read config '%s': %s", configFile, e)
-        return
+    # During a run the registry already holds the PLEX-* blocks; otherwise read config.yml
+    cfg = None
+    plex_block = plex_registry.block_for(serverName)
+    if plex_block is None:
+        try:
+            cfg = configFunctions.getConfig(configFile)
+        except Exception as e:
+            logging.error("Unable to read config '%s': %s", configFile, e)
+            return
 
-    # Find the PLEX-* block that matches this serverName
-    plex_block = None
-    for k, v in cfg.items():
-        if str(k).startswith("PLEX-") and isinstance(v, dict) and v.get("serverName") == serverName:
-            plex_block = v
-            break
+        # Find the PLEX-* block that matches this serverName
+        for k, v in cfg.items():
+            if str(k).startswith("PLEX-") and isinstance(v, dict) and v.get("serverName") == serverName:
+                plex_block = v
+                break
     if plex_block is None:
         logging.error("No configuration found for Plex server '%s'", serverName)
         return
@@ -210,53 +200,50 @@ def removePlexUser(configFile: str, serverName: str, userEmail: str, sharedLibra
         logging.error("Invalid Plex configuration for '%s': baseUrl/token missing.", serverName)
         return
 
-    # Connect to Plex
-    try:
-        plex = PlexServer(baseUrl, token)
-    except Exception as e:
-        logging.error("Failed to connect to Plex '%s': %s", serverName, e)
-        return
-
-    # --- Remove share (friend) on Plex ---
     if not userEmail:
         logging.error("Cannot remove Plex user with empty email on server '%s'.", serverName)
         return
 
-    if dryrun:
-        logging.info("[DRY-RUN] Would remove Plex user '%s' from '%s'", userEmail, serverName)
-    else:
+    # --- Remove share (friend) on Plex (skipped when plex_removals already did it) ---
+    if not shareRemoved:
+        # Connect to Plex (reuses the run's connection when there is one)
         try:
-            removed = plex.myPlexAccount().removeFriend(user=userEmail)
-            if removed:
-                logging.info("User '%s' has been successfully removed from Plex server '%s'", userEmail, serverName)
-            else:
-                logging.warning("Friendship with '%s' not found and thus not removed.", userEmail)
+            plex_registry.server(baseUrl, token)
         except Exception as e:
-            logging.warning("Error removing friendship for '%s' on '%s': %s", userEmail, serverName, e)
+            logging.error("Failed to connect to Plex '%s': %s", serverName, e)
+            return
+
+        if dryrun:
+            logging.info("[DRY-RUN] Would remove Plex user '%s' from '%s'", userEmail, serverName)
+        else:
+            try:
+                removed = plex_registry.account(baseUrl, token).removeFriend(user=userEmail)
+                if removed:
+                    logging.info("User '%s' has been successfully removed from Plex server '%s'", userEmail, serverName)
+                else:
+                    logging.warning("Friendship with '%s' not found and thus not removed.", userEmail)
+            except Exception as e:
+                logging.warning("Error removing friendship for '%s' on '%s': %s", userEmail, serverName, e)
 
     # --- From here on: only act if user exists in DB ---
-    db_cfg = cfg.get("database", {})
-    user_in_db = False
-    try:
-        user_in_db = dbFunctions.userExists(
-            user=db_cfg.get("user"),
-            password=db_cfg.get("password"),
-            server=db_cfg.get("host"),
-            database=db_cfg.get("database"),
-            primaryEmail=(userEmail or "").lower(),
-            serverName=(serverName or "").lower(),
-        )
-    except Exception as e:
-        logging.error("DB existence check failed for %s on %s: %s", userEmail, serverName, e)
+    if userIndex is None:
+        try:
+            if cfg is None:
+                cfg = configFunctions.getConfig(configFile)
+            userIndex = UserIndex.load(cfg.get("database", {}), serverName=serverName)
+        except Exception as e:
+            logging.error("DB lookup failed for %s on %s: %s", userEmail, serverName, e)
+            return
 
-    if not user_in_db:
+    row = userIndex.get(serverName, userEmail)
+    if row is None:
         logging.info("User %s not present in DB for server %s; skipped DB inactivation and notifications.", userEmail, serverName)
         return
 
     # Pull user-specific fields we need for templating
     try:
         # 4k flag
-        fourk = dbFunctions.getDBField(configFile, serverName, userEmail, '4k') or 'No'
+        fourk = row.get('4k') or 'No'
         # Pricing tier from config ('4k' or '1080p')
         price_block_key = '4k' if str(fourk).strip().lower() == 'yes' else '1080p'
         pricing = plex_block.get(price_block_key, {}) if isinstance(plex_block, dict) else {}
@@ -273,7 +260,7 @@ def removePlexUser(configFile: str, serverName: str, userEmail: str, sharedLibra
             streamCount = 2
 
         # days_left from DB endDate
-        endDate = dbFunctions.getDBField(configFile, serverName, userEmail, 'endDate')
+        endDate = row.get('endDate')
         from datetime import datetime, date
         today = date.today()
         days_left = 0
@@ -281,41 +268,17 @@ def removePlexUser(configFile: str, serverName: str, userEmail: str, sharedLibra
             try:
                 if isinstance(endDate, datetime):
                     days_left = (endDate.date() - today).days
+                elif isinstance(endDate, date):
+                    days_left = (endDate - today).days
                 else:
                     dt = datetime.strptime(str(endDate), "%Y-%m-%d").date()
                     days_left = (dt - today).days
             except Exception:
                 days_left = 0
 
-        # Determine email recipients
-        toEmails = None
-        try:
-            notifyEmail = dbFunctions.getDBField(configFile, serverName, userEmail, 'notifyEmail')
-            if notifyEmail == 'Primary':
-                toEmails = [dbFunctions.getDBField(configFile, serverName, userEmail, 'primaryEmail')]
-            elif notifyEmail == 'Secondary':
-                toEmails = [dbFunctions.getDBField(configFile, serverName, userEmail, 'secondaryEmail')]
-            elif notifyEmail == 'Both':
-                p = dbFunctions.getDBField(configFile, serverName, userEmail, 'primaryEmail')
-                s = dbFunctions.getDBField(configFile, serverName, userEmail, 'secondaryEmail')
-                toEmails = [e for e in (p, s) if e]
-        except Exception as e:
-            logging.error("Failed to compute email recipients for %s on %s: %s", userEmail, serverName, e)
-
-        # Determine Discord recipients
-        toDiscord = None
-        try:
-            notifyDiscord = dbFunctions.getDBField(configFile, serverName, userEmail, 'notifyDiscord')
-            if notifyDiscord == 'Primary':
-                toDiscord = [dbFunctions.getDBField(configFile, serverName, userEmail, 'primaryDiscordId')]
-            elif notifyDiscord == 'Secondary':
-                toDiscord = [dbFunctions.getDBField(configFile, serverName, userEmail, 'secondaryDiscordId')]
-            elif notifyDiscord == 'Both':
-                pD = dbFunctions.getDBField(configFile, serverName, userEmail, 'primaryDiscordId')
-                sD = dbFunctions.getDBField(configFile, serverName, userEmail, 'secondaryDiscordId')
-                toDiscord = [d for d in (pD, sD) if d]
-        except Exception as e:
-            logging.error("Failed to compute Discord recipients for %s on %s: %s", userEmail, serverName, e)
+        # Email + Discord recipients straight from the snapshot row
+        toEmails = email_recipients(row)
+        toDiscord = discord_recipients(row)
 
         # Send notifications (email + Discord) with full pricing context
         try:
@@ -349,6 +312,9 @@ def removePlexUser(configFile: str, serverName: str, userEmail: str, sharedLibra
         # Update DB status to Inactive
         if dryrun:
             logging.info("SETTING USER (%s) TO INACTIVE SKIPPED DUE TO DRYRUN", userEmail)
+        elif statusUpdates is not None:
+            # Caller applies every transition of the run in one transaction
+            statusUpdates.append((serverName, userEmail, 'Inactive'))
         else:
             try:
                 dbFunctions.updateUserStatus(configFile, serverName, userEmail, 'Inactive')
@@ -0,0 +1,132 @@
+# modules/plex_fetch.py
+from __future__ import annotations
+import logging
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from modules import plexFunctions, plex_registry
+from modules.plex_user import PlexUser
+from modules.snapshot import SnapshotLog
+
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_TIMEOUT = 30.0
+# Sequential requests behind one server's fetch: connect, library sections, MyPlexAccount,
+# users() and shared_servers (the last three shared per token, so peers may wait on them)
+REQUESTS_PER_SERVER = 5
+
+
+@dataclass
+class ServerFetch:
+    """Everything the checks need from one PLEX- block, gathered up front."""
+    serverName: str
+    ok: bool = False
+    error: Optional[str] = None
+    users: List[PlexUser] = field(default_factory=list)        # classified PlexUser records from iterPlexUsers (shares with an email)
+    libraries: List[str] = field(default_factory=list)         # library section titles on the server
+    seconds: float = 0.0
+
+
+def _fetch_one(pc: Dict[str, Any], timeout: float, snapshot: Optional[SnapshotLog]) -> ServerFetch:
+    start = time.monotonic()
+    result = ServerFetch(serverName=pc.get("serverName"))
+    baseUrl = pc.get("baseUrl")
+    token = pc.get("token")
+    if not baseUrl or not token:
+        result.error = "missing baseUrl or token"
+        return result
+
+    try:
+        # Every HTTP call below is bounded by `timeout`; the connection is kept for the rest of the run
+        plex = plex_registry.server(baseUrl, token, timeout=timeout)
+        result.libraries = [s.title for s in plex.library.sections()]
+        # Held as a list, not streamed: both audits read it after this stage, from other threads
+        result.users = list(plexFunctions.iterPlexUsers(
+            baseUrl=baseUrl,
+            token=token,
+            serverName=result.serverName,
+            standardLibraries=pc.get("standardLibraries", []),
+            optionalLibraries=pc.get("optionalLibraries", []),
+            snapshot=snapshot,
+            timeout=timeout,
+        ))
+        result.ok = True
+    except Exception as e:  # noqa: BLE001
+        result.error = str(e) or e.__class__.__name__
+    result.seconds = time.monotonic() - start
+    return result
+
+
+def server_budget(timeout: float, serverBudget: Optional[float] = None) -> float:
+    """Seconds one server's fetch may take: `serverBudget` when set, else every request timing out."""
+    return float(serverBudget) if serverBudget else float(timeout) * REQUESTS_PER_SERVER
+
+
+def fetch_servers(plexConfs: List[Dict[str, Any]], maxWorkers: int = DEFAULT_MAX_WORKERS,
+                  timeout: float = DEFAULT_TIMEOUT, snapshot: Optional[SnapshotLog] = None,
+                  serverBudget: Optional[float] = None) -> Dict[str, ServerFetch]:
+    """
+    Validate every PLEX- block and collect its library sections and roster in parallel.
+    Wall-clock time is bounded by the slowest server, not the sum. Servers still running when
+    the stage deadline (one server budget per round of workers) passes are reported as timed out.
+    """
+    results: Dict[str, ServerFetch] = {}
+    if not plexConfs:
+        return results
+
+    workers = max(1, min(int(maxWorkers), len(plexConfs)))
+    # Each worker may handle several servers in turn; allow one full server budget per round plus slack
+    deadline = server_budget(timeout, serverBudget) * math.ceil(len(plexConfs) / workers) + 5
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="plex-fetch")
+    try:
+        futures = {executor.submit(_fetch_one, pc, timeout, snapshot): pc.get("serverName") for pc in plexConfs}
+        done, pending = wait(futures, timeout=deadline)
+        for fut in done:
+            r = fut.result()
+            results[r.serverName] = r
+        for fut in pending:
+            name = futures[fut]
+            results[name] = ServerFetch(serverName=name, error=f"timed out after {deadline:.0f}s")
+    finally:
+        # Don't block the run on a stuck server; its thread finishes on its own HTTP timeout
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    for pc in plexConfs:
+        r = results[pc.get("serverName")]
+        if r.ok:
+            logging.info("Fetched Plex server '%s' in %.1fs (%d user(s), %d libraries).",
+                         r.serverName, r.seconds, len(r.users), len(r.libraries))
+            configured = pc.get("standardLibraries", []) + pc.get("optionalLibraries", [])
+            missing = [lib for lib in configured if lib not in r.libraries]
+            if missing:
+                logging.warning("Configured libraries not found on '%s': %s", r.serverName, ", ".join(missing))
+        else:
+            logging.error("Plex server '%s' unavailable: %s", r.serverName, r.error)
+    return results
+
+
+# ----------------- run-scoped results -----------------
+_results: Optional[Dict[str, ServerFetch]] = None
+
+
+def open_run(plexConfs: List[Dict[str, Any]], maxWorkers: int = DEFAULT_MAX_WORKERS,
+             timeout: float = DEFAULT_TIMEOUT, snapshot: Optional[SnapshotLog] = None,
+             serverBudget: Optional[float] = None) -> Dict[str, ServerFetch]:
+    global _results
+    _results = fetch_servers(plexConfs, maxWorkers=maxWorkers, timeout=timeout, snapshot=snapshot,
+                             serverBudget=serverBudget)
+    return _results
+
+
+def close_run() -> None:
+    global _results
+    _results = None
+
+
+def result_for(serverName: str) -> Optional[ServerFetch]:
+    """This run's fetch for `serverName`, or None outside a run."""
+    if _results is None:
+        return None
+    return _results.get(serverName)
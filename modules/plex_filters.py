@@ -1,40 +1,124 @@
 # modules/plex_filters.py
+"""
+Streaming stages for the Plex roster path:
+
+    iter_shares -> drop_unactionable -> classify -> actionable_from_plex -> consumer
+
+Each stage is a generator over the previous one, so a consumer starts acting on the first
+share without a full list being built in between. Skips are recorded in the SnapshotLog.
+"""
 from __future__ import annotations
+import dataclasses
 import logging
-from typing import Dict, Iterable, Iterator, Optional
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
 
+from modules import plex_shares
+from modules.plex_shares import Inventory
+from modules.plex_user import PlexUser
 from modules.snapshot import SnapshotLog
-from modules.normalize import normalize_email, safe_strip
+from modules.normalize import safe_strip
 
 logger = logging.getLogger(__name__)
 
+Share = Tuple[Any, Any]  # (plexapi MyPlexUser, its MyPlexServerShare)
+
+
+def iter_shares(roster: Any, serverName: str) -> Iterator[Share]:
+    """Fetch stage: the (user, serverInfo) shares for one server from an AccountRoster."""
+    yield from roster.entries(serverName)
+
+
+def drop_unactionable(shares: Iterable[Share], serverName: str,
+                      snapshot: Optional[SnapshotLog] = None) -> Iterator[Share]:
+    """Filter stage: local/managed accounts have no email and can't be audited."""
+    for user, share in shares:
+        if not safe_strip(getattr(user, "email", None)):
+            if snapshot is not None:
+                snapshot.add(
+                    user_id=str(user.id) if getattr(user, "id", None) is not None else None,
+                    username=getattr(user, "title", None),
+                    email=None,
+                    server=serverName,
+                    skipped_reason="no_email",
+                )
+            logger.warning("Skipping Plex user '%s' on '%s' (no email; likely local/managed).",
+                           getattr(user, "title", None), serverName)
+            continue
+        yield user, share
+
+
+def classify_fourk(numLibraries: int, std_count: int, opt_count: int) -> Tuple[str, Optional[str]]:
+    """
+    Fallback 4K tier from the shared library count, plus a note when the count looks wrong.
+    Only used when the server's share inventory (plex_shares) is unavailable.
+    """
+    if opt_count == 0:
+        return 'No', None
+    if numLibraries == std_count + opt_count:
+        return 'Yes', None
+    if numLibraries == std_count:
+        return 'No', None
+    if numLibraries >= std_count + opt_count:
+        return 'Yes', "has extra libraries shared; investigate."
+    return 'No', "has not enough libraries shared; investigate."
+
+
+def classify(shares: Iterable[Share], serverName: str, standardLibraries: List[str],
+             optionalLibraries: List[str], inventory: Optional[Inventory] = None) -> Iterator[PlexUser]:
+    """
+    Normalize + classify stage: one PlexUser (email normalized, 4K tier set) per share.
+    With the server's share inventory the tier and alerts come from exact library-set comparisons.
+    """
+    std_count = len(standardLibraries)
+    opt_count = len(optionalLibraries)
+    for user, share in shares:
+        libraries = inventory.get(user.id) if inventory is not None else None
+        if libraries is not None:
+            fourK, alerts = plex_shares.classify(libraries, standardLibraries, optionalLibraries)
+            for alert in alerts:
+                logger.warning("%s (%s) on '%s': %s", user.email, user.title, serverName, alert)
+            yield PlexUser.from_plex(user, serverName, share, fourK, libraries)
+            continue
+
+        fourK, note = classify_fourk(share.numLibraries, std_count, opt_count)
+        if note:
+            logger.warning("%s (%s) %s", user.email, user.title, note)
+        yield PlexUser.from_plex(user, serverName, share, fourK)
+
+
+def plex_user_pipeline(roster: Any, serverName: str, standardLibraries: List[str], optionalLibraries: List[str],
+                       snapshot: Optional[SnapshotLog] = None,
+                       inventory: Optional[Inventory] = None) -> Iterator[PlexUser]:
+    """The full roster path for one server, as a single lazy iterator."""
+    shares = iter_shares(roster, serverName)
+    shares = drop_unactionable(shares, serverName, snapshot)
+    return classify(shares, serverName, standardLibraries, optionalLibraries, inventory)
+
+
 def actionable_from_plex(
-    plex_user_dicts: Iterable[Dict],
+    plex_users: Iterable[PlexUser],
     server_display_name: str,
-    snapshot: SnapshotLog,
-) -> Iterator[Dict]:
+    snapshot: Optional[SnapshotLog] = None,
+) -> Iterator[PlexUser]:
     server_display_name = safe_strip(server_display_name)
-    for user in plex_user_dicts:
-        email = normalize_email(user.get("Email"))
-        username = user.get("Username")
-        plex_user_id = user.get("User ID")
-
-        if not email:
+    for user in plex_users:
+        if not user.actionable:
             # Skip non-actionable local/managed accounts with no email
-            snapshot.add(
-                user_id=str(plex_user_id) if plex_user_id is not None else None,
-                username=username,
-                email=None,
-                server=server_display_name,
-                skipped_reason="no_email",
-            )
+            if snapshot is not None:
+                snapshot.add(
+                    user_id=str(user.userId) if user.userId is not None else None,
+                    username=user.username,
+                    email=None,
+                    server=server_display_name,
+                    skipped_reason="no_email",
+                )
             logger.debug(
                 "Skipping Plex user '%s' on server '%s' (no email; likely local/managed).",
-                username, server_display_name
+                user.username, server_display_name
             )
             continue
 
-        # Normalize back onto the dict so downstream always has a clean value
-        user["Email"] = email
-        user["Server"] = server_display_name or user.get("Server")
+        # Email is already normalized; only the display server name may need pinning
+        if server_display_name and user.server != server_display_name:
+            user = dataclasses.replace(user, server=server_display_name)
         yield user
@@ -0,0 +1,133 @@
+# modules/plex_registry.py
+from __future__ import annotations
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from plexapi.myplex import MyPlexAccount
+from plexapi.server import PlexServer
+
+DEFAULT_TIMEOUT = 30.0
+
+# plexapi turns a 429 into a bare BadRequest; keep the Retry-After header the worker thread just saw
+_last_response = threading.local()
+
+
+def _remember_retry_after(response: requests.Response, *args: Any, **kwargs: Any) -> None:
+    _last_response.retry_after = response.headers.get("Retry-After") if response.status_code == 429 else None
+
+
+def last_retry_after() -> Optional[str]:
+    """Raw Retry-After of this thread's most recent 429 through a registry session (None otherwise)."""
+    return getattr(_last_response, "retry_after", None)
+
+
+class PlexClient:
+    """One authenticated PlexServer plus its owner's MyPlexAccount, built once and reused."""
+    def __init__(self, server: PlexServer, timeout: float):
+        self.server = server
+        self._timeout = timeout
+        self._account: Optional[MyPlexAccount] = None
+        self._lock = threading.Lock()
+
+    def account(self) -> MyPlexAccount:
+        with self._lock:
+            if self._account is None:
+                # Same token and keep-alive session as the server; plexapi's own helper drops the timeout
+                self._account = MyPlexAccount(token=self.server._token, session=self.server._session,
+                                              timeout=self._timeout)
+            return self._account
+
+
+class PlexRegistry:
+    """
+    Run-scoped Plex clients.
+    - One requests.Session (keep-alive, pooled) shared by every server and plex.tv call
+    - Clients keyed by (baseUrl, token), connected on first use
+    - PLEX- blocks indexed by serverName so lookups don't rescan config.yml
+    """
+    def __init__(self, plexConfs: List[Dict[str, Any]], timeout: float = DEFAULT_TIMEOUT, poolSize: int = 10):
+        self.timeout = float(timeout or DEFAULT_TIMEOUT)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max(1, len(plexConfs)), pool_maxsize=max(1, int(poolSize)))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.hooks["response"].append(_remember_retry_after)
+        self._blocks: Dict[str, Dict[str, Any]] = {pc.get("serverName"): pc for pc in plexConfs}
+        self._clients: Dict[Tuple[str, str], PlexClient] = {}
+        self._connect_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def block(self, serverName: str) -> Optional[Dict[str, Any]]:
+        return self._blocks.get(serverName)
+
+    def client(self, baseUrl: str, token: str) -> PlexClient:
+        key = (baseUrl, token)
+        with self._lock:
+            existing = self._clients.get(key)
+            if existing is not None:
+                return existing
+            connect_lock = self._connect_locks.setdefault(key, threading.Lock())
+        with connect_lock:
+            with self._lock:
+                existing = self._clients.get(key)
+            if existing is not None:
+                return existing
+            server = PlexServer(baseUrl, token, session=self.session, timeout=self.timeout)
+            created = PlexClient(server, self.timeout)
+            with self._lock:
+                self._clients[key] = created
+            return created
+
+    def close(self) -> None:
+        with self._lock:
+            count = len(self._clients)
+            self._clients.clear()
+        self.session.close()
+        logging.info("Plex registry closed (%d client(s)).", count)
+
+
+# ----------------- run-scoped registry -----------------
+_registry: Optional[PlexRegistry] = None
+
+
+def open_registry(plexConfs: List[Dict[str, Any]], timeout: float = DEFAULT_TIMEOUT,
+                  poolSize: int = 10) -> PlexRegistry:
+    global _registry
+    close_registry()
+    _registry = PlexRegistry(plexConfs, timeout=timeout, poolSize=poolSize)
+    return _registry
+
+
+def close_registry() -> None:
+    global _registry
+    if _registry is not None:
+        _registry.close()
+    _registry = None
+
+
+def active_registry() -> Optional[PlexRegistry]:
+    return _registry
+
+
+def server(baseUrl: str, token: str, timeout: Optional[float] = None) -> PlexServer:
+    """The run's PlexServer for (baseUrl, token); a one-off connection outside a run."""
+    if _registry is None:
+        return PlexServer(baseUrl, token, timeout=timeout)
+    return _registry.client(baseUrl, token).server
+
+
+def account(baseUrl: str, token: str, timeout: Optional[float] = None) -> MyPlexAccount:
+    """The run's MyPlexAccount for the server's owner; a one-off connection outside a run."""
+    if _registry is None:
+        return PlexServer(baseUrl, token, timeout=timeout).myPlexAccount()
+    return _registry.client(baseUrl, token).account()
+
+
+def block_for(serverName: str) -> Optional[Dict[str, Any]]:
+    """The PLEX- block for serverName from the run's registry, or None outside a run."""
+    if _registry is None:
+        return None
+    return _registry.block(serverName)
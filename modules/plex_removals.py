@@ -0,0 +1,166 @@
+# modules/plex_removals.py
+from __future__ import annotations
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from plexapi.exceptions import NotFound
+
+from modules import plex_registry, plex_roster
+from modules.user_index import UserIndex
+from modules.util_retry import parse_retry_after, retry_after, retry_sync, status_of
+
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_RATE = 2.0    # removals per second, sustained
+DEFAULT_BURST = 5     # removals allowed back-to-back
+DEFAULT_RETRIES = 4
+
+
+class TokenBucket:
+    """Thread-safe token bucket; pause() stalls every worker after a 429."""
+    def __init__(self, rate: float, burst: int):
+        self.rate = max(float(rate), 0.01)
+        self.capacity = max(1, int(burst))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+
+
+@dataclass
+class Removal:
+    """One share to revoke: the friend `email` on Plex server `serverName`."""
+    serverName: str
+    email: str
+    baseUrl: str
+    token: str
+    userIndex: Optional[UserIndex] = None  # carried through for the caller's DB/notification follow-up
+
+
+@dataclass
+class RemovalResult:
+    removal: Removal
+    outcome: str = "pending"   # removed | not_found | dry_run | failed
+    attempts: int = 0
+    error: Optional[str] = None
+    seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        """The share is gone (or would be, in a dry run)."""
+        return self.outcome in ("removed", "not_found", "dry_run")
+
+
+def _plex_retry_after(exc: BaseException) -> Optional[float]:
+    requested = retry_after(exc)
+    if requested is None and status_of(exc) == 429:
+        requested = parse_retry_after(plex_registry.last_retry_after())
+    return requested
+
+
+def _remove_one(r: Removal, bucket: TokenBucket, retries: int) -> RemovalResult:
+    result = RemovalResult(removal=r)
+    start = time.monotonic()
+
+    def attempt() -> Any:
+        bucket.acquire()
+        result.attempts += 1
+        account = plex_registry.account(r.baseUrl, r.token)
+        # Resolve the friend from the run's roster; passing the email makes plexapi re-download the list
+        roster = plex_roster.cached_roster(r.token)
+        friend = roster.find(r.email) if roster is not None else None
+        return account.removeFriend(user=friend if friend is not None else r.email)
+
+    def on_retry(exc: BaseException, attempt_no: int, delay: float) -> None:
+        if status_of(exc) == 429:
+            bucket.pause(delay)
+        logging.warning("Plex removal of '%s' on '%s' got %s; retry %d in %.1fs.",
+                        r.email, r.serverName, status_of(exc), attempt_no, delay)
+
+    try:
+        removed = retry_sync(attempt, retries=retries, base_delay=1.0,
+                             retry_after_of=_plex_retry_after, on_retry=on_retry)
+        result.outcome = "removed" if removed else "not_found"
+    except NotFound:
+        result.outcome = "not_found"
+    except Exception as e:  # noqa: BLE001
+        result.outcome = "failed"
+        result.error = str(e) or e.__class__.__name__
+    result.seconds = time.monotonic() - start
+    return result
+
+
+def remove_all(removals: List[Removal], dryrun: bool = False, maxWorkers: int = DEFAULT_MAX_WORKERS,
+               rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST,
+               retries: int = DEFAULT_RETRIES) -> List[RemovalResult]:
+    """
+    Revoke every share in `removals` with bounded concurrency under one token bucket.
+    429s back off (honoring Retry-After) and pause the whole bucket; other transient
+    statuses retry with exponential backoff. Results come back in input order.
+    """
+    if not removals:
+        return []
+    if dryrun:
+        for r in removals:
+            logging.info("[DRY-RUN] Would remove Plex user '%s' from '%s'", r.email, r.serverName)
+        return [RemovalResult(removal=r, outcome="dry_run") for r in removals]
+
+    bucket = TokenBucket(rate, burst)
+    workers = max(1, min(int(maxWorkers), len(removals)))
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="plex-remove") as executor:
+        results = list(executor.map(lambda r: _remove_one(r, bucket, retries), removals))
+
+    for res in results:
+        r = res.removal
+        if res.outcome == "removed":
+            logging.info("User '%s' has been successfully removed from Plex server '%s'", r.email, r.serverName)
+        elif res.outcome == "not_found":
+            logging.warning("Friendship with '%s' not found and thus not removed.", r.email)
+        else:
+            logging.error("Failed to remove '%s' from Plex '%s' after %d attempt(s): %s",
+                          r.email, r.serverName, res.attempts, res.error)
+    logging.info("Plex removals: %d request(s) in %.1fs with %d worker(s).",
+                 len(results), time.monotonic() - start, workers)
+    return results
+
+
+def settings_from(plexSettings: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """remove_all() keyword arguments from the optional `plex` section of config.yml."""
+    s = plexSettings or {}
+    return {
+        "maxWorkers": s.get("maxWorkers", DEFAULT_MAX_WORKERS),
+        "rate": s.get("removalRate", DEFAULT_RATE),
+        "burst": s.get("removalBurst", DEFAULT_BURST),
+        "retries": s.get("removalRetries", DEFAULT_RETRIES),
+    }
+
+
+def format_results(results: List[RemovalResult]) -> str:
+    """Plain-text per-user table for the run log."""
+    rows = [("SERVER", "EMAIL", "OUTCOME", "ATTEMPTS", "ERROR")]
+    for res in results:
+        rows.append((res.removal.serverName, res.removal.email, res.outcome,
+                     str(res.attempts), (res.error or "")[:80]))
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return "\n".join("  ".join(col.ljust(w) for col, w in zip(row, widths)).rstrip() for row in rows)
@@ -0,0 +1,93 @@
+# modules/plex_roster.py
+from __future__ import annotations
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from modules import plex_registry
+
+
+class AccountRoster:
+    """
+    One plex.tv friends list, partitioned by the server each share belongs to.
+    entries(serverName) -> [(user, serverInfo), ...] for shares on that server.
+    find(email) -> the friend object, so removals don't re-download the list to resolve it.
+    """
+    def __init__(self, users: List[Any]):
+        self.users = list(users)
+        self._by_server: Dict[str, List[Tuple[Any, Any]]] = {}
+        self._by_email: Optional[Dict[str, Any]] = None
+        for user in self.users:
+            for serverInfo in getattr(user, "servers", None) or []:
+                self._by_server.setdefault(serverInfo.name, []).append((user, serverInfo))
+
+    def find(self, email: str) -> Optional[Any]:
+        """The friend whose email matches (case-insensitive), or None."""
+        if self._by_email is None:
+            self._by_email = {(u.email or "").strip().lower(): u for u in self.users if getattr(u, "email", None)}
+        return self._by_email.get((email or "").strip().lower())
+
+    def entries(self, serverName: str) -> List[Tuple[Any, Any]]:
+        return self._by_server.get(serverName, [])
+
+    def servers(self) -> List[str]:
+        return list(self._by_server)
+
+    def __len__(self) -> int:
+        return len(self.users)
+
+
+def fetch_roster(baseUrl: str, token: str, timeout: Optional[float] = None) -> AccountRoster:
+    users = plex_registry.account(baseUrl, token, timeout=timeout).users()
+    return AccountRoster(users)
+
+
+# ----------------- run-scoped cache -----------------
+# Keyed by account token: every PLEX- block owned by the same account shares one download
+_rosters: Optional[Dict[str, AccountRoster]] = None
+_token_locks: Dict[str, threading.Lock] = {}
+_lock = threading.Lock()
+
+
+def open_run() -> None:
+    global _rosters
+    with _lock:
+        _rosters = {}
+        _token_locks.clear()
+
+
+def close_run() -> None:
+    global _rosters
+    with _lock:
+        _rosters = None
+        _token_locks.clear()
+
+
+def roster_for(baseUrl: str, token: str, timeout: Optional[float] = None) -> AccountRoster:
+    """
+    The account's roster for this run, fetched from plex.tv on first use.
+    Safe to call from worker threads: servers sharing a token wait for one download.
+    Outside a run (no open_run()) every call fetches fresh, as before.
+    """
+    with _lock:
+        rosters = _rosters
+        if rosters is None:
+            token_lock = None
+        else:
+            token_lock = _token_locks.setdefault(token, threading.Lock())
+    if token_lock is None:
+        return fetch_roster(baseUrl, token, timeout=timeout)
+
+    with token_lock:
+        roster = rosters.get(token)
+        if roster is None:
+            roster = fetch_roster(baseUrl, token, timeout=timeout)
+            rosters[token] = roster
+            logging.info("Fetched plex.tv roster: %d user(s) across %d server(s).", len(roster), len(roster.servers()))
+    return roster
+
+
+def cached_roster(token: str) -> Optional[AccountRoster]:
+    """This run's roster for `token` if it has already been fetched; never triggers a download."""
+    with _lock:
+        return _rosters.get(token) if _rosters is not None else None
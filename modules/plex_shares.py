@@ -0,0 +1,95 @@
+# modules/plex_shares.py
+from __future__ import annotations
+import logging
+import threading
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from modules import plex_registry
+
+SHARED_SERVERS_URL = "https://plex.tv/api/servers/{machineId}/shared_servers"
+
+Inventory = Dict[int, FrozenSet[str]]  # Plex user ID -> titles of the libraries shared with them
+
+
+def fetch_inventory(baseUrl: str, token: str, timeout: Optional[float] = None) -> Inventory:
+    """
+    Every friend's shared libraries on one server, from a single plex.tv request.
+    Users shared "all libraries" get every section currently on the server.
+    """
+    server = plex_registry.server(baseUrl, token, timeout=timeout)
+    account = plex_registry.account(baseUrl, token, timeout=timeout)
+    data = account.query(SHARED_SERVERS_URL.format(machineId=server.machineIdentifier))
+
+    everything: Optional[FrozenSet[str]] = None
+    inventory: Inventory = {}
+    for elem in data.iter("SharedServer"):
+        try:
+            uid = int(elem.get("userID"))
+        except (TypeError, ValueError):
+            continue
+        if elem.get("allLibraries") in ("1", "true"):
+            if everything is None:
+                everything = frozenset(s.title for s in server.library.sections())
+            inventory[uid] = everything
+            continue
+        inventory[uid] = frozenset(
+            s.get("title") for s in elem.iter("Section") if s.get("shared") in ("1", "true") and s.get("title")
+        )
+    return inventory
+
+
+def classify(shared: FrozenSet[str], standardLibraries: List[str],
+             optionalLibraries: List[str]) -> Tuple[str, List[str]]:
+    """
+    Exact 4K tier and alerts from the set of shared library titles.
+    4K means every optional library is shared; alerts name the libraries that don't fit.
+    """
+    std = set(standardLibraries)
+    opt = set(optionalLibraries)
+    fourK = 'Yes' if opt and opt <= shared else 'No'
+
+    alerts = []
+    missing = std - shared
+    if missing:
+        alerts.append("missing standard libraries: " + ", ".join(sorted(missing)))
+    partial = opt & shared
+    if partial and fourK == 'No':
+        alerts.append("only part of the 4K libraries: " + ", ".join(sorted(partial)))
+    extra = shared - std - opt
+    if extra:
+        alerts.append("unconfigured libraries shared: " + ", ".join(sorted(extra)))
+    return fourK, alerts
+
+
+# ----------------- run-scoped cache -----------------
+# One shared_servers request per server per run, whoever asks first
+_inventories: Optional[Dict[Tuple[str, str], Inventory]] = None
+_lock = threading.Lock()
+
+
+def open_run() -> None:
+    global _inventories
+    with _lock:
+        _inventories = {}
+
+
+def close_run() -> None:
+    global _inventories
+    with _lock:
+        _inventories = None
+
+
+def inventory_for(baseUrl: str, token: str, serverName: str = "", timeout: Optional[float] = None) -> Inventory:
+    """The server's share inventory for this run; fetched fresh outside a run."""
+    key = (baseUrl, token)
+    with _lock:
+        cached = _inventories.get(key) if _inventories is not None else None
+    if cached is not None:
+        return cached
+
+    inventory = fetch_inventory(baseUrl, token, timeout=timeout)
+    with _lock:
+        if _inventories is not None:
+            _inventories[key] = inventory
+    logging.info("Fetched shared-library inventory for '%s': %d friend(s).", serverName or baseUrl, len(inventory))
+    return inventory
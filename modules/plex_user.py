@@ -0,0 +1,60 @@
+# modules/plex_user.py
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Optional, Tuple
+
+from modules.normalize import normalize_email, normalize_server_key
+
+
+@dataclass(frozen=True, slots=True)
+class PlexUser:
+    """
+    One Plex share (friend x server), normalized once when it leaves plexapi.
+    - email is stripped + lowercased; "" for local/managed accounts
+    - hashable, so it can key sets/dicts directly
+    """
+    userId: Optional[int]
+    username: str
+    email: str
+    server: str
+    numLibraries: int = 0
+    allLibraries: bool = False
+    fourK: str = "No"  # 'Yes' | 'No'
+    libraries: FrozenSet[str] = frozenset()  # shared library titles, when the share inventory is known
+
+    @classmethod
+    def from_plex(cls, user: Any, server: str, serverInfo: Any = None, fourK: str = "No",
+                  libraries: FrozenSet[str] = frozenset()) -> "PlexUser":
+        """Build from a plexapi MyPlexUser (+ its MyPlexServerShare for `server`, when known)."""
+        return cls(
+            userId=getattr(user, "id", None),
+            username=getattr(user, "title", None) or getattr(user, "username", None) or "",
+            email=normalize_email(getattr(user, "email", None)) or "",
+            server=server,
+            numLibraries=int(getattr(serverInfo, "numLibraries", 0) or 0),
+            allLibraries=bool(getattr(serverInfo, "allLibraries", False)),
+            fourK=fourK,
+            libraries=libraries,
+        )
+
+    @property
+    def actionable(self) -> bool:
+        """Shared users must have an email; local/managed accounts never do."""
+        return bool(self.email)
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        """(server, email) in the same canonical form UserIndex uses for DB rows."""
+        return normalize_server_key(self.server), self.email
+
+    def as_dict(self) -> Dict[str, Any]:
+        """The legacy listPlexUsers() row, for callers that still want a dict."""
+        return {
+            "User ID": self.userId,
+            "Username": self.username,
+            "Email": self.email,
+            "Server": self.server,
+            "Number of Libraries": self.numLibraries,
+            "All Libraries Shared": self.allLibraries,
+            "4K Libraries": self.fourK,
+        }
@@ -0,0 +1,128 @@
+# modules/roster_snapshot.py
+from __future__ import annotations
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from modules.plex_user import PlexUser
+
+SNAPSHOT_VERSION = 1
+
+
+@dataclass
+class RosterDiff:
+    """How a server's Plex roster moved since the last recorded run."""
+    added: List[PlexUser] = field(default_factory=list)    # listPlexUsers() users not seen before
+    removed: List[PlexUser] = field(default_factory=list)  # snapshot entries no longer shared
+    changed: List[PlexUser] = field(default_factory=list)  # users whose email or library count moved
+    unchanged: int = 0
+    roster: Dict[str, List[Any]] = field(default_factory=dict)  # snapshot entry of every user walked
+
+    def emails(self) -> Set[str]:
+        """Every email on the current roster."""
+        return {email for email, _ in self.roster.values()}
+
+    def audit_targets(self) -> List[PlexUser]:
+        """Users that need a fresh DB check: everyone new or changed."""
+        return self.added + self.changed
+
+    def describe(self) -> str:
+        return f"+{len(self.added)} added, -{len(self.removed)} removed, {len(self.changed)} changed, {self.unchanged} unchanged"
+
+
+def _key(user: PlexUser) -> str:
+    # Plex user IDs are stable across email changes; fall back to the email for odd rows
+    return str(user.userId) if user.userId is not None else "email:" + user.email
+
+
+def _entry(user: PlexUser) -> List[Any]:
+    return [user.email, user.numLibraries]
+
+
+class RosterSnapshot:
+    """
+    Compact on-disk copy of each server's last audited roster:
+      {"version": 1, "servers": {name: {"users": {userId: [email, numLibraries]}, "fullAuditAt": iso}}}
+    """
+    def __init__(self, path: Path, data: Optional[Dict[str, Any]] = None):
+        self.path = Path(path)
+        self._servers: Dict[str, Dict[str, Any]] = (data or {}).get("servers", {})
+
+    @classmethod
+    def load(cls, path: Any) -> "RosterSnapshot":
+        path = Path(path)
+        try:
+            if path.exists():
+                data = json.loads(path.read_text(encoding="utf-8"))
+                if data.get("version") == SNAPSHOT_VERSION:
+                    return cls(path, data)
+                logging.info("Ignoring roster snapshot %s with unknown version %s.", path, data.get("version"))
+        except Exception as e:  # noqa: BLE001
+            logging.warning("Unreadable roster snapshot %s (%s); starting fresh.", path, e)
+        return cls(path)
+
+    def has(self, serverName: str) -> bool:
+        return serverName in self._servers
+
+    def diff(self, serverName: str, users: Iterable[PlexUser]) -> RosterDiff:
+        """
+        Walk `users` once (a stream is fine): only added and changed users are kept as PlexUser
+        records; everyone else is reduced to their compact snapshot entry in `roster`.
+        """
+        previous: Dict[str, List[Any]] = self._servers.get(serverName, {}).get("users", {})
+        result = RosterDiff()
+        seen = result.roster
+        for u in users:
+            key = _key(u)
+            seen[key] = _entry(u)
+            before = previous.get(key)
+            if before is None:
+                result.added.append(u)
+            elif list(before) != _entry(u):
+                result.changed.append(u)
+            else:
+                result.unchanged += 1
+        for key, (email, numLibraries) in previous.items():
+            if key not in seen:
+                result.removed.append(PlexUser(userId=int(key) if key.isdigit() else None, username="",
+                                               email=email, server=serverName, numLibraries=numLibraries or 0))
+        return result
+
+    def record(self, serverName: str, users: Iterable[PlexUser], fullAudit: bool = False) -> None:
+        """Replace the server's roster with `users` (users that passed this run's audit)."""
+        self._store(serverName, {_key(u): _entry(u) for u in users}, fullAudit)
+
+    def record_diff(self, serverName: str, diff: RosterDiff, failed: Set[str], fullAudit: bool = False) -> None:
+        """Replace the server's roster with the diffed roster minus the emails in `failed`."""
+        self._store(serverName, {key: entry for key, entry in diff.roster.items() if entry[0] not in failed}, fullAudit)
+
+    def _store(self, serverName: str, entries: Dict[str, List[Any]], fullAudit: bool) -> None:
+        server = self._servers.setdefault(serverName, {})
+        server["users"] = entries
+        if fullAudit:
+            server["fullAuditAt"] = datetime.now().isoformat(timespec="seconds")
+
+    def full_audit_due(self, serverName: str, everyDays: int) -> bool:
+        """True when the server has no snapshot yet or its last full audit is older than `everyDays`."""
+        stamp = self._servers.get(serverName, {}).get("fullAuditAt")
+        if not stamp:
+            return True
+        try:
+            return datetime.now() - datetime.fromisoformat(stamp) >= timedelta(days=everyDays)
+        except ValueError:
+            return True
+
+    def save(self) -> None:
+        # Write-then-rename so a crash never leaves a half-written snapshot behind
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp.write_text(json.dumps({"version": SNAPSHOT_VERSION, "servers": self._servers},
+                                      separators=(",", ":")), encoding="utf-8")
+            os.replace(tmp, self.path)
+        except Exception as e:  # noqa: BLE001
+            logging.error("Failed to write roster snapshot %s: %s", self.path, e)
@@ -49,3 +49,23 @@ class SnapshotLog:
 
     def non_actionable(self) -> List[UserEvent]:
         return [e for e in self.events if e.skipped_reason]
+
+
+# ----------------- run-scoped log -----------------
+_active: Optional[SnapshotLog] = None
+
+
+def open_run() -> SnapshotLog:
+    global _active
+    _active = SnapshotLog()
+    return _active
+
+
+def close_run() -> None:
+    global _active
+    _active = None
+
+
+def active_log() -> Optional[SnapshotLog]:
+    """This run's SnapshotLog, or None outside a run."""
+    return _active
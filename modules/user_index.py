@@ -0,0 +1,76 @@
+# modules/user_index.py
+from __future__ import annotations
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from modules import dbFunctions
+from modules.normalize import normalize_email, normalize_server_key
+
+Key = Tuple[str, str]
+
+
+def _key(server: Optional[str], email: Optional[str]) -> Key:
+    return (normalize_server_key(server), normalize_email(email) or "")
+
+
+class UserIndex:
+    """
+    In-memory view of the users table keyed by (server, primaryEmail).
+    Loaded with a single query so checks resolve recipients/pricing without per-field round trips.
+    """
+    def __init__(self, rows: List[Dict[str, Any]]):
+        self._all = list(rows)
+        self._rows: Dict[Key, Dict[str, Any]] = {}
+        for r in self._all:
+            k = _key(r.get("server"), r.get("primaryEmail"))
+            # Duplicate (server, email) rows: an Active row wins the lookup slot
+            if k not in self._rows or (r.get("status") == "Active" and self._rows[k].get("status") != "Active"):
+                self._rows[k] = r
+
+    @classmethod
+    def load(cls, dbConf: Dict[str, Any], serverName: str = "*") -> "UserIndex":
+        return cls(dbFunctions.getUserSnapshot(
+            user=dbConf.get("user"), password=dbConf.get("password"), host=dbConf.get("host"),
+            database=dbConf.get("database"), serverName=serverName,
+        ))
+
+    def get(self, server: Optional[str], email: Optional[str]) -> Optional[Dict[str, Any]]:
+        return self._rows.get(_key(server, email))
+
+    def __contains__(self, key: Key) -> bool:
+        return _key(*key) in self._rows
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def rows(self, status: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        for r in self._all:
+            if status is None or r.get("status") == status:
+                yield r
+
+
+def email_recipients(row: Optional[Dict[str, Any]]) -> list[str]:
+    """Addresses selected by the row's notifyEmail setting (Primary/Secondary/Both)."""
+    if not row:
+        return []
+    notify = row.get("notifyEmail")
+    if notify == "Primary":
+        return [row.get("primaryEmail")]
+    if notify == "Secondary":
+        return [row.get("secondaryEmail")]
+    if notify == "Both":
+        return [e for e in (row.get("primaryEmail"), row.get("secondaryEmail")) if e]
+    return []
+
+
+def discord_recipients(row: Optional[Dict[str, Any]]) -> list[str]:
+    """Discord IDs selected by the row's notifyDiscord setting (Primary/Secondary/Both)."""
+    if not row:
+        return []
+    notify = row.get("notifyDiscord")
+    if notify == "Primary":
+        return [row.get("primaryDiscordId")]
+    if notify == "Secondary":
+        return [row.get("secondaryDiscordId")]
+    if notify == "Both":
+        return [d for d in (row.get("primaryDiscordId"), row.get("secondaryDiscordId")) if d]
+    return []
@@ -2,6 +2,7 @@ from __future__ import annotations
 import logging
 from typing import Dict, Any, List
 
+from .plex_user import PlexUser
 from .user_filters import filter_users
 from .utils import lower_or_empty
 
@@ -26,18 +27,13 @@ def get_active_users_from_db(db, logger: logging.Logger) -> List[Dict[str, Any]]
         return []
 
 
-def get_shared_users_from_plex(plex_clients: Dict[str, Any], logger: logging.Logger) -> List[Dict[str, Any]]:
-    out: List[Dict[str, Any]] = []
+def get_shared_users_from_plex(plex_clients: Dict[str, Any], logger: logging.Logger) -> List[PlexUser]:
+    out: List[PlexUser] = []
     for server_name, client in plex_clients.items():
         try:
             for u in client.myPlexAccount().users():
-                out.append({
-                    "email": getattr(u, "email", None),
-                    "username": getattr(u, "username", None) or getattr(u, "title", None),
-                    "Server": server_name,     # keep capital S to match your existing dicts
-                    "Username": getattr(u, "username", None) or getattr(u, "title", None),
-                    "Email": getattr(u, "email", None),
-                })
+                share = next((s for s in getattr(u, "servers", None) or [] if s.name == server_name), None)
+                out.append(PlexUser.from_plex(u, server_name, share))
         except Exception as e:  # noqa: BLE001
             logger.error("Failed to enumerate users for %s: %s", server_name, e)
     return out
@@ -61,19 +57,17 @@ def build_user_index(db, plex_clients: Dict[str, Any], logger: logging.Logger) -
         d["email"] = email
         by_email[email] = d
 
-    for r in plex_users:
-        email = lower_or_empty(r.get("email") or r.get("Email"))
-        if not email:
+    for p in plex_users:
+        if not p.actionable:
             continue
-        d = by_email.setdefault(email, {"email": email})
+        d = by_email.setdefault(p.email, {"email": p.email})
         # keep a username reference if present
-        if (r.get("username") or r.get("Username")) and not d.get("username"):
-            d["username"] = r.get("username") or r.get("Username")
+        if p.username and not d.get("username"):
+            d["username"] = p.username
         # track servers
         servers = set(d.get("servers", []))
-        server_name = r.get("server") or r.get("Server")
-        if server_name:
-            servers.add(server_name)
+        if p.server:
+            servers.add(p.server)
         d["servers"] = sorted(servers)
 
     merged = list(by_email.values())
@@ -1,23 +1,93 @@
 # modules/util_retry.py
 from __future__ import annotations
 import asyncio
-from typing import Callable, Awaitable, Set
+import re
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Awaitable, Optional, Set
 
 TRANSIENT_STATUSES: Set[int] = {408, 429, 500, 502, 503, 504}
+MAX_RETRY_AFTER = 300.0  # never sleep longer than this on a server's say-so
+
+_STATUS_PREFIX = re.compile(r"^\((\d{3})\)")  # plexapi errors read "(429) too_many_requests; ..."
+
+
+def status_of(exc: BaseException) -> Optional[int]:
+    """HTTP status carried by an exception: `.status`, `.response.status_code`, or a plexapi "(NNN)" message."""
+    status = getattr(exc, "status", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    if status is None:
+        m = _STATUS_PREFIX.match(str(exc))
+        if m:
+            status = int(m.group(1))
+    return status
+
+
+def parse_retry_after(value: Any) -> Optional[float]:
+    """Seconds from a Retry-After value (delta-seconds or HTTP-date)."""
+    if value is None or value == "":
+        return None
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        try:
+            seconds = parsedate_to_datetime(str(value)).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Server-requested delay carried by an exception (`.retry_after` or a Retry-After response header)."""
+    value = getattr(exc, "retry_after", None)
+    if value is None:
+        headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+        value = headers.get("Retry-After")
+    return parse_retry_after(value)
+
+
+def _delay(exc: BaseException, attempt: int, base_delay: float,
+           retry_after_of: Callable[[BaseException], Optional[float]]) -> float:
+    backoff = base_delay * (2 ** attempt)
+    requested = retry_after_of(exc)
+    return max(backoff, requested) if requested is not None else backoff
+
 
 async def with_retries(coro_factory: Callable[[], Awaitable], *, retries: int = 3, base_delay: float = 0.5):
     """
     Minimal async retry wrapper for transient HTTP-ish failures.
-    Expects exceptions with optional 'status' attribute.
+    Expects exceptions with optional 'status' attribute; honors Retry-After when present.
     """
     attempt = 0
     while True:
         try:
             return await coro_factory()
         except Exception as e:
-            status = getattr(e, "status", None)
-            if status in TRANSIENT_STATUSES and attempt < retries:
-                await asyncio.sleep(base_delay * (2 ** attempt))
+            if status_of(e) in TRANSIENT_STATUSES and attempt < retries:
+                await asyncio.sleep(_delay(e, attempt, base_delay, retry_after))
+                attempt += 1
+                continue
+            raise
+
+
+def retry_sync(fn: Callable[[], Any], *, retries: int = 3, base_delay: float = 0.5,
+               retry_after_of: Callable[[BaseException], Optional[float]] = retry_after,
+               on_retry: Optional[Callable[[BaseException, int, float], None]] = None) -> Any:
+    """
+    Blocking counterpart of with_retries for thread-pool work (plexapi is synchronous).
+    on_retry(exc, attempt, delay) is called before each sleep.
+    """
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except Exception as e:
+            if status_of(e) in TRANSIENT_STATUSES and attempt < retries:
+                delay = _delay(e, attempt, base_delay, retry_after_of)
+                if on_retry is not None:
+                    on_retry(e, attempt + 1, delay)
+                time.sleep(delay)
                 attempt += 1
                 continue
             raise
@@ -1,9 +1,13 @@
 #validateFunctions.py
 import sys
+import time
 import logging
 import socket
+import sqlite3
 import mysql.connector
-from plexapi.server import PlexServer
+from mysql.connector import errorcode
+from dataclasses import dataclass, field
+from modules import plex_registry
 import re
 
 
@@ -66,6 +70,154 @@ def validateDBTable(user, password, server, database, table):
         return False
 
 
+# Columns the checks read; generated/indexed columns are added by the migration runner
+REQUIRED_USER_COLUMNS = (
+    'primaryEmail', 'secondaryEmail', 'primaryDiscord', 'primaryDiscordId', 'secondaryDiscord',
+    'secondaryDiscordId', 'notifyDiscord', 'notifyEmail', 'status', 'server', '4k', 'endDate',
+)
+
+_UNREACHABLE_ERRORS = {errorcode.CR_CONN_HOST_ERROR, errorcode.CR_UNKNOWN_HOST, errorcode.CR_CONNECTION_ERROR}
+_AUTH_ERRORS = {errorcode.ER_ACCESS_DENIED_ERROR, errorcode.ER_DBACCESS_DENIED_ERROR}
+
+
+@dataclass
+class PreflightResult:
+    ok: bool
+    connection: object = None          # open connection on success; hand it to the run's pool
+    failedStep: str = ""               # reachability | auth | connect | database | table | columns
+    error: str = ""
+    timings: dict = field(default_factory=dict)  # step -> milliseconds
+
+
+def preflightDatabase(host, port, user, password, database, table='users', columns=REQUIRED_USER_COLUMNS):
+    """
+    Validate the database over ONE connection: reachability + auth + database (connect),
+    then table and required columns from information_schema. Per-step latency is logged.
+    The database is a connect argument, not a USE, so the connection keeps it as its default
+    when the pool later reconnects it (ping(reconnect=True)).
+    """
+    result = PreflightResult(ok=False)
+
+    def _step(name, started):
+        result.timings[name] = round((time.monotonic() - started) * 1000, 1)
+
+    started = time.monotonic()
+    try:
+        cnx = mysql.connector.connect(host=host, port=int(port), user=user, password=password,
+                                      database=database, connection_timeout=10)
+    except mysql.connector.Error as err:
+        _step('connect', started)
+        if err.errno == errorcode.ER_BAD_DB_ERROR:
+            result.failedStep = 'database'
+        elif err.errno in _AUTH_ERRORS:
+            result.failedStep = 'auth'
+        elif err.errno in _UNREACHABLE_ERRORS:
+            result.failedStep = 'reachability'
+        else:
+            result.failedStep = 'connect'
+        result.error = str(err)
+        return result
+    _step('connect', started)
+
+    try:
+        cursor = cnx.cursor()
+        try:
+            started = time.monotonic()
+            cursor.execute(
+                "SELECT COLUMN_NAME FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s",
+                (database, table),
+            )
+            present = {row[0] for row in cursor.fetchall()}
+            _step('schema', started)
+        finally:
+            cursor.close()
+
+        if not present:
+            result.failedStep = 'table'
+            result.error = f"Table {table} does not exist in database {database}."
+            return result
+
+        missing = [c for c in columns if c not in present]
+        if missing:
+            result.failedStep = 'columns'
+            result.error = f"Table {table} is missing column(s): {', '.join(missing)}"
+            return result
+
+        result.ok = True
+        result.connection = cnx
+        return result
+
+    except mysql.connector.Error as err:
+        result.failedStep = result.failedStep or 'database'
+        result.error = str(err)
+        return result
+
+    finally:
+        if not result.ok:
+            try:
+                cnx.close()
+            except Exception:
+                pass
+        logging.info("DB preflight %s: %s", "ok" if result.ok else f"failed at {result.failedStep}",
+                     ", ".join(f"{k}={v}ms" for k, v in result.timings.items()))
+
+
+def preflightSQLite(backend, table='users', columns=REQUIRED_USER_COLUMNS):
+    """
+    SQLite counterpart of preflightDatabase: open the file (connect), create the base
+    table if this is a fresh install (database), then check the required columns (schema).
+    """
+    result = PreflightResult(ok=False)
+
+    started = time.monotonic()
+    try:
+        cnx = backend.connect()
+    except sqlite3.Error as err:
+        result.failedStep = 'reachability'
+        result.error = str(err)
+        return result
+    result.timings['connect'] = round((time.monotonic() - started) * 1000, 1)
+
+    try:
+        cursor = cnx.cursor()
+        try:
+            started = time.monotonic()
+            backend.bootstrap(cursor)
+            cnx.commit()
+            result.timings['database'] = round((time.monotonic() - started) * 1000, 1)
+
+            started = time.monotonic()
+            present = backend.table_columns(cursor, table)
+            result.timings['schema'] = round((time.monotonic() - started) * 1000, 1)
+        finally:
+            cursor.close()
+
+        missing = [c for c in columns if c not in present]
+        if missing:
+            result.failedStep = 'columns'
+            result.error = f"Table {table} is missing column(s): {', '.join(missing)}"
+            return result
+
+        result.ok = True
+        result.connection = cnx
+        return result
+
+    except sqlite3.Error as err:
+        result.failedStep = result.failedStep or 'database'
+        result.error = str(err)
+        return result
+
+    finally:
+        if not result.ok:
+            try:
+                cnx.close()
+            except Exception:
+                pass
+        logging.info("DB preflight (%s) %s: %s", backend.describe(),
+                     "ok" if result.ok else f"failed at {result.failedStep}",
+                     ", ".join(f"{k}={v}ms" for k, v in result.timings.items()))
+
+
 def getValidatedInput(prompt, pattern):
     userInput = input(prompt)
     if userInput != '':
@@ -83,7 +235,7 @@ def validateInput(inputString, pattern):
 
 def validatePlex(baseUrl, token):
     try:
-        plex = PlexServer(baseUrl, token)
+        plex = plex_registry.server(baseUrl, token)
         if plex:
             # Logged into plex
             return True
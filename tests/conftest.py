@@ -0,0 +1,6 @@
+# tests/conftest.py
+import os
+import sys
+
+# Run from anywhere: make the repo root (harassarr.py, modules/) importable
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
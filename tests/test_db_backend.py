@@ -0,0 +1,114 @@
+from datetime import date
+
+import pytest
+
+from modules import db_backend, db_migrations, db_pool, dbFunctions
+
+
+def _write_config(tmp_path, body):
+    path = tmp_path / "config.yml"
+    path.write_text(body, encoding="utf-8")
+    return str(path)
+
+
+def _migrated(path, rows=()):
+    backend = db_backend.SQLiteBackend(str(path))
+    cnx = backend.connect()
+    db_migrations.apply_pending(cnx, backend)
+    cursor = cnx.cursor()
+    cursor.executemany("INSERT INTO users (primaryEmail, server, status) VALUES (%s, %s, %s)", rows)
+    cnx.commit()
+    cursor.close()
+    return backend, cnx
+
+
+def test_sqlite_cursor_translates_mysql_placeholders(tmp_path):
+    backend, cnx = _migrated(tmp_path / "h.db", [("a@x.com", "plex1", "Active")])
+    cursor = cnx.cursor(dictionary=True)
+    cursor.execute("SELECT primaryEmail, joinDate FROM users WHERE server = %s AND status = %s", ("plex1", "Active"))
+    row = cursor.fetchone()
+    assert row["primaryEmail"] == "a@x.com"
+    assert isinstance(row["joinDate"], date)  # DATE columns come back like mysql-connector returns them
+    cnx.close()
+
+
+def test_sqlite_migrations_are_idempotent(tmp_path):
+    backend, cnx = _migrated(tmp_path / "h.db", [(" A@X.com ", "Plex1", "Active")])
+    assert db_migrations.apply_pending(cnx, backend) == db_migrations.LATEST_VERSION
+
+    cursor = cnx.cursor()
+    assert {"primaryEmailNorm", "serverNorm"} <= backend.table_columns(cursor, "users")
+    assert backend.index_exists(cursor, "users", "idx_users_server_email")
+    cursor.execute("SELECT primaryEmailNorm, serverNorm FROM users")
+    assert cursor.fetchone() == ("a@x.com", "plex1")
+    cnx.close()
+
+
+def test_update_user_statuses_groups_per_server_and_status(tmp_path, monkeypatch):
+    db = tmp_path / "h.db"
+    _, cnx = _migrated(db, [("a@x.com", "plex1", "Active"), ("b@x.com", "plex1", "Active"),
+                            ("c@x.com", "plex1", "Inactive"), ("d@x.com", "plex2", "Active")])
+    cnx.close()
+    config = _write_config(tmp_path, f"database:\n  engine: sqlite\n  path: {db}\n")
+
+    statements = []
+    execute = db_backend._SQLiteCursor.execute
+    monkeypatch.setattr(db_backend._SQLiteCursor, "execute",
+                        lambda self, query, params=(): statements.append(query) or execute(self, query, params))
+
+    affected = dbFunctions.updateUserStatuses(config, [
+        ("plex1", "A@x.com", "Inactive"),
+        ("PLEX1 ", "b@x.com", "Inactive"),
+        ("plex1", "c@x.com", "Inactive"),  # already Inactive
+        ("plex2", "d@x.com", "Inactive"),
+        ("plex1", "nobody@x.com", "Active"),
+    ])
+
+    assert affected == {("plex1", "A@x.com"): 1, ("PLEX1 ", "b@x.com"): 1, ("plex1", "c@x.com"): 0,
+                        ("plex2", "d@x.com"): 1, ("plex1", "nobody@x.com"): 0}
+    # One SELECT + one UPDATE per (server, status) group: plex1/Inactive, plex2/Inactive, plex1/Active
+    assert sum(q.startswith("SELECT") for q in statements) == 3
+    assert sum(q.startswith("UPDATE") for q in statements) == 3
+
+    _, cnx = _migrated(db)
+    cursor = cnx.cursor()
+    cursor.execute("SELECT primaryEmail FROM users WHERE status = %s ORDER BY primaryEmail", ("Active",))
+    assert cursor.fetchall() == []
+    cnx.close()
+
+
+def test_update_user_statuses_rejects_unknown_status(tmp_path):
+    with pytest.raises(ValueError):
+        dbFunctions.updateUserStatuses(str(tmp_path / "unused.yml"), [("plex1", "a@x.com", "Paused")])
+
+
+def test_legacy_backend_outside_a_run_uses_the_configured_engine(tmp_path, monkeypatch):
+    db = tmp_path / "harassarr.db"
+    monkeypatch.setattr(dbFunctions, "CONFIG_FILE",
+                        _write_config(tmp_path, f"database:\n  engine: sqlite\n  path: {db}\n"))
+    assert db_pool.active_backend() is None
+
+    backend = dbFunctions._legacyBackend("localhost", "harassarr", "secret", "harassarr")
+
+    assert isinstance(backend, db_backend.SQLiteBackend)
+    assert backend.path == str(db)
+
+
+def test_legacy_backend_keeps_explicit_mysql_target(tmp_path, monkeypatch):
+    monkeypatch.setattr(dbFunctions, "CONFIG_FILE", _write_config(
+        tmp_path, "database:\n  host: db1\n  user: harassarr\n  password: x\n  database: harassarr\n"))
+
+    backend = dbFunctions._legacyBackend("db2", "other", "secret", "elsewhere")
+
+    assert isinstance(backend, db_backend.MySQLBackend)
+    assert backend.matches("db2", "other", "elsewhere")
+
+
+def test_iter_users_raises_instead_of_looking_empty(tmp_path, monkeypatch):
+    # A database without the users table: the read fails, which must not pass for "no users"
+    monkeypatch.setattr(dbFunctions, "CONFIG_FILE",
+                        _write_config(tmp_path, f"database:\n  engine: sqlite\n  path: {tmp_path / 'empty.db'}\n"))
+
+    with pytest.raises(db_backend.DB_ERRORS):
+        list(dbFunctions.iterUsers("localhost", "harassarr", "secret", "harassarr", status="Active"))
+    assert dbFunctions.getUsersByStatus("localhost", "harassarr", "secret", "harassarr", "Active", "*") == []
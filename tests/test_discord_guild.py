@@ -0,0 +1,105 @@
+# tests/test_discord_guild.py
+import asyncio
+import logging
+from types import SimpleNamespace
+
+import pytest
+
+from modules import discord_guild
+from modules.discord_client import DiscordDMClient
+
+
+class FakeGuild:
+    id = 1
+
+    def __init__(self, members):
+        self._members = members
+        self.pages = 0
+
+    async def fetch_roles(self):
+        return [SimpleNamespace(name="Plex  Users", id=42), SimpleNamespace(name="Other", id=7)]
+
+    def fetch_members(self, limit=None):
+        async def gen():
+            self.pages += 1
+            for m in self._members:
+                yield m
+        return gen()
+
+
+class FakeClient:
+    def __init__(self, guild):
+        self.guild = guild
+        self.guild_fetches = 0
+
+    async def fetch_guild(self, guild_id):
+        self.guild_fetches += 1
+        return self.guild
+
+
+class FakeSession:
+    token = "T"
+
+    def __init__(self, client):
+        self.client = client
+
+    def submit(self, runner, timeout=None):
+        return asyncio.run(runner(self.client))
+
+
+def _member(mid, *roles):
+    return SimpleNamespace(id=mid, roles=[SimpleNamespace(id=r) for r in roles])
+
+
+@pytest.fixture
+def run():
+    discord_guild.open_run()
+    yield
+    discord_guild.close_run()
+
+
+def test_session_client_can_page_members():
+    # discord.py raises ClientException from Guild.fetch_members unless this flag is set
+    assert DiscordDMClient("token", logging.getLogger(__name__)).client.intents.members
+
+
+def test_role_map_is_built_once_per_run(run, monkeypatch, caplog):
+    guild = FakeGuild([_member(1, 42), _member(2, 7), _member(3)])
+    client = FakeClient(guild)
+    monkeypatch.setattr(discord_guild.discord_session, "active_session", lambda token=None: FakeSession(client))
+
+    with caplog.at_level(logging.INFO):
+        role_map = discord_guild.role_map_for("T", 1)
+    assert role_map is not None
+    assert "loaded roles for 3 member(s)" in caplog.text
+    assert role_map.ids_with_role("plex users", ["1", "2", "3"]) == {"1"}
+    assert role_map.ids_with_role(7, ["1", "2", "3"]) == {"2"}
+    assert role_map.member("2").id == 2
+
+    assert discord_guild.role_map_for("T", 1) is role_map
+    assert guild.pages == 1 and client.guild_fetches == 1
+
+
+def test_forbidden_falls_back_and_is_cached(run, monkeypatch):
+    import discord
+
+    class Forbidding(FakeClient):
+        async def fetch_guild(self, guild_id):
+            self.guild_fetches += 1
+            raise discord.Forbidden(SimpleNamespace(status=403, reason="Forbidden"), "Missing Access")
+
+    client = Forbidding(None)
+    monkeypatch.setattr(discord_guild.discord_session, "active_session", lambda token=None: FakeSession(client))
+    assert discord_guild.role_map_for("T", 1) is None
+    assert discord_guild.role_map_for("T", 1) is None
+    assert client.guild_fetches == 1
+
+
+def test_other_errors_are_raised(run, monkeypatch):
+    class Broken(FakeClient):
+        async def fetch_guild(self, guild_id):
+            raise RuntimeError("boom")
+
+    monkeypatch.setattr(discord_guild.discord_session, "active_session", lambda token=None: FakeSession(Broken(None)))
+    with pytest.raises(RuntimeError):
+        discord_guild.role_map_for("T", 1)
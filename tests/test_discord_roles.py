@@ -0,0 +1,71 @@
+# tests/test_discord_roles.py
+import asyncio
+from types import SimpleNamespace
+
+import discord
+import pytest
+
+from modules import discord_guild, discord_roles
+from modules.discord_roles import RoleRevocation
+
+
+class FakeMember:
+    def __init__(self, mid, log):
+        self.id = mid
+        self._log = log
+
+    async def remove_roles(self, *roles, reason=None):
+        self._log.append(("remove", self.id, roles[0].id))
+
+
+class FakeGuild:
+    id = 1
+
+    def __init__(self, log):
+        self._log = log
+
+    async def fetch_roles(self):
+        return [SimpleNamespace(name="Plex", id=42)]
+
+    async def fetch_member(self, mid):
+        self._log.append(("fetch_member", mid))
+        if mid == 9:
+            raise discord.NotFound(SimpleNamespace(status=404, reason="Not Found"), "Unknown Member")
+        return FakeMember(mid, self._log)
+
+
+class FakeClient:
+    def __init__(self, log):
+        self._guild = FakeGuild(log)
+
+    async def fetch_guild(self, guild_id):
+        return self._guild
+
+
+@pytest.fixture(autouse=True)
+def run():
+    discord_guild.open_run()
+    yield
+    discord_guild.close_run()
+
+
+def test_audited_members_are_not_fetched_again():
+    log = []
+    audited = {"1": FakeMember(1, log), "2": FakeMember(2, log)}
+    revocations = [RoleRevocation("1", "plex", "A"), RoleRevocation("2", 42, "B"),
+                   RoleRevocation("3", "PLEX", "B"), RoleRevocation("9", "plex", "B"),
+                   RoleRevocation("4", "missing")]
+
+    results = asyncio.run(discord_roles.revoke_all(FakeClient(log), 1, revocations, members=audited))
+
+    assert [r.outcome for r in results] == ["removed", "removed", "removed", "not_member", "role_missing"]
+    assert [e for e in log if e[0] == "fetch_member"] == [("fetch_member", 3), ("fetch_member", 9)]
+    assert ("remove", 1, 42) in log and ("remove", 2, 42) in log and ("remove", 3, 42) in log
+    assert results[0].ok and results[3].ok and not results[4].ok
+
+
+def test_format_results_lists_every_member():
+    res = [discord_roles.RevokeResult(RoleRevocation("1", "plex", "A"), "removed", attempts=1)]
+    table = discord_roles.format_results(res).splitlines()
+    assert table[0].split() == ["SERVER", "MEMBER", "ROLE", "OUTCOME", "ATTEMPTS", "ERROR"]
+    assert table[1].split() == ["A", "1", "plex", "removed", "1"]
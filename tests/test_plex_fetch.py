@@ -0,0 +1,8 @@
+# tests/test_plex_fetch.py
+from modules import plex_fetch
+
+
+def test_server_budget_covers_every_request():
+    assert plex_fetch.server_budget(30) == 30 * plex_fetch.REQUESTS_PER_SERVER
+    assert plex_fetch.server_budget(30, serverBudget=90) == 90
+
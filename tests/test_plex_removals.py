@@ -0,0 +1,40 @@
+from modules import plex_removals
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(round(seconds, 3))
+        self.now += seconds
+
+
+def _bucket(monkeypatch, rate, burst):
+    clock = _Clock()
+    monkeypatch.setattr(plex_removals.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(plex_removals.time, "sleep", clock.sleep)
+    return plex_removals.TokenBucket(rate, burst), clock
+
+
+def test_token_bucket_allows_a_burst_then_paces_at_rate(monkeypatch):
+    bucket, clock = _bucket(monkeypatch, rate=2, burst=3)
+    for _ in range(3):
+        bucket.acquire()
+    assert clock.sleeps == []
+
+    bucket.acquire()
+    bucket.acquire()
+    assert clock.sleeps == [0.5, 0.5]
+
+
+def test_token_bucket_pause_stalls_and_drains(monkeypatch):
+    bucket, clock = _bucket(monkeypatch, rate=10, burst=5)
+    bucket.pause(4)
+    bucket.acquire()
+    assert clock.sleeps == [4.0]  # waits out the pause; tokens refilled meanwhile
+    assert clock.now == 104.0
@@ -0,0 +1,73 @@
+# tests/test_preflight.py
+import mysql.connector
+import pytest
+from mysql.connector import errorcode
+
+from modules import validateFunctions
+
+
+class FakeCursor:
+    def __init__(self, columns):
+        self._columns = columns
+
+    def execute(self, query, params=None):
+        pass
+
+    def fetchall(self):
+        return [(c,) for c in self._columns]
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, columns):
+        self._columns = columns
+        self.closed = False
+
+    def cursor(self):
+        return FakeCursor(self._columns)
+
+    def close(self):
+        self.closed = True
+
+
+def _preflight():
+    return validateFunctions.preflightDatabase("db", 3306, "u", "p", "media", "users")
+
+
+def test_database_is_a_connect_argument(monkeypatch):
+    seen = {}
+
+    def connect(**kwargs):
+        seen.update(kwargs)
+        return FakeConnection(validateFunctions.REQUIRED_USER_COLUMNS)
+
+    monkeypatch.setattr(mysql.connector, "connect", connect)
+    result = _preflight()
+    assert result.ok and result.connection is not None
+    # ping(reconnect=True) reuses the connect kwargs; the default database must be among them
+    assert seen["database"] == "media"
+
+
+@pytest.mark.parametrize("errno, step", [
+    (errorcode.ER_BAD_DB_ERROR, "database"),
+    (errorcode.ER_ACCESS_DENIED_ERROR, "auth"),
+    (errorcode.CR_CONN_HOST_ERROR, "reachability"),
+    (errorcode.ER_TOO_MANY_USER_CONNECTIONS, "connect"),
+])
+def test_connect_errors_are_classified(monkeypatch, errno, step):
+    def connect(**kwargs):
+        raise mysql.connector.Error(msg="nope", errno=errno)
+
+    monkeypatch.setattr(mysql.connector, "connect", connect)
+    result = _preflight()
+    assert not result.ok and result.failedStep == step
+
+
+def test_missing_columns_are_reported(monkeypatch):
+    cnx = FakeConnection(["primaryEmail"])
+    monkeypatch.setattr(mysql.connector, "connect", lambda **kwargs: cnx)
+    result = _preflight()
+    assert result.failedStep == "columns" and "status" in result.error
+    assert cnx.closed
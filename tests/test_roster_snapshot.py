@@ -0,0 +1,67 @@
+from modules.plex_user import PlexUser
+from modules.roster_snapshot import RosterSnapshot
+
+
+def _user(userId, email, numLibraries=2, server="PLEX-1"):
+    return PlexUser(userId=userId, username=email.split("@")[0], email=email, server=server,
+                    numLibraries=numLibraries)
+
+
+def test_diff_walks_a_stream_once_and_records_the_passed_roster(tmp_path):
+    snapshot = RosterSnapshot(tmp_path / "roster.json")
+    snapshot.record("PLEX-1", [_user(1, "a@x.com"), _user(2, "b@x.com")])
+
+    walked = []
+
+    def stream():
+        for u in (_user(1, "a@x.com"), _user(2, "b@x.com", numLibraries=5), _user(3, "c@x.com")):
+            walked.append(u.userId)
+            yield u
+
+    diff = snapshot.diff("PLEX-1", stream())
+    assert walked == [1, 2, 3]
+    assert diff.emails() == {"a@x.com", "b@x.com", "c@x.com"}
+
+    snapshot.record_diff("PLEX-1", diff, failed={"c@x.com"})
+    again = snapshot.diff("PLEX-1", [_user(1, "a@x.com"), _user(2, "b@x.com", numLibraries=5), _user(3, "c@x.com")])
+    assert [u.userId for u in again.added] == [3]  # the failed user is checked again next run
+    assert again.unchanged == 2
+
+
+def test_diff_sorts_users_into_added_removed_changed():
+    snapshot = RosterSnapshot("unused.json")
+    snapshot.record("PLEX-1", [_user(1, "a@x.com"), _user(2, "b@x.com"), _user(3, "c@x.com")])
+
+    diff = snapshot.diff("PLEX-1", [_user(1, "a@x.com"), _user(2, "new-b@x.com"), _user(4, "d@x.com")])
+
+    assert [u.email for u in diff.added] == ["d@x.com"]
+    assert [u.email for u in diff.changed] == ["new-b@x.com"]
+    assert [(u.userId, u.email) for u in diff.removed] == [(3, "c@x.com")]
+    assert diff.unchanged == 1
+    assert [u.userId for u in diff.audit_targets()] == [4, 2]
+    assert diff.describe() == "+1 added, -1 removed, 1 changed, 1 unchanged"
+
+
+def test_unknown_server_diffs_as_all_added_and_needs_a_full_audit():
+    snapshot = RosterSnapshot("unused.json")
+    diff = snapshot.diff("PLEX-2", [_user(1, "a@x.com", server="PLEX-2")])
+    assert len(diff.added) == 1 and not diff.removed
+    assert snapshot.full_audit_due("PLEX-2", everyDays=7)
+
+
+def test_snapshot_round_trips_through_disk(tmp_path):
+    path = tmp_path / "state" / "roster.json"
+    snapshot = RosterSnapshot(path)
+    snapshot.record("PLEX-1", [_user(1, "a@x.com"), _user(None, "local@x.com")], fullAudit=True)
+    snapshot.save()
+
+    loaded = RosterSnapshot.load(path)
+    assert not loaded.full_audit_due("PLEX-1", everyDays=7)
+    diff = loaded.diff("PLEX-1", [_user(1, "a@x.com"), _user(None, "local@x.com")])
+    assert diff.unchanged == 2 and not diff.added and not diff.changed
+
+
+def test_unreadable_snapshot_starts_fresh(tmp_path):
+    path = tmp_path / "roster.json"
+    path.write_text("{not json", encoding="utf-8")
+    assert not RosterSnapshot.load(path).has("PLEX-1")
@@ -0,0 +1,86 @@
+import asyncio
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from modules import util_retry
+
+
+class _HTTPError(Exception):
+    def __init__(self, message="", status=None, response=None, retry_after=None):
+        super().__init__(message)
+        if status is not None:
+            self.status = status
+        if response is not None:
+            self.response = response
+        if retry_after is not None:
+            self.retry_after = retry_after
+
+
+@pytest.mark.parametrize("exc, expected", [
+    (_HTTPError(status=429), 429),
+    (_HTTPError(response=SimpleNamespace(status_code=503)), 503),
+    (_HTTPError("(429) too_many_requests; https://plex.tv/api"), 429),
+    (_HTTPError("connection reset"), None),
+])
+def test_status_of(exc, expected):
+    assert util_retry.status_of(exc) == expected
+
+
+def test_parse_retry_after_seconds_and_bounds():
+    assert util_retry.parse_retry_after("7") == 7.0
+    assert util_retry.parse_retry_after(2.5) == 2.5
+    assert util_retry.parse_retry_after("-3") == 0.0
+    assert util_retry.parse_retry_after("99999") == util_retry.MAX_RETRY_AFTER
+    assert util_retry.parse_retry_after(None) is None
+    assert util_retry.parse_retry_after("") is None
+    assert util_retry.parse_retry_after("soon") is None
+
+
+def test_parse_retry_after_http_date():
+    when = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=60), usegmt=True)
+    assert 55 <= util_retry.parse_retry_after(when) <= 60
+
+
+def test_retry_after_reads_attribute_then_header():
+    assert util_retry.retry_after(_HTTPError(retry_after=1.5)) == 1.5
+    assert util_retry.retry_after(_HTTPError(response=SimpleNamespace(headers={"Retry-After": "4"}))) == 4.0
+    assert util_retry.retry_after(_HTTPError()) is None
+
+
+def test_retry_sync_honors_retry_after_and_stops_on_permanent_errors(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(util_retry.time, "sleep", sleeps.append)
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise _HTTPError(status=429, retry_after=3)
+        if len(calls) == 2:
+            raise _HTTPError(status=502)
+        return "ok"
+
+    assert util_retry.retry_sync(flaky, base_delay=0.5) == "ok"
+    assert sleeps == [3.0, 1.0]  # server's Retry-After beats the 0.5s backoff; then plain 2x backoff
+
+    with pytest.raises(_HTTPError):
+        util_retry.retry_sync(lambda: (_ for _ in ()).throw(_HTTPError(status=404)))
+    assert len(sleeps) == 2
+
+
+def test_with_retries_gives_up_after_the_budget(monkeypatch):
+    async def no_sleep(_):
+        pass
+    monkeypatch.setattr(util_retry.asyncio, "sleep", no_sleep)
+    calls = []
+
+    async def always_503():
+        calls.append(1)
+        raise _HTTPError(status=503)
+
+    with pytest.raises(_HTTPError):
+        asyncio.run(util_retry.with_retries(always_503, retries=2))
+    assert len(calls) == 3